@@ -1,11 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_from_directory, has_request_context, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from pyrebase.pyrebase import Database, Auth
 from functions import *
+from media import MEDIA_ROOT, MEDIA_CACHE_SECONDS, submit_session_media
+from ratelimit import admission_control, admission_stats, install as install_admission
+from courses import get_course_index, register_course
+from shards import ShardRouter, DATABASE_URLS, install as install_fence
+from user_search import index_updates, search_users
+from notifications import get_notifications, mark_notifications_read
+from export import export_user_sessions
+from live import (
+    start_live_round, update_live_hole, finish_live_round, discard_live_round, get_live_round,
+    is_league_member, get_live_board, league_board_stream, round_stream, LiveStreamsFull, LIVE_STREAM_RETRY_SECONDS,
+    RoundNotFound, RoundBusy,
+)
+from deadlines import (
+    DeadlineSession, UpstreamUnavailable, install as install_deadlines,
+    upstream, server_error, current_deadline, breaker_stats, ROUTE_BUDGETS,
+)
+from profiling import (
+    ADMIN_UIDS, PROFILE_SECONDS, PROFILE_INTERVAL_SECONDS, SLOW_REQUEST_MS,
+    install as install_profiling, profiler, slow_requests,
+)
 from typing import Dict, Any, Tuple
 from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
 import os
 import pyrebase
+import threading
+import time
 import requests
 from dotenv import load_dotenv
 
@@ -31,16 +57,27 @@ client = OpenAI(
     api_key = OPENAI_API_KEY
 )
 
-firebase = None
-db = None
+firebase_apps = None
+_thread_db = threading.local()
 
 def get_db():
-    """Lazy initialization of Firebase database"""
-    global firebase, db
-    if db is None:
-        firebase = pyrebase.initialize_app(config)
-        db = firebase.database()
-    return db
+    """
+    Lazy initialization of Firebase database.
+
+    Returns a ShardRouter over every configured database (DATABASE_URLS, or
+    just DATABASE_URL). Each thread gets its own handles (sharing one
+    connection pool per database) because pyrebase builds paths/queries on
+    the handle itself.
+    """
+    global firebase_apps
+    if firebase_apps is None:
+        firebase_apps = [pyrebase.initialize_app({**config, "databaseURL": url}) for url in DATABASE_URLS]
+        for firebase_app, url in zip(firebase_apps, DATABASE_URLS):
+            # Database calls get deadline-capped timeouts and their shard's firebase_db breaker
+            firebase_app.requests = DeadlineSession(url)
+    if getattr(_thread_db, "db", None) is None:
+        _thread_db.db = ShardRouter([firebase_app.database() for firebase_app in firebase_apps])
+    return _thread_db.db
 
 # Helper functions for Firebase REST API authentication
 def firebase_sign_up(email: str, password: str):
@@ -51,7 +88,7 @@ def firebase_sign_up(email: str, password: str):
         "password": password,
         "returnSecureToken": True
     }
-    response = requests.post(url, json=payload, timeout=10)
+    response = upstream("firebase_auth", lambda timeout: requests.post(url, json=payload, timeout=timeout), 10, server_error)
     return response.json()
 
 def firebase_sign_in(email: str, password: str):
@@ -62,22 +99,115 @@ def firebase_sign_in(email: str, password: str):
         "password": password,
         "returnSecureToken": True
     }
-    response = requests.post(url, json=payload, timeout=10)
+    response = upstream("firebase_auth", lambda timeout: requests.post(url, json=payload, timeout=timeout), 10, server_error)
     return response.json()
 
 def firebase_get_account_info(id_token: str):
     """Get account info using Firebase REST API"""
+    # /batch verifies the token once and hands the result to its sub-requests
+    verified = request.environ.get("parlor.verified_account") if has_request_context() else None
+    if verified and verified[0] == id_token:
+        return verified[1]
+
     url = f"{FIREBASE_AUTH_BASE}:lookup?key={FIREBASE_API_KEY}"
     payload = {
         "idToken": id_token
     }
-    response = requests.post(url, json=payload, timeout=10)
+    response = upstream("firebase_auth", lambda timeout: requests.post(url, json=payload, timeout=timeout), 10, server_error)
     return response.json()
 
 app = Flask(__name__)
 CORS(app)
+install_deadlines(app)
+install_admission(firebase_get_account_info)
+install_profiling(app)
+install_fence(app, get_db)
 
     
+MAX_BATCH_REQUESTS = 10
+BATCH_METHODS = {"GET", "POST", "PATCH", "PUT", "DELETE"}
+_batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("BATCH_WORKERS", "6")), thread_name_prefix="batch")
+
+# Routes without a deadline stream their responses; in a batch they would hold a pool thread until done
+STREAMING_ENDPOINTS = {endpoint for endpoint, seconds in ROUTE_BUDGETS.items() if seconds is None}
+
+def _batch_endpoint(path: str, method: str) -> str | None:
+    try:
+        endpoint, _ = app.url_map.bind("localhost").match(path.split("?")[0], method)
+    except HTTPException:  # Unknown paths get their 404/405 from the dispatch
+        return None
+    return endpoint
+
+def _dispatch_sub_request(item: Dict[str, Any], auth_header: str, verified: Tuple[str, Any], remote_addr: str,
+                          deadline: float | None) -> Dict[str, Any]:
+    """Run one /batch item through the normal Flask routing (within the batch's deadline) and return its status and body."""
+    body = item.get("body")
+    with app.test_request_context(
+        item["path"],
+        method=item["method"],
+        query_string=item.get("query") or {},
+        json=body if body is not None else None,
+        headers={"Authorization": auth_header},
+        environ_base={"parlor.verified_account": verified, "parlor.deadline": deadline, "REMOTE_ADDR": remote_addr},
+    ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            return {"status": 500, "body": {"error": str(e)}}
+
+    result = {"status": response.status_code}
+    result["body"] = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+    if "Retry-After" in response.headers:
+        result["headers"] = {"Retry-After": response.headers["Retry-After"]}
+    return result
+
+@app.route("/batch", methods=["POST"])
+def batch_route():
+    """
+    Run several API calls in one round trip.
+
+    Body: {"requests": [{"method", "path", "query", "body"}, ...]}. The token
+    is verified once, sub-requests run concurrently through the regular
+    routes (rate limits included), and each gets its own status in
+    {"responses": [...]} in request order.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    items = (request.json or {}).get("requests")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Missing requests"}), 400
+    if len(items) > MAX_BATCH_REQUESTS:
+        return jsonify({"error": f"At most {MAX_BATCH_REQUESTS} requests per batch"}), 400
+
+    for item in items:
+        if not isinstance(item, dict):
+            return jsonify({"error": "Each request must be an object"}), 400
+        item["method"] = str(item.get("method", "GET")).upper()
+        path = item.get("path")
+        if item["method"] not in BATCH_METHODS or not isinstance(path, str) or not path.startswith("/"):
+            return jsonify({"error": "Each request needs a method and a path starting with /"}), 400
+        if path.split("?")[0].rstrip("/") == "/batch":
+            return jsonify({"error": "Batches cannot be nested"}), 400
+        if _batch_endpoint(path, item["method"]) in STREAMING_ENDPOINTS:
+            return jsonify({"error": f"{path} streams its response and can't be batched"}), 400
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        user_info["users"][0]["localId"]
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    verified = (id_token, user_info)
+    futures = [
+        _batch_executor.submit(_dispatch_sub_request, item, auth_header, verified, request.remote_addr, current_deadline())
+        for item in items
+    ]
+    return jsonify({"responses": [future.result() for future in futures]}), 200
+
+
 @app.route("/me/final-score", methods=["GET"])
 def get_my_final_score():
     """
@@ -99,19 +229,164 @@ def get_my_final_score():
         return jsonify({"error": str(e)}), 400
 
     try:
-        final_score = update_user_final_score(db, uid)
+        final_score = update_user_final_score(get_db(), uid)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
     return jsonify({"final_score": final_score}), 200
     
 
+LEADERBOARD_FRESH_SECONDS = 30  # Serve the cached leaderboard without recomputing for this long
+LEADERBOARD_STALE_SECONDS = 3600  # How old a cached leaderboard may be when served as a fallback
+_leaderboard_cache: Dict[str | None, Tuple[float, Any]] = {}
+
 @app.route("/leaderboard", methods=["GET"])
+@admission_control("leaderboard")
 def leaderboard():
+    """
+    Average scores per player. Served from a short-lived cache; if the
+    database can't answer within the request budget, the last computed
+    leaderboard is served with X-Parlor-Stale set to its age in seconds.
+    """
     course = request.args.get("course")
-    data = get_leaderboard(get_db(), course)
+    cached = _leaderboard_cache.get(course)
+    if cached and time.monotonic() - cached[0] < LEADERBOARD_FRESH_SECONDS:
+        return jsonify(cached[1])
+
+    try:
+        data = get_leaderboard(get_db(), course)
+    except UpstreamUnavailable:
+        if not cached or time.monotonic() - cached[0] > LEADERBOARD_STALE_SECONDS:
+            raise
+        response = jsonify(cached[1])
+        response.headers["X-Parlor-Stale"] = str(int(time.monotonic() - cached[0]))
+        return response
+
+    _leaderboard_cache[course] = (time.monotonic(), data)
     return jsonify(data)
 
+@app.route("/courses/search", methods=["GET"])
+def search_courses_route():
+    """Autocomplete course names against the in-memory course registry"""
+    query = request.args.get("q", "")
+    limit = min(request.args.get("limit", type=int, default=10), 50)
+    try:
+        return jsonify({"courses": get_course_index(get_db()).search(query, limit)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/courses/nearby", methods=["GET"])
+def nearby_courses_route():
+    """Courses within radius_km (default 25) of lat/lon, closest first"""
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    radius_km = min(request.args.get("radius_km", type=float, default=25.0), 200.0)
+    limit = min(request.args.get("limit", type=int, default=20), 100)
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "Missing or invalid lat/lon"}), 400
+    try:
+        return jsonify({"courses": get_course_index(get_db()).nearby(lat, lon, radius_km, limit)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/courses", methods=["POST"])
+def register_course_route():
+    """Add a course to the registry (or set its location if it has none; admins can replace it)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    data = request.json or {}
+    name = data.get("name")
+    if not name:
+        return jsonify({"error": "Missing course name"}), 400
+
+    try:
+        uid = firebase_get_account_info(id_token)["users"][0]["localId"]
+        course_id = register_course(get_db(), name, data.get("lat"), data.get("lon"), replace_location=uid in ADMIN_UIDS)
+        if not course_id:
+            return jsonify({"error": "Invalid course name"}), 400
+        return jsonify({"message": "Course registered", "courseId": course_id}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/metrics/admission", methods=["GET"])
+def admission_metrics_route():
+    """Rejected and queued request counters for the rate-limited routes"""
+    return jsonify(admission_stats()), 200
+
+@app.route("/metrics/upstreams", methods=["GET"])
+def upstream_metrics_route():
+    """Circuit breaker state for each upstream in this worker"""
+    return jsonify(breaker_stats()), 200
+
+@app.route("/admin/profile", methods=["POST"])
+def start_profile_route():
+    """Start this worker's sampling profiler for a window (admins only)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        uid = firebase_get_account_info(id_token)["users"][0]["localId"]
+        if uid not in ADMIN_UIDS:
+            return jsonify({"error": "Admins only"}), 403
+
+        data = request.get_json(silent=True) or {}
+        seconds = float(data.get("seconds", PROFILE_SECONDS))
+        interval = float(data.get("interval", PROFILE_INTERVAL_SECONDS))
+        if not profiler.start(seconds, interval):
+            return jsonify({"error": "A profile is already running", **profiler.status()}), 409
+        return jsonify({"message": "Profiling started", **profiler.status()}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/admin/profile", methods=["GET"])
+def get_profile_route():
+    """This worker's last profile as collapsed stacks (text/plain), or its status while one is running"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        uid = firebase_get_account_info(id_token)["users"][0]["localId"]
+        if uid not in ADMIN_UIDS:
+            return jsonify({"error": "Admins only"}), 403
+
+        status = profiler.status()
+        if status["running"]:
+            return jsonify(status), 202
+        if profiler.last_profile is None:
+            return jsonify({"error": "No profile has been taken in this worker", **status}), 404
+        return Response(profiler.last_profile, mimetype="text/plain", headers={"X-Parlor-Pid": str(status["pid"])})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/admin/slow_requests", methods=["GET"])
+def slow_requests_route():
+    """Recent requests slower than SLOW_REQUEST_MS in this worker, with their upstream calls (admins only)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        uid = firebase_get_account_info(id_token)["users"][0]["localId"]
+        if uid not in ADMIN_UIDS:
+            return jsonify({"error": "Admins only"}), 403
+
+        limit = min(request.args.get("limit", default=20, type=int), 100)
+        return jsonify({
+            "pid": os.getpid(),
+            "threshold_ms": SLOW_REQUEST_MS,
+            "traces": slow_requests(limit),
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 @app.route("/sign_up", methods=["POST"])
 def sign_up():
     data = request.json
@@ -135,7 +410,10 @@ def sign_up():
             return jsonify({"error": error_msg}), 400
 
         uid = result['localId']
-        get_db().child("users").child(uid).set({"name": name, "email": email})
+        get_db().update({
+            f"users/{uid}": {"name": name, "email": email},
+            **index_updates(uid, name, email),
+        })
         print(f"Sign up successful - UID: {uid}, Email: {email}")
         return jsonify({"message": "User created", "user": {"uid": uid, "email": email, "name": name}}), 200
     except Exception as e:
@@ -298,23 +576,37 @@ def get_friends_route():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+FALLBACK_CHALLENGES = {
+    1: "Putting Ladder (about 1 hour over two days)\n\nChallenge: From 3, 6 and 9 feet, hole 5 putts in a row from each distance before moving back.\n\nTips: Pick a spot a few inches in front of the ball and roll it over that spot; keep your head still until the ball is gone.",
+    2: "Up and Down Drill (about 2 hours over two days)\n\nChallenge: Drop 10 balls around a practice green and get up and down (chip plus one putt) on at least 4.\n\nTips: Land the ball on the green as early as possible and let it release; use less loft when you have green to work with.",
+    3: "Fairway Finder (one round plus a range session)\n\nChallenge: Hit at least 8 fairways in a round, using a club you trust off the tee on every tight hole.\n\nTips: Aim at the widest part of the fairway, not the flag side, and commit to one shot shape for the whole round.",
+    4: "Scoring Zone (two practice sessions)\n\nChallenge: From 50, 75 and 100 yards, hit 10 balls each and finish inside 15 feet on at least 6 from every distance.\n\nTips: Control distance with backswing length rather than effort, and keep the same tempo for every shot.",
+    5: "Par or Better (one competitive round)\n\nChallenge: Play 18 holes without a double bogey and make at least 3 birdies, keeping score of greens in regulation and putts.\n\nTips: Play to the fat side of every green, take your medicine from trouble, and be aggressive only with wedges in hand.",
+}
+
 @app.route("/challenge/<int:difficulty>", methods=["GET"])
+@admission_control("challenge")
 def get_challenges_route(difficulty):
     if difficulty < 1 or difficulty > 5:
         return jsonify({"error": "Difficulty must be between 1 and 5"}), 400
     
     try:
-        resp = client.responses.create(
+        resp = upstream("openai", lambda timeout: client.responses.create(
             model="gpt-4o",
             instructions="You are a golf expert who loves to output golf challenges based on the level of difficulty specified by the input. this should be able to be completed in one to two days. well formatted with time estimated to complete, tips, and basic challenge. based on a. skill level from 1-5 where 1 is beginner and 5 is expert",
-            input=str(difficulty)
-        )
+            input=str(difficulty),
+            timeout=timeout,
+        ), 20)
         return jsonify({"difficulty": difficulty, "challenge": resp.output_text}), 200
+    except UpstreamUnavailable:
+        # Canned challenge rather than an error while OpenAI is slow or down
+        return jsonify({"difficulty": difficulty, "challenge": FALLBACK_CHALLENGES[difficulty], "degraded": True}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 # Golf Session Routes
 @app.route("/sessions", methods=["POST"])
+@admission_control("create_session")
 def create_session_route():
     """Create a new golf session"""
     auth_header = request.headers.get("Authorization")
@@ -334,6 +626,7 @@ def create_session_route():
             return jsonify({"error": "Missing required session data"}), 400
 
         session_id = create_session(get_db(), uid, session_data)
+        submit_session_media(get_db(), session_id, session_data.get("images", []), session_data.get("videos", []))
         return jsonify({
             "message": "Session created successfully",
             "sessionId": session_id
@@ -343,6 +636,96 @@ def create_session_route():
         return jsonify({"error": str(e)}), 400
 
 
+MAX_IMPORT_ROWS = 5000
+IMPORT_SYNC_LIMIT = 100  # Larger imports run in the background and report progress
+
+@app.route("/sessions/import", methods=["POST"])
+@admission_control("import_sessions")
+def import_sessions_route():
+    """
+    Bulk import rounds from a CSV (text/csv body or multipart "file") or a
+    JSON array. Small imports finish in the request; larger ones return 202
+    with a job id to poll at /sessions/import/<job_id>.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if "file" in request.files:
+            rows = list(csv.DictReader(io.StringIO(request.files["file"].read().decode("utf-8-sig"))))
+        elif request.mimetype == "text/csv":
+            rows = list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+        else:
+            rows = request.get_json(silent=True)
+            if isinstance(rows, dict):
+                rows = rows.get("sessions")
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"error": f"Could not parse import: {e}"}), 400
+
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"error": "Expected a CSV file or a JSON array of sessions"}), 400
+    if len(rows) > MAX_IMPORT_ROWS:
+        return jsonify({"error": f"Imports are limited to {MAX_IMPORT_ROWS} rounds"}), 400
+
+    sessions, errors = parse_import_rows(rows)
+    if not sessions:
+        return jsonify({"error": "No valid sessions to import", "errors": errors}), 400
+
+    try:
+        if len(sessions) <= IMPORT_SYNC_LIMIT:
+            session_ids = import_sessions(get_db(), uid, sessions)
+            return jsonify({
+                "message": "Sessions imported",
+                "imported": len(session_ids),
+                "sessionIds": session_ids,
+                "errors": errors,
+            }), 201
+
+        job_id = push_id()
+        get_db().child("import_jobs").child(uid).child(job_id).set({
+            "status": "running",
+            "total": len(sessions),
+            "imported": 0,
+            "errors": errors,
+            "createdAt": datetime.now().isoformat(),
+        })
+        threading.Thread(
+            target=run_import_job,
+            args=(clone_db(get_db()), uid, job_id, sessions),
+            daemon=True,
+        ).start()
+        return jsonify({"message": "Import started", "jobId": job_id, "total": len(sessions), "errors": errors}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/sessions/import/<job_id>", methods=["GET"])
+def import_status_route(job_id):
+    """Progress of a background session import"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        job = get_db().child("import_jobs").child(uid).child(job_id).get().val()
+        if not job:
+            return jsonify({"error": "Import job not found"}), 404
+        return jsonify({"job": {"id": job_id, **job}}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
 @app.route("/sessions", methods=["GET"])
 def get_sessions_route():
     """Get user's golf sessions"""
@@ -384,6 +767,34 @@ def get_sessions_route():
         return jsonify({"error": str(e)}), 400
 
 
+@app.route("/sessions/<session_id>", methods=["GET"])
+def get_session_route(session_id):
+    """Get one golf session in full (scores by hole, media, likes and comments)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        viewer_uid = user_info["users"][0]["localId"]
+
+        session = get_session(get_db(), session_id)
+        if not session:
+            return jsonify({"error": "Session not found"}), 404
+
+        privacy = session.get("privacy", "friends")
+        owner_uid = session.get("uid")
+        if owner_uid != viewer_uid and privacy != "public":
+            if privacy == "private" or not are_friends(get_db(), owner_uid, viewer_uid):
+                return jsonify({"error": "Session not found"}), 404
+
+        return jsonify({"session": with_thumbnails({"id": session_id, **session})}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
 @app.route("/sessions/<session_id>", methods=["DELETE"])
 def delete_session_route(session_id):
     """Delete a golf session"""
@@ -397,7 +808,7 @@ def delete_session_route(session_id):
         uid = user_info["users"][0]["localId"]
 
         # Verify session belongs to user
-        session = db.child("sessions").child(session_id).get().val()
+        session = get_session_summary(get_db(), session_id)
         if not session:
             return jsonify({"error": "Session not found"}), 404
 
@@ -411,6 +822,15 @@ def delete_session_route(session_id):
         return jsonify({"error": str(e)}), 400
 
 
+@app.route("/media/<path:key>", methods=["GET"])
+def media_route(key):
+    """Serve generated thumbnails/variants from the local media store (keys are unguessable, see media.py)"""
+    response = send_from_directory(MEDIA_ROOT, key, max_age=MEDIA_CACHE_SECONDS)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+
 @app.route("/feed", methods=["GET"])
 def get_feed_route():
     """Get feed of golf sessions from friends and public"""
@@ -439,6 +859,138 @@ def get_feed_route():
         return jsonify({"error": str(e)}), 400
 
 
+@app.route("/sync", methods=["GET"])
+def sync_route():
+    """
+    Changes visible to the user since ?since=<cursor>. Without a cursor, or
+    with one older than the change log keeps, responds with full_resync so
+    the app reloads its lists once and then syncs from the returned cursor.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        result = sync_changes(get_db(), uid, request.args.get("since"), id_token)
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/notifications", methods=["GET"])
+def notifications_route():
+    """A page of the user's notifications, newest first (?limit=, ?before=<updated of last item>)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        limit = max(1, min(request.args.get("limit", type=int, default=20), 50))
+        result = get_notifications(get_db(), uid, limit, request.args.get("before"))
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/notifications/read", methods=["POST"])
+def mark_notifications_read_route():
+    """Mark all of the user's notifications read"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        mark_notifications_read(get_db(), uid)
+        return jsonify({"message": "Notifications marked read"}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/users/search", methods=["GET"])
+def search_users_route():
+    """Find players by name or email prefix (?q=, at least 2 characters)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        limit = request.args.get("limit", type=int, default=20)
+        friends = set(get_friends(get_db(), uid))
+        users = search_users(get_db(), request.args.get("q", ""), friends, uid, limit)
+        return jsonify({"users": users}), 200
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/me", methods=["PATCH"])
+def update_me_route():
+    """Update the signed-in user's profile (currently just their name)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    data = request.json or {}
+    name = data.get("name")
+    if not name:
+        return jsonify({"error": "Missing name"}), 400
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        update_user_name(get_db(), uid, name)
+        return jsonify({"message": "Profile updated", "name": name.strip()}), 200
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/me/export", methods=["GET"])
+def export_me_route():
+    """
+    Stream the user's full round history (?format=ndjson|csv, ?gzip=1).
+    Rows are written as they are read, so memory stays flat however many rounds there are.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    fmt = request.args.get("format", "ndjson")
+    gzip = request.args.get("gzip") in ("1", "true")
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        # The body is produced after this returns, so give it a handle of its own
+        chunks = export_user_sessions(clone_db(get_db()), uid, fmt, gzip)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    # A gzip download is a .gz file, not a transfer encoding clients should undo
+    mimetype = "application/gzip" if gzip else "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"parlor-rounds.{fmt}" + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
 @app.route("/users/<uid>", methods=["GET"])
 def get_user_profile(uid):
     """Return basic profile info for a user along with visibility metadata."""
@@ -596,5 +1148,169 @@ def list_leagues_route():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+
+def _sse(events) -> Response:
+    return Response(events, mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/rounds", methods=["POST"])
+def start_live_round_route():
+    """Start a live round; holes are then saved one at a time with PATCH /rounds/<id>/holes/<n>"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        round_id = start_live_round(get_db(), uid, request.json or {})
+        return jsonify({"roundId": round_id}), 201
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/rounds/<round_id>/holes/<int:hole>", methods=["PATCH"])
+def update_live_hole_route(round_id, hole):
+    """Set one hole's score ({"score": n}, or null to clear it)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        data = request.json or {}
+        if "score" not in data:
+            return jsonify({"error": "Missing score"}), 400
+        score = data["score"]
+        if score is not None and (isinstance(score, bool) or not isinstance(score, int)):
+            return jsonify({"error": "Score must be a whole number"}), 400
+        return jsonify(update_live_hole(get_db(), uid, round_id, hole, score)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/rounds/<round_id>/finish", methods=["POST"])
+def finish_live_round_route(round_id):
+    """Save a live round as a golf session"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        final = request.json or {}
+        session_id = finish_live_round(get_db(), uid, round_id, final)
+        submit_session_media(get_db(), session_id, final.get("images", []), final.get("videos", []))
+        return jsonify({
+            "message": "Session created successfully",
+            "sessionId": session_id
+        }), 201
+    except RoundNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except RoundBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/rounds/<round_id>", methods=["DELETE"])
+def discard_live_round_route(round_id):
+    """Abandon a live round without saving it"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        discard_live_round(get_db(), uid, round_id)
+        return jsonify({"message": "Round discarded"}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/rounds/<round_id>", methods=["GET"])
+def get_live_round_route(round_id):
+    """Get a live round's scores and running total"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        viewer_uid = user_info["users"][0]["localId"]
+        live_round = get_live_round(get_db(), viewer_uid, round_id)
+        if not live_round:
+            return jsonify({"error": "Round not found"}), 404
+        return jsonify({"round": live_round}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/rounds/<round_id>/stream", methods=["GET"])
+def live_round_stream_route(round_id):
+    """Server-sent events: the round's scores each time a hole changes"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        viewer_uid = user_info["users"][0]["localId"]
+        if not get_live_round(get_db(), viewer_uid, round_id):
+            return jsonify({"error": "Round not found"}), 404
+        # The stream outlives this request, so give it a handle of its own
+        return _sse(round_stream(clone_db(get_db()), round_id))
+    except LiveStreamsFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(LIVE_STREAM_RETRY_SECONDS)}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/leagues/<league_id>/live", methods=["GET"])
+def live_league_board_route(league_id):
+    """The league's live leaderboard (members only)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        if not is_league_member(get_db(), uid, league_id):
+            return jsonify({"error": "League not found"}), 404
+        return Response(get_live_board(get_db(), league_id), mimetype="application/json")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/leagues/<league_id>/live/stream", methods=["GET"])
+def live_league_stream_route(league_id):
+    """Server-sent events: the league's live leaderboard each time it changes (members only)"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Missing or invalid token"}), 401
+    id_token = auth_header.split(" ")[1]
+
+    try:
+        user_info = firebase_get_account_info(id_token)
+        uid = user_info["users"][0]["localId"]
+        if not is_league_member(get_db(), uid, league_id):
+            return jsonify({"error": "League not found"}), 404
+        return _sse(league_board_stream(clone_db(get_db()), league_id))
+    except LiveStreamsFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(LIVE_STREAM_RETRY_SECONDS)}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=5001)
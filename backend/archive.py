@@ -0,0 +1,201 @@
+"""
+Cold storage for old sessions.
+
+Sessions older than ARCHIVE_AFTER_DAYS are packed into one compressed blob per
+user per month under /session_archive/<uid>/<YYYY-MM>. For v2 rounds the
+summary (which keeps like_count/comment_count) gets an "archived" marker
+naming the month and all of the details, likes and comments included, move
+to the blob. Rounds still in the legacy layout keep a slim /sessions/<id>
+stub instead (everything except ARCHIVED_FIELDS, plus the marker and the
+counts), so feeds, leaderboards and scores still work from the hot tier.
+
+Likes and comments on an archived round are written to its hot details as
+usual (an unlike of an archived like is a False entry) and the round is
+queued under /archive_requeue/<id>; the next run folds them into the blob.
+Each shard keeps the cutoff of its last run under /archive_cursor/<root>,
+so a run only reads rounds that went cold since then, plus the queue.
+Imports of rounds older than the cursor queue them too.
+
+Run periodically:  python archive.py --days 365
+Re-read the whole cold range (e.g. after a rebalance):  python archive.py --full
+"""
+from pyrebase.pyrebase import Database
+from typing import Dict, Any
+from datetime import datetime, timedelta
+from collections import defaultdict
+from shards import all_shards
+
+import argparse
+import base64
+import json
+import os
+import zlib
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+# Large, write-once round detail that moves to the archive blob (legacy layout)
+ARCHIVED_FIELDS = (
+    "scores", "selectedHoles", "images", "videos", "media", "duration", "startTime", "endTime", "likes", "comments",
+)
+# Detail maps whose entries can still be added to after a round is archived
+ENTRY_FIELDS = ("likes", "comments")
+ARCHIVE_CURSOR = "archive_cursor"
+ARCHIVE_REQUEUE = "archive_requeue"
+
+
+def encode_blob(sessions: Dict[str, Any]) -> str:
+    return base64.b64encode(zlib.compress(json.dumps(sessions, separators=(",", ":")).encode("utf-8"), 9)).decode("ascii")
+
+
+def decode_blob(blob: str | None) -> Dict[str, Any]:
+    if not blob:
+        return {}
+    return json.loads(zlib.decompress(base64.b64decode(blob)).decode("utf-8"))
+
+
+def archive_month(session: Dict[str, Any]) -> str:
+    return (session.get("timestamp") or "")[:7] or "unknown"
+
+
+def summary_stub(session: Dict[str, Any], month: str) -> Dict[str, Any]:
+    stub = {key: value for key, value in session.items() if key not in ARCHIVED_FIELDS}
+    stub["archived"] = month
+    stub["like_count"] = len(session.get("likes") or {})
+    stub["comment_count"] = len(session.get("comments") or {})
+    return stub
+
+
+def merge_archived(archived: Dict[str, Any], hot: Dict[str, Any]) -> Dict[str, Any]:
+    """An archived round's blob fields overlaid with its hot details, likes and comments merged entry by entry."""
+    merged = {**archived, **hot}
+    for key in ENTRY_FIELDS:
+        entries = {**(archived.get(key) or {}), **(hot.get(key) or {})}
+        merged[key] = {entry_id: entry for entry_id, entry in entries.items() if entry}
+    return merged
+
+
+def _entry_deletes(prefix: str, details: Dict[str, Any]) -> Dict[str, Any]:
+    """Delete exactly what was read, entry by entry, so likes and comments written meanwhile are kept."""
+    updates = {}
+    for key, value in details.items():
+        if key in ENTRY_FIELDS and isinstance(value, dict):
+            updates.update({f"{prefix}/{key}/{entry_id}": None for entry_id in value})
+        else:
+            updates[f"{prefix}/{key}"] = None
+    return updates
+
+
+def archive_cold_sessions(db: Database, max_age_days: int = ARCHIVE_AFTER_DAYS, full: bool = False) -> int:
+    """
+    Move sessions older than max_age_days into per-user, per-month archive blobs.
+
+    Each (user, month) group is written with one multi-path update so the blob
+    and the hot records it replaces change together. A user's blobs
+    live on the same shard as their sessions. Only rounds that went cold
+    since the shard's last run (and queued rounds) are read, unless full.
+    Returns the number of sessions archived.
+    """
+    return sum(_archive_shard(shard, max_age_days, full) for shard in all_shards(db))
+
+
+def _archive_shard(db: Database, max_age_days: int, full: bool) -> int:
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+    archived = _archive_summaries(db, cutoff, full) + _archive_legacy(db, cutoff, full)
+    db.child(ARCHIVE_CURSOR).update({"session_summaries": cutoff, "sessions": cutoff})
+    return archived
+
+
+def _cold(db: Database, root: str, cutoff: str, full: bool):
+    since = None if full else db.child(ARCHIVE_CURSOR).child(root).get().val()
+    query = db.child(root).order_by_child("timestamp")
+    if since and since <= cutoff:
+        query = query.start_at(since)
+    return query.end_at(cutoff).get().each() or []
+
+
+def _archive_groups(records, cutoff: str) -> Dict[tuple, Dict[str, Any]]:
+    groups = defaultdict(dict)
+    for session_id, data in records:
+        if not data or not data.get("uid") or (data.get("timestamp") or "") > cutoff:
+            continue
+        groups[(data["uid"], data.get("archived") or archive_month(data))][session_id] = data
+    return groups
+
+
+def _archive_summaries(db: Database, cutoff: str, full: bool) -> int:
+    records = {s.key(): s.val() for s in _cold(db, "session_summaries", cutoff, full) if not (s.val() or {}).get("archived")}
+    # Queued rounds: archived ones with new likes/comments, and imports older than the cursor.
+    # Cleared before their details are read, so anything written after that is queued again.
+    queued = db.child(ARCHIVE_REQUEUE).get().val() or {}
+    if queued:
+        db.update({f"{ARCHIVE_REQUEUE}/{session_id}": None for session_id in queued})
+    for session_id in queued:
+        if session_id not in records:
+            records[session_id] = db.child("session_summaries").child(session_id).get().val()
+    groups = _archive_groups(records.items(), cutoff)
+
+    archived = 0
+    for (uid, month), summaries in groups.items():
+        blob = decode_blob(db.child("session_archive").child(uid).child(month).get().val())
+        updates = {}
+        for session_id, summary in summaries.items():
+            details = db.child("session_details").child(session_id).get().val() or {}
+            if summary.get("archived"):
+                blob[session_id] = merge_archived(blob.get(session_id) or {}, details)
+            else:
+                blob[session_id] = details
+                updates[f"session_summaries/{session_id}/archived"] = month
+            updates.update(_entry_deletes(f"session_details/{session_id}", details))
+
+        updates[f"session_archive/{uid}/{month}"] = encode_blob(blob)
+        db.update(updates)
+        archived += len(summaries)
+        print(f"[ARCHIVE] {uid} {month}: archived {len(summaries)} sessions")
+
+    return archived
+
+
+def _archive_legacy(db: Database, cutoff: str, full: bool) -> int:
+    records = ((s.key(), s.val()) for s in _cold(db, "sessions", cutoff, full) if not (s.val() or {}).get("archived"))
+    groups = _archive_groups(records, cutoff)
+
+    archived = 0
+    for (uid, month), sessions in groups.items():
+        blob = decode_blob(db.child("session_archive").child(uid).child(month).get().val())
+        blob.update(sessions)
+
+        updates = {f"session_archive/{uid}/{month}": encode_blob(blob)}
+        for session_id, data in sessions.items():
+            updates[f"sessions/{session_id}"] = summary_stub(data, month)
+        db.update(updates)
+        archived += len(sessions)
+        print(f"[ARCHIVE] {uid} {month}: archived {len(sessions)} legacy sessions")
+
+    return archived
+
+
+def archived_fields(db: Database, uid: str, month: str, session_id: str) -> Dict[str, Any]:
+    """The fields of one archived session kept in its month blob."""
+    return decode_blob(db.child("session_archive").child(uid).child(month).get().val()).get(session_id) or {}
+
+
+def remove_archived_session(db: Database, uid: str, month: str, session_id: str):
+    """Drop a session from its month blob (used when an archived session is deleted)."""
+    blob_ref = lambda: db.child("session_archive").child(uid).child(month)
+    blob = decode_blob(blob_ref().get().val())
+    if blob.pop(session_id, None) is None:
+        return
+    if blob:
+        blob_ref().set(encode_blob(blob))
+    else:
+        blob_ref().remove()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive cold sessions into per-user monthly blobs.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive sessions older than this many days")
+    parser.add_argument("--full", action="store_true", help="Ignore the stored cursor and re-read the whole cold range")
+    args = parser.parse_args()
+
+    from app import get_db
+    count = archive_cold_sessions(get_db(), args.days, args.full)
+    print(f"[ARCHIVE] Archived {count} sessions older than {args.days} days")
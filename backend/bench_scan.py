@@ -0,0 +1,122 @@
+"""
+Memory benchmark for scan() against pyrebase's get() on a synthetic /sessions tree.
+
+Serves a generated /sessions JSON document from a local HTTP server and runs
+the feed query (filter + newest 20) and the leaderboard aggregate both ways,
+reporting peak traced memory and wall time.
+
+    python bench_scan.py --sessions 100000
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pyrebase.pyrebase import Database
+from scan import scan, scan_records, newest_first
+
+import argparse
+import json
+import random
+import threading
+import time
+import tracemalloc
+import requests
+
+
+def synthetic_sessions(count: int, users: int = 2000, seed: int = 7) -> bytes:
+    rng = random.Random(seed)
+    sessions = {}
+    for i in range(count):
+        uid = f"user{rng.randrange(users)}"
+        scores = [rng.randint(3, 7) for _ in range(18)]
+        sessions[f"session{i:08d}"] = {
+            "uid": uid,
+            "username": uid,
+            "courseName": f"Course {rng.randrange(500)}",
+            "holes": 18,
+            "scores": scores,
+            "totalScore": sum(scores),
+            "privacy": rng.choice(["public", "friends", "friends", "private"]),
+            "timestamp": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00",
+            "course_rating": 72.0,
+            "normalized_score": sum(scores) - 72.0,
+            "likes": {},
+            "comments": {},
+        }
+    return json.dumps(sessions).encode("utf-8")
+
+
+def serve(body: bytes) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(label: str, fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} peak {peak / 1024 / 1024:8.1f} MB   {elapsed:6.2f} s   ({len(result)} results)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak memory of scan() and get() on a synthetic dataset.")
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    body = synthetic_sessions(args.sessions)
+    server = serve(body)
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    db = Database(None, None, url, requests.Session())
+    friends = {f"user{i}" for i in range(0, 2000, 10)}
+    print(f"{args.sessions} sessions, {len(body) / 1024 / 1024:.1f} MB of JSON")
+
+    def visible(data):
+        return data.get("privacy") == "public" or (data.get("uid") in friends and data.get("privacy") != "private")
+
+    def feed_get():
+        results = []
+        for s in db.child("sessions").get().each() or []:
+            if visible(s.val()):
+                results.append({"id": s.key(), **s.val()})
+        results.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        return results[:args.limit]
+
+    def feed_scan():
+        return newest_first(scan_records(db.child("sessions"), visible), args.limit)
+
+    def leaderboard_get():
+        player_scores = {}
+        for s in db.child("sessions").get().each() or []:
+            player_scores.setdefault(s.val()["username"], []).append(s.val()["totalScore"])
+        return {name: sum(scores) / len(scores) for name, scores in player_scores.items()}
+
+    def leaderboard_scan():
+        player_scores = {}
+        for _, data in scan(db.child("sessions")):
+            totals = player_scores.setdefault(data["username"], [0, 0])
+            totals[0] += data["totalScore"]
+            totals[1] += 1
+        return {name: total / count for name, (total, count) in player_scores.items()}
+
+    measure("feed via get()", feed_get)
+    measure("feed via scan()", feed_scan)
+    measure("leaderboard via get()", leaderboard_get)
+    measure("leaderboard via scan()", leaderboard_scan)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Append-only change log behind GET /sync.
+
+Every mutation helper in functions.py appends a small entry to /changes
+naming the entity that changed and who may see it. Keys are push ids, so
+key order is time order and a key doubles as the client's sync cursor.
+Entries older than CHANGELOG_RETENTION_DAYS are compacted away; clients
+holding an older cursor are told to do a full resync.
+
+Compact periodically:  python changelog.py --compact
+"""
+from pyrebase.pyrebase import Database
+from typing import Dict, Any, List, Tuple
+from datetime import datetime, timedelta
+
+import argparse
+import os
+import secrets
+import time
+
+CHANGELOG_RETENTION_DAYS = int(os.getenv("CHANGELOG_RETENTION_DAYS", "30"))
+# Cursors trail the newest entry by this much so writes still in flight
+# (key generated, not yet stored) aren't skipped by a concurrent sync.
+SETTLE_SECONDS = 2
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+def push_id(millis: int | None = None) -> str:
+    """
+    Firebase-style time-ordered push key with a random suffix.
+
+    Used instead of pyrebase's generate_key(), which repeats after 64 keys
+    generated in the same millisecond.
+    """
+    now = int(time.time() * 1000) if millis is None else millis
+    time_chars = []
+    for _ in range(8):
+        time_chars.append(PUSH_CHARS[now % 64])
+        now //= 64
+    return "".join(reversed(time_chars)) + "".join(secrets.choice(PUSH_CHARS) for _ in range(12))
+
+
+def push_id_millis(key: str) -> int:
+    millis = 0
+    for char in key[:8]:
+        millis = millis * 64 + PUSH_CHARS.index(char)
+    return millis
+
+
+def change_entry(kind: str, entity_id: str, op: str = "upsert", **visibility) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build a (path, entry) pair for a change, for callers that fold it into a
+    multi-path update. visibility is stored as-is and read by entry_visible:
+      sessions:        owner, privacy
+      friends:         uids = [a, b]
+      friend_requests: owner (the receiver)
+      leagues:         members = {uid: True}
+    """
+    entry = {"kind": kind, "id": entity_id, "op": op, "ts": datetime.now().isoformat()}
+    entry.update({key: value for key, value in visibility.items() if value is not None})
+    return f"changes/{push_id()}", entry
+
+
+def record_change(db: Database, kind: str, entity_id: str, op: str = "upsert", **visibility):
+    path, entry = change_entry(kind, entity_id, op, **visibility)
+    try:
+        db.update({path: entry})
+    except Exception as e:
+        # A missed entry only costs a client a stale item until its next full sync
+        print(f"[CHANGELOG] Failed to record {kind} {entity_id}: {e}")
+
+
+def entry_visible(entry: Dict[str, Any], viewer_uid: str, friends: set) -> bool:
+    kind = entry.get("kind")
+    if kind == "sessions":
+        owner = entry.get("owner")
+        privacy = entry.get("privacy", "friends")
+        return owner == viewer_uid or privacy == "public" or (privacy == "friends" and owner in friends)
+    if kind == "friends":
+        return viewer_uid in (entry.get("uids") or [])
+    if kind == "friend_requests":
+        return entry.get("owner") == viewer_uid
+    if kind == "leagues":
+        return viewer_uid in (entry.get("members") or {})
+    return False
+
+
+def read_changes(db: Database, since: str, limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """Up to limit entries strictly after the cursor, oldest first."""
+    snap = db.child("changes").order_by_key().start_at(since).limit_to_first(limit + 1).get()
+    return [(s.key(), s.val()) for s in snap.each() or [] if s.key() > since][:limit]
+
+
+def head_cursor() -> str:
+    """Cursor for "now": everything currently in the log counts as seen."""
+    return push_id_millis_floor(int(time.time() * 1000) - SETTLE_SECONDS * 1000)
+
+
+def push_id_millis_floor(millis: int) -> str:
+    """Smallest key at the given millisecond, usable as a cursor."""
+    return push_id(millis)[:8] + PUSH_CHARS[0] * 12
+
+
+def settled_cursor(since: str, keys: List[str]) -> str:
+    """Advance the cursor to the newest key old enough that no earlier write can still land."""
+    settle_before = int(time.time() * 1000) - SETTLE_SECONDS * 1000
+    cursor = since
+    for key in keys:
+        if push_id_millis(key) >= settle_before:
+            break
+        cursor = key
+    return cursor
+
+
+def is_valid_cursor(cursor: str | None) -> bool:
+    return bool(cursor) and len(cursor) == 20 and all(char in PUSH_CHARS for char in cursor)
+
+
+def is_stale(db: Database, since: str) -> bool:
+    horizon = db.child("changes_meta").child("horizon").get().val()
+    return bool(horizon) and since < horizon
+
+
+def compact_changelog(db: Database, retention_days: int = CHANGELOG_RETENTION_DAYS, batch_size: int = 500) -> int:
+    """Delete entries older than retention_days and advance the horizon. Returns entries removed."""
+    cutoff = push_id_millis_floor(int((datetime.now() - timedelta(days=retention_days)).timestamp() * 1000))
+    removed = 0
+    while True:
+        snap = db.child("changes").order_by_key().end_at(cutoff).limit_to_first(batch_size).get()
+        keys = [s.key() for s in snap.each() or []]
+        if not keys:
+            break
+        updates = {f"changes/{key}": None for key in keys}
+        updates["changes_meta/horizon"] = keys[-1]
+        db.update(updates)
+        removed += len(keys)
+        if len(keys) < batch_size:
+            break
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the /changes log used by /sync.")
+    parser.add_argument("--compact", action="store_true", help="Remove entries older than the retention window")
+    parser.add_argument("--days", type=int, default=CHANGELOG_RETENTION_DAYS)
+    args = parser.parse_args()
+
+    if args.compact:
+        from app import get_db
+        print(f"[CHANGELOG] Removed {compact_changelog(get_db(), args.days)} entries")
@@ -0,0 +1,301 @@
+"""
+Course registry: canonical course ids, autocomplete and nearby search.
+
+Recompute ids after changing canonical_course_id:  python courses.py reindex
+"""
+from pyrebase.pyrebase import Database
+from typing import Dict, Any, List, Tuple
+from collections import defaultdict
+from shards import all_shards, primary
+from scan import scan_records
+
+import argparse
+import bisect
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+
+COURSE_INDEX_TTL_SECONDS = int(os.getenv("COURSE_INDEX_TTL", "300"))
+GRID_CELL_DEGREES = 0.25  # ~28km cells for the nearby-course grid
+EARTH_RADIUS_KM = 6371.0
+MAX_GRAM_POSTINGS = 200
+REINDEX_PAGE_SIZE = 500  # courseId changes per multi-path write during reindex
+# Trailing words dropped from ids ("Pebble Beach Golf Course" == "Pebble Beach"). Only these: words like
+# "club" or "country" tell courses apart ("Riverside Golf Club" != "Riverside Country Club")
+GENERIC_COURSE_SUFFIXES = (("golf", "course"), ("gc",))
+
+
+def _tokens(name: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode("ascii")
+    text = text.lower().replace("&", " and ")
+    return re.findall(r"[a-z0-9]+", text)
+
+
+def canonical_course_id(name: str) -> str | None:
+    """
+    Map a free-text course name to a stable registry id that is a safe
+    Firebase key: case, accents, punctuation and spacing are normalized and a
+    trailing "golf course"/"gc" is dropped, e.g. "Pebble Beach Golf Course"
+    -> "pebble-beach", "Pebble Beach Golf Links" -> "pebble-beach-golf-links".
+    """
+    tokens = _tokens(name)
+    for suffix in GENERIC_COURSE_SUFFIXES:
+        if len(tokens) > len(suffix) and tuple(tokens[-len(suffix):]) == suffix:
+            tokens = tokens[:-len(suffix)]
+            break
+    return "-".join(tokens) or None
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _haversine_km(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    return int(math.floor(lat / GRID_CELL_DEGREES)), int(math.floor(lon / GRID_CELL_DEGREES))
+
+
+class CourseIndex:
+    """
+    In-memory search structures over /courses:
+    a sorted (name, id) list for prefix autocomplete, a trigram index for
+    fuzzy matches, and a lat/lon grid for nearby lookups.
+    """
+
+    def __init__(self, courses: Dict[str, Dict[str, Any]]):
+        self.courses = {}
+        self.names = []
+        self.trigrams = defaultdict(set)
+        self.grid = defaultdict(set)
+        for course_id, data in courses.items():
+            self.add(course_id, data)
+        self.loaded_at = time.monotonic()
+
+    def add(self, course_id: str, data: Dict[str, Any]):
+        previous = self.courses.get(course_id) or {}
+        if previous.get("lat") is not None and previous.get("lon") is not None:
+            self.grid[_cell(float(previous["lat"]), float(previous["lon"]))].discard(course_id)
+        self.courses[course_id] = data
+        searchable = {" ".join(_tokens(data.get("name") or course_id.replace("-", " "))), course_id.replace("-", " ")}
+        for alias in (data.get("aliases") or {}).values():
+            searchable.add(" ".join(_tokens(alias)))
+        for text in searchable:
+            entry = (text, course_id)
+            position = bisect.bisect_left(self.names, entry)
+            if position == len(self.names) or self.names[position] != entry:
+                self.names.insert(position, entry)
+            for gram in _trigrams(text):
+                self.trigrams[gram].add(course_id)
+        if data.get("lat") is not None and data.get("lon") is not None:
+            self.grid[_cell(float(data["lat"]), float(data["lon"]))].add(course_id)
+
+    def _summary(self, course_id: str) -> Dict[str, Any]:
+        data = self.courses[course_id]
+        return {
+            "id": course_id,
+            "name": data.get("name") or course_id,
+            "rating": data.get("rating"),
+            "lat": data.get("lat"),
+            "lon": data.get("lon"),
+        }
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Prefix matches first, then fuzzy trigram matches ranked by similarity."""
+        text = " ".join(_tokens(query))
+        if not text:
+            return []
+
+        scores = {}
+        position = bisect.bisect_left(self.names, (text, ""))
+        while len(scores) < limit and position < len(self.names) and self.names[position][0].startswith(text):
+            scores.setdefault(self.names[position][1], 2.0)
+            position += 1
+
+        if len(scores) < limit and len(text) >= 3:
+            # Grams shared by a large part of the registry ("our", "ub ") say little
+            # about which course is meant and dominate the cost, so skip them.
+            common = max(MAX_GRAM_POSTINGS, len(self.courses) // 20)
+            query_grams = [gram for gram in _trigrams(text) if 0 < len(self.trigrams.get(gram, ())) <= common]
+            overlap = defaultdict(int)
+            for gram in query_grams:
+                for course_id in self.trigrams[gram]:
+                    overlap[course_id] += 1
+            for course_id, shared in overlap.items():
+                similarity = shared / len(query_grams)
+                if similarity >= 0.4 and course_id not in scores:
+                    scores[course_id] = similarity
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [self._summary(course_id) for course_id, _ in ranked]
+
+    def nearby(self, lat: float, lon: float, radius_km: float, limit: int = 20) -> List[Dict[str, Any]]:
+        """Courses within radius_km of (lat, lon), closest first."""
+        lat_cells = int(math.ceil(radius_km / (111.0 * GRID_CELL_DEGREES)))
+        lon_scale = max(math.cos(math.radians(lat)), 0.01)
+        lon_cells = int(math.ceil(radius_km / (111.0 * GRID_CELL_DEGREES * lon_scale)))
+        center_lat, center_lon = _cell(lat, lon)
+
+        found = []
+        for dlat in range(-lat_cells, lat_cells + 1):
+            for dlon in range(-lon_cells, lon_cells + 1):
+                for course_id in self.grid.get((center_lat + dlat, center_lon + dlon), ()):
+                    data = self.courses[course_id]
+                    distance = _haversine_km(lat, lon, float(data["lat"]), float(data["lon"]))
+                    if distance <= radius_km:
+                        found.append((distance, course_id))
+
+        found.sort()
+        return [{**self._summary(course_id), "distance_km": round(distance, 2)} for distance, course_id in found[:limit]]
+
+
+_index = None
+_index_lock = threading.Lock()  # Guards _index; never held across a database read
+_index_loading = threading.Lock()  # One (re)load at a time
+_index_generation = 0  # Bumped by reindex_courses, so a load that started before it is dropped
+
+
+def _load_index(db: Database) -> CourseIndex:
+    raw = db.child("courses").get().val() or {}
+    courses = {}
+    for key, data in raw.items():
+        # Older cache entries were keyed by the raw course name
+        course_id = key if isinstance(data, dict) and data.get("name") else canonical_course_id(key)
+        if course_id:
+            courses[course_id] = {**courses.get(course_id, {}), **(data if isinstance(data, dict) else {})}
+    return CourseIndex(courses)
+
+
+def _fresh(index: CourseIndex | None) -> bool:
+    return index is not None and time.monotonic() - index.loaded_at <= COURSE_INDEX_TTL_SECONDS
+
+
+def get_course_index(db: Database) -> CourseIndex:
+    """
+    Return the process-wide course index, reloading /courses when it is older
+    than the TTL. The read happens outside _index_lock, and while one thread
+    reloads the others keep using the current index (only the first load is waited for).
+    """
+    global _index
+    with _index_lock:
+        index = _index
+    if _fresh(index):
+        return index
+    if not _index_loading.acquire(blocking=index is None):
+        return index
+    try:
+        with _index_lock:
+            index, generation = _index, _index_generation
+        if _fresh(index):
+            return index
+        index = _load_index(db)
+        with _index_lock:
+            if generation == _index_generation:
+                _index = index
+        return index
+    finally:
+        _index_loading.release()
+
+
+def register_course(db: Database, name: str, lat: float | None = None, lon: float | None = None,
+                    replace_location: bool = False) -> str | None:
+    """
+    Make sure /courses/<canonical id> exists for a course name, recording the
+    spelling as an alias and the location when given. A location already on
+    record is only replaced when replace_location is set (admins).
+    Returns the course id.
+    """
+    course_id = canonical_course_id(name)
+    if not course_id:
+        return None
+
+    course_ref = lambda: db.child("courses").child(course_id)
+    existing = course_ref().get().val() or {}
+    alias_key = "-".join(_tokens(name))
+    updates = {}
+    if not existing.get("name"):
+        updates["name"] = name.strip()
+    if alias_key not in (existing.get("aliases") or {}):
+        updates[f"aliases/{alias_key}"] = name.strip()
+    has_location = existing.get("lat") is not None and existing.get("lon") is not None
+    if lat is not None and lon is not None and (replace_location or not has_location):
+        updates["lat"] = float(lat)
+        updates["lon"] = float(lon)
+
+    if updates:
+        course_ref().update(updates)
+        data = {**existing, **{k: v for k, v in updates.items() if not k.startswith("aliases/")}}
+        data["aliases"] = {**(existing.get("aliases") or {}), alias_key: name.strip()}
+        with _index_lock:
+            if _index is not None:
+                _index.add(course_id, data)
+    return course_id
+
+
+def reindex_courses(db: Database) -> Dict[str, int]:
+    """
+    Re-key /courses and every session's courseId with the current
+    canonical_course_id. A registry entry whose aliases now map to several
+    ids is split by alias; its rating and location stay with the id of the
+    name it was registered under. Safe to re-run.
+    """
+    raw = primary(db).child("courses").get().val() or {}
+    entries = defaultdict(dict)
+    for old_id, data in raw.items():
+        data = data if isinstance(data, dict) else {}
+        name = data.get("name") or old_id.replace("-", " ")
+        home_id = canonical_course_id(name)
+        for alias in {**(data.get("aliases") or {}), "_name": name}.values():
+            new_id = canonical_course_id(alias)
+            if not new_id:
+                continue
+            entry = entries[new_id]
+            entry.setdefault("name", alias.strip())
+            entry.setdefault("aliases", {})["-".join(_tokens(alias))] = alias.strip()
+            if new_id == home_id:
+                entry["name"] = name.strip()
+                entry.update({key: data[key] for key in ("rating", "lat", "lon") if data.get(key) is not None})
+
+    updates = {f"courses/{old_id}": None for old_id in raw if old_id not in entries}
+    updates.update({f"courses/{course_id}": data for course_id, data in entries.items()})
+    primary(db).update(updates)
+
+    moved = 0
+    for shard in all_shards(db):
+        for root in ("session_summaries", "sessions"):
+            pending = {}
+            for summary in scan_records(shard.child(root)):
+                course_id = canonical_course_id(summary.get("courseName"))
+                if course_id and summary.get("courseId") != course_id:
+                    pending[f"{root}/{summary['id']}/courseId"] = course_id
+                if len(pending) >= REINDEX_PAGE_SIZE:
+                    shard.update(pending)
+                    moved += len(pending)
+                    pending = {}
+            if pending:
+                shard.update(pending)
+                moved += len(pending)
+
+    global _index, _index_generation
+    with _index_lock:
+        _index = None
+        _index_generation += 1
+    return {"courses": len(entries), "removed": sum(1 for value in updates.values() if value is None), "sessions": moved}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Course registry maintenance.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("reindex", help="Re-key courses and session courseIds with the current canonical ids")
+    args = parser.parse_args()
+
+    from app import get_db
+    print(f"[COURSES] Reindexed: {reindex_courses(get_db())}")
@@ -0,0 +1,292 @@
+"""
+Per-request time budgets and per-upstream circuit breakers.
+
+Every request gets a deadline (REQUEST_BUDGET_SECONDS, or its entry in
+ROUTE_BUDGETS) when it starts. Upstream calls take their timeout from
+timeout(default), i.e. the smaller of their usual timeout and what is left
+of the budget, so a slow upstream can cost a route its budget but never the
+sum of several 10s timeouts. Database calls get the same treatment through
+DeadlineSession, which replaces pyrebase's requests session; each database
+(shard) has its own breaker, so one failing shard doesn't fail the others.
+
+Each upstream also has a CircuitBreaker that opens after
+FAILURE_THRESHOLD consecutive failures or slow calls and fails fast until
+RESET_AFTER_SECONDS have passed. Calls that can't be made in time raise
+UpstreamUnavailable; routes catch it to serve their degraded response, and
+any request that still fails because of it is answered with 503 and
+Retry-After instead of 400: routes answer failures with {"error": str(e)},
+and a 400/500 whose error is the message of an UpstreamUnavailable raised
+during the request becomes a 503.
+"""
+from flask import Flask, request, jsonify
+from contextvars import ContextVar, copy_context
+from functools import wraps
+from typing import Any, Callable, Dict
+from urllib.parse import urlparse
+from profiling import record_upstream
+
+import os
+import threading
+import time
+import requests
+
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "8"))
+# Endpoint name -> budget in seconds; None means no deadline (streamed responses)
+ROUTE_BUDGETS = {
+    "get_challenges_route": 20.0,
+    "import_sessions_route": 30.0,
+    "export_me_route": None,
+    "media_route": None,
+    "live_round_stream_route": None,
+    "live_league_stream_route": None,
+}
+DB_TIMEOUT_SECONDS = 10.0
+FAILURE_THRESHOLD = 5
+RESET_AFTER_SECONDS = 30.0
+MIN_CALL_SECONDS = 0.05  # Less time than this left isn't worth starting a call
+
+
+class RequestBudget:
+    """The current request's deadline, and the UpstreamUnavailable errors raised during it (message -> upstream)."""
+
+    def __init__(self, deadline: float | None):
+        self.deadline = deadline
+        self.unavailable = {}
+
+
+_budget: ContextVar[RequestBudget | None] = ContextVar("parlor_budget", default=None)
+
+
+class UpstreamUnavailable(Exception):
+    def __init__(self, upstream: str, message: str | None = None):
+        super().__init__(message or f"{upstream} is unavailable, try again shortly")
+        self.upstream = upstream
+        budget = _budget.get()
+        if budget:
+            budget.unavailable[str(self)] = upstream
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    def __init__(self, upstream: str):
+        super().__init__(upstream, f"Request ran out of time waiting for {upstream}")
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+def current_deadline() -> float | None:
+    budget = _budget.get()
+    return budget.deadline if budget else None
+
+
+def remaining() -> float | None:
+    """Seconds left in the current request's budget, or None outside a request."""
+    deadline = current_deadline()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout(default: float, upstream: str = "upstream", reserve: float = 0.0) -> float:
+    """
+    Timeout for an upstream call: its default, capped by the remaining budget
+    less `reserve` (time kept back for the work the route still has to do
+    when the call is optional, e.g. saving the session after a rating lookup).
+    """
+    left = remaining()
+    if left is None:
+        return default
+    left -= reserve
+    if left < MIN_CALL_SECONDS:
+        raise DeadlineExceeded(upstream)
+    return min(default, left)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap fn so it runs under the caller's budget (and request trace) when handed to another thread."""
+    context = copy_context()
+
+    @wraps(fn)
+    def wrapped(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so each call gets its own copy
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapped
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After failure_threshold consecutive failures
+    (errors, or calls slower than slow_call_seconds) it opens and rejects
+    calls for reset_after_seconds, then lets one trial call through
+    (half-open) and closes again if that succeeds.
+    """
+
+    def __init__(self, name: str, slow_call_seconds: float, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_after_seconds: float = RESET_AFTER_SECONDS):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_after_seconds = reset_after_seconds
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_after_seconds else "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 1.0
+        return max(1.0, self.reset_after_seconds - (time.monotonic() - self.opened_at))
+
+    def _allow(self) -> bool:
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def _record(self, ok: bool):
+        with self.lock:
+            self.trial_in_flight = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"[BREAKER] {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+    def call(self, fn: Callable[[float], Any], default_timeout: float,
+             is_failure: Callable[[Any], bool] | None = None, reserve: float = 0.0) -> Any:
+        """
+        Run fn(timeout) through the breaker. Errors raised by fn (and results
+        is_failure() flags, e.g. 5xx responses) count as failures and surface
+        as UpstreamUnavailable.
+        """
+        started = time.monotonic()
+        if not self._allow():
+            record_upstream(self.name, started, error=CircuitOpen(self.name))
+            raise CircuitOpen(self.name)
+        try:
+            call_timeout = timeout(default_timeout, self.name, reserve)
+        except DeadlineExceeded as e:
+            with self.lock:
+                self.trial_in_flight = False
+            record_upstream(self.name, started, error=e)
+            raise
+
+        try:
+            result = fn(call_timeout)
+        except Exception as e:
+            self._record(False)
+            record_upstream(self.name, started, error=e)
+            raise UpstreamUnavailable(self.name) from e
+        record_upstream(self.name, started, result)
+
+        failed = bool(is_failure and is_failure(result))
+        self._record(not failed and time.monotonic() - started <= self.slow_call_seconds)
+        if failed:
+            raise UpstreamUnavailable(self.name)
+        return result
+
+
+BREAKERS = {
+    "firebase_auth": CircuitBreaker("firebase_auth", slow_call_seconds=2.0),
+    "golfcourse": CircuitBreaker("golfcourse", slow_call_seconds=3.0),
+    "openai": CircuitBreaker("openai", slow_call_seconds=15.0),
+}
+
+
+def upstream(name: str, fn: Callable[[float], Any], default_timeout: float = 10.0,
+             is_failure: Callable[[Any], bool] | None = None, reserve: float = 0.0) -> Any:
+    """
+    Call an upstream through its breaker with a deadline-capped timeout, e.g.
+    upstream("golfcourse", lambda timeout: requests.get(url, timeout=timeout)).
+    """
+    return BREAKERS[name].call(fn, default_timeout, is_failure, reserve)
+
+
+def server_error(response) -> bool:
+    return response.status_code >= 500
+
+
+def database_breaker(database_url: str) -> str:
+    """Name of the breaker for one database, e.g. firebase_db:parlor-1.firebaseio.com, registered on first use."""
+    host = urlparse(database_url or "").netloc
+    name = f"firebase_db:{host}"
+    if name not in BREAKERS:
+        BREAKERS.setdefault(name, CircuitBreaker(name, slow_call_seconds=5.0))
+    return name
+
+
+class DeadlineSession(requests.Session):
+    """requests session for pyrebase: every call gets a deadline-capped timeout and goes through its database's breaker."""
+
+    def __init__(self, database_url: str):
+        super().__init__()
+        self.breaker = database_breaker(database_url)
+
+    def request(self, method, url, **kwargs):
+        default_timeout = kwargs.pop("timeout", None) or DB_TIMEOUT_SECONDS
+        send = lambda call_timeout: super(DeadlineSession, self).request(method, url, timeout=call_timeout, **kwargs)
+        return upstream(self.breaker, send, default_timeout, server_error)
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        name: {"state": breaker.state, "consecutive_failures": breaker.failures, "rejected": breaker.rejected}
+        for name, breaker in BREAKERS.items()
+    }
+
+
+def install(app: Flask):
+    """Start each request's budget and turn upstream failures into 503s."""
+
+    @app.before_request
+    def start_budget():
+        # /batch sub-requests inherit the batch's deadline
+        if "parlor.deadline" in request.environ:
+            deadline = request.environ["parlor.deadline"]
+        else:
+            seconds = ROUTE_BUDGETS.get(request.endpoint, REQUEST_BUDGET_SECONDS)
+            deadline = None if seconds is None else time.monotonic() + seconds
+        request.environ["parlor.budget_token"] = _budget.set(RequestBudget(deadline))
+
+    @app.errorhandler(UpstreamUnavailable)
+    def unavailable(e: UpstreamUnavailable):
+        response = jsonify({"error": str(e)})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(int(BREAKERS[e.upstream].retry_after()) if e.upstream in BREAKERS else 1)
+        return response
+
+    @app.after_request
+    def unavailable_status(response):
+        # Only responses carrying an upstream failure; degraded answers and other 400s are left alone
+        budget = _budget.get()
+        if not budget or not budget.unavailable or response.status_code not in (400, 500) or not response.is_json:
+            return response
+        failed = budget.unavailable.get((response.get_json(silent=True) or {}).get("error"))
+        if failed:
+            response.status_code = 503
+            response.headers["Retry-After"] = str(int(BREAKERS[failed].retry_after()) if failed in BREAKERS else 1)
+        return response
+
+    @app.teardown_request
+    def end_budget(exc=None):
+        token = request.environ.pop("parlor.budget_token", None)
+        if token is not None:
+            try:
+                _budget.reset(token)
+            except ValueError:  # Reset from a different context than the one that set it
+                _budget.set(None)
@@ -0,0 +1,137 @@
+"""
+Streaming export of a user's full round history as NDJSON or CSV.
+
+Summaries are read with scan(), which parses the filtered response
+incrementally, and their details are fetched DETAIL_BATCH rounds at a time,
+so memory use is bounded by one batch (plus at most ARCHIVE_BLOBS_CACHED
+archive month blobs) no matter how many rounds the user has. Archived
+sessions are restored from their month blob, and rounds still in the legacy
+layout are exported as stored.
+
+Support exports:  python export.py <uid> --format csv > rounds.csv
+"""
+from pyrebase.pyrebase import Database
+from typing import Dict, Any, Iterator, Iterable
+from collections import OrderedDict
+from archive import decode_blob, merge_archived
+from shards import for_uid
+from scan import scan_records
+from session_store import SUMMARIES, LEGACY, LEGACY_READS, join_session, read_details_many
+from itertools import islice
+
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+
+EXPORT_FORMATS = ("ndjson", "csv")
+CSV_FIELDS = (
+    "id", "timestamp", "courseName", "courseId", "holes", "totalScore", "course_rating",
+    "normalized_score", "duration", "startTime", "endTime", "privacy", "scores",
+    "like_count", "comment_count",
+)
+CHUNK_BYTES = 64 * 1024  # Rows are buffered into chunks of about this size before being sent
+ARCHIVE_BLOBS_CACHED = 2  # Sessions come back in key (creation) order, so months arrive mostly together
+DETAIL_BATCH = 32  # Rounds whose details are read in parallel
+
+
+def iter_user_sessions(db: Database, uid: str) -> Iterator[Dict[str, Any]]:
+    """Yield the user's sessions one at a time as full records, with archived ones restored."""
+    shard = for_uid(db, uid)
+    blobs = OrderedDict()
+
+    def restore(session):
+        month = session.pop("archived", None)
+        if not month:
+            return session
+        if month not in blobs:
+            blobs[month] = decode_blob(shard.child("session_archive").child(uid).child(month).get().val())
+            if len(blobs) > ARCHIVE_BLOBS_CACHED:
+                blobs.popitem(last=False)
+        blobs.move_to_end(month)
+        return merge_archived(blobs[month].get(session["id"], {}), session)
+
+    # Each query is sent on its first iteration, before the handle is reused for blobs
+    summaries = scan_records(shard.child(SUMMARIES).order_by_child("uid").equal_to(uid))
+    while batch := list(islice(summaries, DETAIL_BATCH)):
+        for summary, details in zip(batch, read_details_many(shard, [s["id"] for s in batch])):
+            month = summary.get("archived")
+            session = join_session(summary, restore({"id": summary["id"], "archived": month, **(details or {})}))
+            session.pop("archived", None)
+            yield session
+
+    if LEGACY_READS:
+        for session in scan_records(shard.child(LEGACY).order_by_child("uid").equal_to(uid)):
+            yield restore(session)
+
+
+def _csv_row(session: Dict[str, Any]) -> Dict[str, Any]:
+    row = {field: session.get(field) for field in CSV_FIELDS}
+    row["scores"] = json.dumps(session.get("scores")) if session.get("scores") is not None else ""
+    row["like_count"] = len(session.get("likes") or {})
+    row["comment_count"] = len(session.get("comments") or {})
+    return row
+
+
+def export_lines(sessions: Iterable[Dict[str, Any]], fmt: str) -> Iterator[str]:
+    if fmt == "ndjson":
+        for session in sessions:
+            yield json.dumps(session, separators=(",", ":")) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for session in sessions:
+        writer.writerow(_csv_row(session))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def encode_chunks(lines: Iterable[str], gzip: bool = False) -> Iterator[bytes]:
+    """Join lines into CHUNK_BYTES-sized chunks, optionally as one gzip stream."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    pending, size = [], 0
+
+    def flush():
+        data = "".join(pending).encode("utf-8")
+        pending.clear()
+        return compressor.compress(data) if compressor else data
+
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            chunk = flush()
+            size = 0
+            if chunk:
+                yield chunk
+
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_user_sessions(db: Database, uid: str, fmt: str = "ndjson", gzip: bool = False) -> Iterator[bytes]:
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    return encode_chunks(export_lines(iter_user_sessions(db, uid), fmt), gzip)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a user's rounds.")
+    parser.add_argument("uid")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    from app import get_db
+    for chunk in export_user_sessions(get_db(), args.uid, args.format, args.gzip):
+        sys.stdout.buffer.write(chunk)
@@ -2,14 +2,51 @@ from pyrebase.pyrebase import Database, Auth
 from typing import Dict, Any, Tuple, List
 from datetime import datetime, time, timedelta
 from flask import jsonify
+from archive import remove_archived_session, archived_fields, ARCHIVE_CURSOR, ARCHIVE_REQUEUE
+from courses import canonical_course_id, register_course
+from user_search import index_updates
+from notifications import notify, notify_many
+from scan import scan, newest_first
+from deadlines import UpstreamUnavailable, upstream, propagate
+from session_store import (
+    SUMMARIES, DETAILS, increment, session_updates, delete_updates, scan_summaries,
+    read_summary, read_session, read_summaries_many, ensure_migrated,
+)
+from concurrent.futures import ThreadPoolExecutor
+from shards import ShardRouter, for_uid, for_session, primary, fan_out
+from changelog import (
+    change_entry, record_change, push_id, entry_visible, read_changes,
+    head_cursor, settled_cursor, is_stale, is_valid_cursor,
+)
 
 import os
 import requests
 import statistics
+import threading
 
 GOLFCOURSE_API_BASE_URL = os.getenv("GOLFCOURSE_API_BASE_URL", "https://api.golfcourseapi.com")
 GOLFCOURSE_API_KEY = os.getenv("5EBUXXT3X5AIJUE7GMYCKH6XPU")
 NORMALIZED_TOP_ROUNDS = 8  # Number of best normalized rounds to average for Final Score
+IMPORT_CHUNK_SIZE = 250  # Sessions per multi-path write during bulk import
+SYNC_PAGE_SIZE = 500  # Change log entries examined per /sync call
+RATING_BACKFILL_BATCH = 50  # Pending sessions rated per backfill run
+RATING_API_TIMEOUT_SECONDS = 4
+RATING_API_RESERVE_SECONDS = 2  # Budget kept back so the session can still be saved if the rating API is slow
+
+_backfill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rating-backfill")
+_backfill_running = threading.Lock()
+_sync_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sync-reads")
+
+def clone_db(db: Database) -> Database:
+    """
+    Return a new Database handle sharing db's connection pool.
+
+    pyrebase keeps the path/query being built on the Database object itself,
+    so code running on other threads needs its own handle.
+    """
+    if isinstance(db, ShardRouter):
+        return db.clone()
+    return Database(db.credentials, db.api_key, db.database_url, db.requests)
 
 def fetch_course_rating_from_api(course_name: str) -> float | None:
     """
@@ -21,6 +58,9 @@ def fetch_course_rating_from_api(course_name: str) -> float | None:
       - and JSON field names
 
     to match the official GolfCourseAPI docs.
+
+    Raises UpstreamUnavailable when the API is down, slow or out of request
+    budget, so callers can tell "no rating" from "try again later".
     """
     if not GOLFCOURSE_API_KEY:
         # No API key configured – just skip rating lookup
@@ -32,15 +72,15 @@ def fetch_course_rating_from_api(course_name: str) -> float | None:
         # Check their docs and plug in the correct path + query parameters.
         url = f"{GOLFCOURSE_API_BASE_URL}/v1/search"
 
-        response = requests.get(
+        response = upstream("golfcourse", lambda timeout: requests.get(
             url,
             params={"search_query": course_name},  # adjust key ("q", "name", etc.) per docs
             headers={
                 "Authorization": f"Key {GOLFCOURSE_API_KEY}",
                 "Accept": "application/json",
             },
-            timeout=10,
-        )
+            timeout=timeout,
+        ), RATING_API_TIMEOUT_SECONDS, lambda r: r.status_code >= 500, reserve=RATING_API_RESERVE_SECONDS)
         response.raise_for_status()
         data = response.json()
 
@@ -69,6 +109,8 @@ def fetch_course_rating_from_api(course_name: str) -> float | None:
 
         return float(rating)
 
+    except UpstreamUnavailable:
+        raise
     except Exception:
         # Log if you have logging configured; otherwise, just ignore
         return None
@@ -77,11 +119,15 @@ def fetch_course_rating(db: Database, course: str) -> float | None:
     """
     Get course_rating for a given course name:
 
-    1. Check Firebase cache at /courses/<course>.
+    1. Check Firebase cache at /courses/<canonical course id>.
     2. If missing, call GolfCourseAPI, then store it for next time.
     """
+    course_id = canonical_course_id(course)
+    if not course_id:
+        return None
+
     # 1) Check cache
-    cached = db.child("courses").child(course).get().val()
+    cached = db.child("courses").child(course_id).get().val()
     if cached and "rating" in cached:
         try:
             return float(cached["rating"])
@@ -89,7 +135,7 @@ def fetch_course_rating(db: Database, course: str) -> float | None:
             pass
     rating = fetch_course_rating_from_api(course)
     if rating is not None:
-        db.child("courses").child(course).update({"rating": rating})
+        db.child("courses").child(course_id).update({"rating": rating})
     return rating
 
 def update_user_final_score(db: Database, uid: str) -> float | None:
@@ -99,25 +145,12 @@ def update_user_final_score(db: Database, uid: str) -> float | None:
     Final Score = average of the user's best X normalized rounds
       (X = NORMALIZED_TOP_ROUNDS; lower is better).
 
-    We look at /scores where uid == <uid>, use normalized_score if present,
+    We look at the user's session summaries, use normalized_score if present,
     and store the result under /users/<uid>/final_score.
     """
-    scores_snapshot = (
-        db.child("sessions")
-        .order_by_child("uid")
-        .equal_to(uid)
-        .get()
-    )
-
-    if not scores_snapshot.each():
-        final_score = None
-        db.child("users").child(uid).update({"final_score": final_score})
-        return final_score
-
     normalized_values: List[float] = []
 
-    for snap in scores_snapshot.each():
-        data = snap.val() or {}
+    for data in scan_summaries(for_uid(db, uid), uid=uid):
         ns = data.get("normalized_score")
         if ns is not None:
             try:
@@ -133,17 +166,42 @@ def update_user_final_score(db: Database, uid: str) -> float | None:
         best = normalized_values[:top_n]
         final_score = round(sum(best) / len(best), 1)
 
-    db.child("users").child(uid).update({"final_score": final_score})
+    _store_final_score(db, uid, final_score)
     return final_score
 
+def _store_final_score(db: Database, uid: str, final_score: float | None):
+    """Write final_score to the user and to their player-search entries in one update."""
+    user_data = primary(db).child("users").child(uid).get().val() or {}
+    updates = {f"users/{uid}/final_score": final_score}
+    if user_data.get("name") or user_data.get("email"):
+        updates.update(index_updates(uid, user_data.get("name"), user_data.get("email"), final_score))
+    primary(db).update(updates)
+
+def update_user_name(db: Database, uid: str, name: str):
+    """Rename a user, moving their player-search entries in the same update."""
+    name = (name or "").strip()
+    if not name:
+        raise ValueError("Name cannot be empty")
+    user_data = primary(db).child("users").child(uid).get().val()
+    if not user_data:
+        raise ValueError("User not found")
+
+    updates = {f"users/{uid}/name": name}
+    updates.update(index_updates(
+        uid, name, user_data.get("email"), user_data.get("final_score"),
+        old_name=user_data.get("name"), old_email=user_data.get("email"),
+    ))
+    primary(db).update(updates)
+
 def get_leaderboard(db: Database, course=None):
-    sessions = db.child("sessions").get()
-    player_scores = {}
+    course_id = canonical_course_id(course) if course else None
+
+    def shard_scores(shard: Database):
+        # Running [total, count] per player instead of every score
+        player_scores = {}
 
-    if sessions.each():
-        for s in sessions.each():
-            data = s.val()
-            if course and data.get("course") != course:
+        for data in scan_summaries(shard):
+            if course_id and (data.get("courseId") or canonical_course_id(data.get("courseName"))) != course_id:
                 continue
 
             name = data.get("username")
@@ -151,13 +209,21 @@ def get_leaderboard(db: Database, course=None):
             if not name or score is None:
                 continue
 
-            if name not in player_scores:
-                player_scores[name] = []
-            player_scores[name].append(score)
+            totals = player_scores.setdefault(name, [0, 0])
+            totals[0] += score
+            totals[1] += 1
+        return player_scores
+
+    player_scores = {}
+    for shard_result in fan_out(db, shard_scores):
+        for name, (total, count) in shard_result.items():
+            totals = player_scores.setdefault(name, [0, 0])
+            totals[0] += total
+            totals[1] += count
 
     leaderboard = []
-    for name, score_list in player_scores.items():
-        avg_score = sum(score_list) / len(score_list)
+    for name, (total, count) in player_scores.items():
+        avg_score = total / count
         leaderboard.append({
             "name": name,
             "average_score": round(avg_score, 2)
@@ -177,44 +243,52 @@ def send_friend_request(db: Database, sender_uid, receiver_uid):
     if is_request_pending(db, sender_uid, receiver_uid):
         raise ValueError("Friend request is already pending.")
     
-    db.child("friend_requests").child(receiver_uid).child(sender_uid).set(True)
+    for_uid(db, receiver_uid).child("friend_requests").child(receiver_uid).child(sender_uid).set(True)
+    record_change(db, "friend_requests", sender_uid, owner=receiver_uid)
+    notify(db, receiver_uid, "friend_request", sender_uid, sender_uid)
 
 def accept_friend_request(db: Database, receiver_uid, sender_uid):
-    db.child("friends").child(receiver_uid).child(sender_uid).set(True)
-    db.child("friends").child(sender_uid).child(receiver_uid).set(True)
-    db.child("friend_requests").child(receiver_uid).child(sender_uid).remove()
+    for_uid(db, receiver_uid).child("friends").child(receiver_uid).child(sender_uid).set(True)
+    for_uid(db, sender_uid).child("friends").child(sender_uid).child(receiver_uid).set(True)
+    for_uid(db, receiver_uid).child("friend_requests").child(receiver_uid).child(sender_uid).remove()
+    record_change(db, "friends", sender_uid, uids=[receiver_uid, sender_uid])
+    record_change(db, "friend_requests", sender_uid, "delete", owner=receiver_uid)
+    notify(db, sender_uid, "friend_accept", receiver_uid, receiver_uid)
 
 def decline_friend_request(db: Database, receiver_uid, sender_uid):
-    db.child("friend_requests").child(receiver_uid).child(sender_uid).remove()
+    for_uid(db, receiver_uid).child("friend_requests").child(receiver_uid).child(sender_uid).remove()
+    record_change(db, "friend_requests", sender_uid, "delete", owner=receiver_uid)
 
 def remove_friend(db: Database, uid, friend_uid):
-    db.child("friends").child(uid).child(friend_uid).remove()
-    db.child("friends").child(friend_uid).child(uid).remove()
+    for_uid(db, uid).child("friends").child(uid).child(friend_uid).remove()
+    for_uid(db, friend_uid).child("friends").child(friend_uid).child(uid).remove()
+    record_change(db, "friends", friend_uid, "delete", uids=[uid, friend_uid])
 
 def get_friend_requests(db: Database, uid):
-    requests = db.child("friend_requests").child(uid).get().val()
+    requests = for_uid(db, uid).child("friend_requests").child(uid).get().val()
     if not requests:
         return []
     return list(requests.keys())
 
 def get_friends(db: Database, uid):
-    friends = db.child("friends").child(uid).get().val()
+    friends = for_uid(db, uid).child("friends").child(uid).get().val()
     if not friends:
         return []
     return list(friends.keys())
 
 def are_friends(db: Database, uid1, uid2) -> bool:
-    return bool(db.child("friends").child(uid1).child(uid2).get().val())
+    return bool(for_uid(db, uid1).child("friends").child(uid1).child(uid2).get().val())
 
 def is_request_pending(db: Database, sender_uid, receiver_uid) -> bool:
-    sent = db.child("friend_requests").child(receiver_uid).child(sender_uid).get().val()
-    received = db.child("friend_requests").child(sender_uid).child(receiver_uid).get().val()
+    sent = for_uid(db, receiver_uid).child("friend_requests").child(receiver_uid).child(sender_uid).get().val()
+    received = for_uid(db, sender_uid).child("friend_requests").child(sender_uid).child(receiver_uid).get().val()
     return bool(sent or received)
 
 # Golf Session Functions
-def create_session(db: Database, uid, session_data):
+def create_session(db: Database, uid, session_data, session_id: str | None = None):
     """
-    Create a new golf session
+    Create a new golf session (under session_id if given, e.g. one claimed
+    ahead of time so a retried create writes the same round again)
     session_data should include:
     - courseName: str
     - holes: int (9 or 18)
@@ -229,19 +303,47 @@ def create_session(db: Database, uid, session_data):
     # Get user info
     user_data = db.child("users").child(uid).get().val()
     username = user_data.get("name") if user_data else "Unknown"
-    
+
+    course_id = register_course(db, session_data.get("courseName"))
+    try:
+        course_rating, rating_pending = fetch_course_rating(db, session_data.get("courseName")), False
+    except UpstreamUnavailable:
+        # Save the round now and rate it later rather than failing the request
+        course_rating, rating_pending = None, True
+    session = build_session_record(uid, username, session_data, course_rating, course_id=course_id, rating_pending=rating_pending)
+
+    # Register the owner first so the session is never unreachable by id
+    session_id = session_id or push_id()
+    directory_updates = {f"session_owners/{session_id}": uid}
+    if rating_pending:
+        directory_updates[f"rating_backfill/{session_id}"] = uid
+    primary(db).update(directory_updates)
+    for_uid(db, uid).update(session_updates(session_id, session))
+    record_change(db, "sessions", session_id, owner=uid, privacy=session["privacy"])
+    update_user_final_score(db, uid)
+    if not rating_pending:
+        submit_rating_backfill(db)
+    return session_id  # Return the session ID
+
+def build_session_record(uid, username, session_data, course_rating, timestamp=None, course_id=None, rating_pending=False) -> Dict[str, Any]:
+    """
+    Build the full record for a round (stored split into a summary and
+    details, see session_store.split_session). rating_pending marks a
+    round saved while the course rating couldn't be fetched; its
+    normalized_score is filled in later by backfill_pending_ratings.
+    """
     score = session_data.get("totalScore")
-    course_rating = fetch_course_rating(db, session_data.get("courseName"))
     normalized_score = None
 
     if course_rating is not None:
         course_rating = float(course_rating)
         normalized_score = score - course_rating
 
-    session = {
+    return {
         "uid": uid,
         "username": username,
         "courseName": session_data.get("courseName"),
+        "courseId": course_id,
         "holes": session_data.get("holes"),
         "selectedHoles": session_data.get("selectedHoles"),
         "scores": session_data.get("scores"),
@@ -252,35 +354,266 @@ def create_session(db: Database, uid, session_data):
         "privacy": session_data.get("privacy", "friends"),
         "images": session_data.get("images", []),
         "videos": session_data.get("videos", []),
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": timestamp or datetime.now().isoformat(),
         "course_rating": course_rating,
         "normalized_score": normalized_score,
+        "rating_status": "pending" if rating_pending else None,
         "likes": {},
         "comments": {},
     }
 
-    session_ref = db.child("sessions").push(session)
+IMPORT_DATE_FORMATS = (
+    "%m/%d/%Y", "%m/%d/%y", "%m/%d/%Y %H:%M", "%m/%d/%Y %I:%M %p", "%Y/%m/%d", "%Y%m%d",
+    "%d %b %Y", "%b %d %Y", "%b %d, %Y", "%B %d, %Y",
+)
+
+def parse_import_time(value) -> str | None:
+    """
+    Turn an imported date/time into the naive local ISO-8601 string sessions
+    use elsewhere, so imported rounds sort with the rest. Accepts ISO-8601,
+    IMPORT_DATE_FORMATS (US month-first) and Unix seconds/milliseconds.
+    Returns None for an empty value; raises ValueError if it can't be parsed.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    text = str(value).strip()
+    if isinstance(value, (int, float)) or text.isdigit():
+        number = float(text)
+        if number >= 1e12:
+            return datetime.fromtimestamp(number / 1000).isoformat()
+        if number >= 1e9:
+            return datetime.fromtimestamp(number).isoformat()
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        for fmt in IMPORT_DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+def parse_import_rows(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Normalize imported rounds (CSV rows or JSON objects) into session_data dicts.
+
+    Each row needs courseName and totalScore. scores may be a {hole: score}
+    dict, a list, or a "4;5;3;..." string (CSV). holes must be 9 or 18
+    (default: 9 if there are at most 9 scores). date/startTime/endTime are
+    parsed with parse_import_time so imported rounds sort by when they were
+    played.
+    Returns (valid_sessions, errors) where errors carry the 1-based row number.
+    """
+    sessions = []
+    errors = []
+
+    for i, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": i, "error": "Row must be an object"})
+            continue
+
+        course_name = (row.get("courseName") or row.get("course") or "").strip()
+        try:
+            total_score = int(float(row.get("totalScore")))
+        except (TypeError, ValueError):
+            errors.append({"row": i, "error": "Missing or invalid totalScore"})
+            continue
+        if not course_name:
+            errors.append({"row": i, "error": "Missing courseName"})
+            continue
+
+        scores = row.get("scores") or {}
+        if isinstance(scores, str):
+            scores = [s for s in scores.replace(",", ";").split(";") if s.strip()]
+        if isinstance(scores, list):
+            scores = {str(hole): score for hole, score in enumerate(scores, start=1)}
+        try:
+            scores = {str(hole): int(score) for hole, score in scores.items()}
+        except (AttributeError, TypeError, ValueError):
+            errors.append({"row": i, "error": "Invalid scores"})
+            continue
+
+        try:
+            start_time = parse_import_time(row.get("startTime") or row.get("date"))
+            end_time = parse_import_time(row.get("endTime")) or start_time
+        except ValueError:
+            errors.append({"row": i, "error": "Invalid date, startTime or endTime"})
+            continue
+        try:
+            holes = int(row.get("holes") or (9 if 0 < len(scores) <= 9 else 18))
+            duration = int(float(row.get("duration") or 0))
+        except (TypeError, ValueError):
+            errors.append({"row": i, "error": "Invalid holes or duration"})
+            continue
+        if holes not in (9, 18):
+            errors.append({"row": i, "error": "holes must be 9 or 18"})
+            continue
+
+        sessions.append({
+            "courseName": course_name,
+            "holes": holes,
+            "scores": scores,
+            "totalScore": total_score,
+            "duration": duration,
+            "startTime": start_time,
+            "endTime": end_time,
+            "privacy": row.get("privacy") if row.get("privacy") in ("public", "friends", "private") else "friends",
+        })
+
+    return sessions, errors
+
+def import_sessions(db: Database, uid: str, sessions: List[Dict[str, Any]], progress=None) -> List[str]:
+    """
+    Bulk-create sessions for a user.
+
+    Looks up the username once and each distinct course once, writes
+    sessions with multi-path updates of IMPORT_CHUNK_SIZE records, and
+    recomputes the Final Score a single time at the end.
+    progress(imported_count) is called after each chunk is written.
+    """
+    user_data = db.child("users").child(uid).get().val()
+    username = user_data.get("name") if user_data else "Unknown"
+
+    course_ids = {}
+    ratings = {}
+    pending_courses = set()
+    for course_name in {session["courseName"] for session in sessions}:
+        course_id = register_course(db, course_name)
+        course_ids[course_name] = course_id
+        if course_id not in ratings:
+            try:
+                ratings[course_id] = fetch_course_rating(db, course_name)
+            except UpstreamUnavailable:
+                ratings[course_id] = None
+                pending_courses.add(course_id)
+
+    # Rounds older than the last archive run's cutoff are queued for the next run
+    archive_cursor = for_uid(db, uid).child(ARCHIVE_CURSOR).child(SUMMARIES).get().val()
+
+    session_ids = []
+    for start in range(0, len(sessions), IMPORT_CHUNK_SIZE):
+        updates = {}
+        directory_updates = {}
+        for session_data in sessions[start:start + IMPORT_CHUNK_SIZE]:
+            session_id = push_id()
+            timestamp = session_data.get("endTime") or session_data.get("startTime")
+            course_id = course_ids[session_data["courseName"]]
+            pending = course_id in pending_courses
+            session = build_session_record(uid, username, session_data, ratings[course_id], timestamp, course_id, pending)
+            updates.update(session_updates(session_id, session))
+            if archive_cursor and session["timestamp"] <= archive_cursor:
+                updates[f"{ARCHIVE_REQUEUE}/{session_id}"] = uid
+            directory_updates[f"session_owners/{session_id}"] = uid
+            if pending:
+                directory_updates[f"rating_backfill/{session_id}"] = uid
+            change_path, change = change_entry("sessions", session_id, owner=uid, privacy=session["privacy"])
+            directory_updates[change_path] = change
+            session_ids.append(session_id)
+        primary(db).update(directory_updates)
+        for_uid(db, uid).update(updates)
+        if progress:
+            progress(len(session_ids))
+
     update_user_final_score(db, uid)
-    return session_ref["name"]  # Return the session ID
+    return session_ids
+
+def backfill_pending_ratings(db: Database, limit: int = RATING_BACKFILL_BATCH) -> int:
+    """
+    Rate sessions saved with rating_status "pending" (queued under
+    /rating_backfill/<session_id> = uid) and recompute their owners' Final
+    Scores. Stops early if the rating API is still unavailable.
+    Returns the number of sessions rated.
+    """
+    pending = primary(db).child("rating_backfill").order_by_key().limit_to_first(limit).get().val() or {}
+    ratings = {}
+    owners = set()
+    rated = 0
+    for session_id, uid in pending.items():
+        shard = for_uid(db, uid)
+        session = ensure_migrated(shard, session_id)
+        if session and session.get("rating_status") == "pending":
+            course_name = session.get("courseName")
+            if course_name not in ratings:
+                try:
+                    ratings[course_name] = fetch_course_rating(db, course_name)
+                except UpstreamUnavailable:
+                    break
+            rating = ratings[course_name]
+            score = session.get("totalScore")
+            shard.child(SUMMARIES).child(session_id).update({
+                "course_rating": rating,
+                "normalized_score": score - rating if rating is not None and score is not None else None,
+                "rating_status": None,
+            })
+            owners.add(uid)
+            rated += 1
+        primary(db).child("rating_backfill").child(session_id).remove()
+
+    for uid in owners:
+        update_user_final_score(db, uid)
+    if rated:
+        print(f"[RATINGS] Backfilled {rated} pending course ratings")
+    return rated
+
+def submit_rating_backfill(db: Database):
+    """Run backfill_pending_ratings in the background unless a run is already going."""
+    if not _backfill_running.acquire(blocking=False):
+        return
+
+    def run(db):
+        try:
+            if primary(db).child("rating_backfill").shallow().get().val():
+                backfill_pending_ratings(db)
+        except Exception as e:
+            print(f"[RATINGS] Backfill failed: {e}")
+        finally:
+            _backfill_running.release()
+
+    _backfill_executor.submit(run, clone_db(db))
+
+def run_import_job(db: Database, uid: str, job_id: str, sessions: List[Dict[str, Any]]):
+    """Run import_sessions for a large upload, reporting progress under /import_jobs/<uid>/<job_id>."""
+    job_ref = lambda: db.child("import_jobs").child(uid).child(job_id)
+    try:
+        import_sessions(db, uid, sessions, progress=lambda imported: job_ref().update({"imported": imported}))
+        job_ref().update({"status": "done", "finishedAt": datetime.now().isoformat()})
+    except Exception as e:
+        print(f"[IMPORT] Job {job_id} for {uid} failed: {e}")
+        job_ref().update({"status": "failed", "error": str(e)})
 
 
 def toggle_like(db: Database, session_id: str, uid: str) -> Dict[str, Any]:
     """Toggle like for a session by a user and return updated counts/state."""
-    session_ref = db.child("sessions").child(session_id)
-    session = session_ref.get().val()
+    shard = for_session(db, session_id)
+    session = ensure_migrated(shard, session_id)
     if not session:
         raise ValueError("Session not found")
 
-    likes = session.get("likes", {}) or {}
-    if uid in likes:
-        likes.pop(uid, None)
-        liked = False
-    else:
-        likes[uid] = True
-        liked = True
-
-    session_ref.update({"likes": likes})
-    like_count = len(likes)
+    current = shard.child(DETAILS).child(session_id).child("likes").child(uid).get().val()
+    month = session.get("archived")
+    if current is None and month:
+        current = (archived_fields(shard, session.get("uid"), month, session_id).get("likes") or {}).get(uid)
+    liked = not current
+    updates = {
+        f"{DETAILS}/{session_id}/likes/{uid}": True if liked else None,
+        f"{SUMMARIES}/{session_id}/like_count": increment(1 if liked else -1),
+    }
+    if month:
+        # False overrides a like kept in the archive blob; the next archive run folds both in
+        updates[f"{DETAILS}/{session_id}/likes/{uid}"] = liked
+        updates[f"{ARCHIVE_REQUEUE}/{session_id}"] = session.get("uid")
+    shard.update(updates)
+    record_change(db, "sessions", session_id, owner=session.get("uid"), privacy=session.get("privacy", "friends"))
+    if liked:
+        notify(db, session.get("uid"), "like", session_id, uid, context=_round_context(session))
+    like_count = max(0, (session.get("like_count") or 0) + (1 if liked else -1))
     return {"liked": liked, "like_count": like_count}
 
 
@@ -289,12 +622,12 @@ def add_comment(db: Database, session_id: str, uid: str, username: str, text: st
     if not text.strip():
         raise ValueError("Comment cannot be empty")
 
-    session_ref = db.child("sessions").child(session_id)
-    session = session_ref.get().val()
+    shard = for_session(db, session_id)
+    session = ensure_migrated(shard, session_id)
     if not session:
         raise ValueError("Session not found")
 
-    comment_id = datetime.now().isoformat()
+    comment_id = push_id()
     comment = {
         "id": comment_id,
         "uid": uid,
@@ -303,33 +636,27 @@ def add_comment(db: Database, session_id: str, uid: str, username: str, text: st
         "timestamp": datetime.now().isoformat(),
     }
 
-    existing_comments = session.get("comments", {}) or {}
-    existing_comments[comment_id] = comment
-    session_ref.update({"comments": existing_comments})
+    updates = {
+        f"{DETAILS}/{session_id}/comments/{comment_id}": comment,
+        f"{SUMMARIES}/{session_id}/comment_count": increment(1),
+    }
+    if session.get("archived"):
+        updates[f"{ARCHIVE_REQUEUE}/{session_id}"] = session.get("uid")
+    shard.update(updates)
+    record_change(db, "sessions", session_id, owner=session.get("uid"), privacy=session.get("privacy", "friends"))
+    notify(db, session.get("uid"), "comment", session_id, uid, username, preview=comment["text"], context=_round_context(session))
 
     return comment
 
-def get_user_sessions(db: Database, uid, limit=None):
-    """Get all sessions for a specific user"""
-    sessions = db.child("sessions").get()
-    results = []
-
-    if sessions.each():
-        for s in sessions.each():
-            data = s.val()
-            if data.get("uid") == uid:
-                results.append({
-                    "id": s.key(),
-                    **data
-                })
+def _round_context(session: Dict[str, Any]) -> str | None:
+    return f"at {session['courseName']}" if session.get("courseName") else None
 
-    # Sort by timestamp descending (most recent first)
-    results.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-
-    if limit:
-        results = results[:limit]
+def get_user_sessions(db: Database, uid, limit=None):
+    """Get the summaries of a user's sessions (full records come from get_session)"""
+    sessions = scan_summaries(for_uid(db, uid), uid=uid)
 
-    return results
+    # Most recent first, keeping only `limit` records while scanning
+    return newest_first(sessions, limit)
 
 def get_feed_sessions(db: Database, uid, limit=20):
     """
@@ -338,71 +665,71 @@ def get_feed_sessions(db: Database, uid, limit=20):
     - Friends' sessions (if not private)
     - League members' sessions (future)
     """
-    friends = get_friends(db, uid)
-    sessions = db.child("sessions").get()
-    results = []
-
-    if sessions.each():
-        for s in sessions.each():
-            data = s.val()
-            session_uid = data.get("uid")
-            privacy = data.get("privacy", "friends")
-
-            # Include if:
-            # 1. It's user's own session
-            # 2. It's a friend's session and privacy is not "private"
-            # 3. It's a public session
-
-            if session_uid == uid:
-                # User's own sessions
-                results.append({
-                    "id": s.key(),
-                    **data
-                })
-            elif session_uid in friends and privacy in ["public", "friends"]:
-                # Friends' sessions
-                results.append({
-                    "id": s.key(),
-                    **data
-                })
-            elif privacy == "public":
-                # Public sessions from anyone
-                results.append({
-                    "id": s.key(),
-                    **data
-                })
-
-    # Sort by timestamp descending (most recent first)
-    results.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-
-    if limit:
-        results = results[:limit]
-
-    return results
+    friends = set(get_friends(db, uid))
+
+    def visible(data):
+        session_uid = data.get("uid")
+        privacy = data.get("privacy", "friends")
+
+        # Include if:
+        # 1. It's user's own session
+        # 2. It's a friend's session and privacy is not "private"
+        # 3. It's a public session
+        return (
+            session_uid == uid
+            or (session_uid in friends and privacy in ["public", "friends"])
+            or privacy == "public"
+        )
+
+    def shard_feed(shard: Database):
+        return newest_first(scan_summaries(shard, visible), limit)
+
+    # Each shard returns its newest matches; merge them (most recent first)
+    return newest_first((session for shard_results in fan_out(db, shard_feed) for session in shard_results), limit)
+
+def with_thumbnails(session: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Swap a session's images for their generated thumbnails, keeping the
+    full-resolution URLs under originalImages. Sessions whose media hasn't
+    been processed yet are returned unchanged.
+    """
+    thumbnails = session.get("thumbnails")
+    if not thumbnails:
+        return session
+    return {
+        **session,
+        "images": thumbnails,
+        "originalImages": session.get("images", []),
+    }
+
+def get_session(db: Database, session_id: str) -> Dict[str, Any] | None:
+    """Read a single session's full record from whichever shard holds it"""
+    return read_session(for_session(db, session_id), session_id)
+
+def get_session_summary(db: Database, session_id: str) -> Dict[str, Any] | None:
+    return read_summary(for_session(db, session_id), session_id)
 
 def delete_session(db: Database, session_id):
-    """Delete a golf session"""
-    db.child("sessions").child(session_id).remove()
+    """Delete a golf session (and its archived copy, if it has been archived)"""
+    shard = for_session(db, session_id)
+    session = read_summary(shard, session_id) or {}
+    if session.get("archived"):
+        remove_archived_session(shard, session.get("uid"), session["archived"], session_id)
+    shard.update(delete_updates(session_id))
+    primary(db).child("session_owners").child(session_id).remove()
+    record_change(db, "sessions", session_id, "delete", owner=session.get("uid"), privacy=session.get("privacy", "friends"))
 
 def get_user_leagues(db: Database, uid: str, id_token: str | None = None):
     """
     Return leagues the user belongs to.
     Each item includes id, name, creatorUid, and memberCount.
     """
-    leagues_snap = db.child("leagues").get(id_token)
     leagues = []
 
-    if leagues_snap.each():
-        for league in leagues_snap.each():
-            data = league.val() or {}
-            members = data.get("members") or {}
-            if uid in members:
-                leagues.append({
-                    "id": league.key(),
-                    "name": data.get("name"),
-                    "creatorUid": data.get("creatorUid"),
-                    "memberCount": len(members)
-                })
+    for league_id, data in scan(db.child("leagues"), id_token):
+        members = (data or {}).get("members") or {}
+        if uid in members:
+            leagues.append(_league_summary(league_id, data))
 
     return leagues
 
@@ -422,6 +749,7 @@ def create_league(db: Database, uid: str, league_name: str, member_uids: list |
         "createdAt": datetime.now().isoformat()
     }
     league_ref = db.child("leagues").push(league, id_token)
+    record_change(db, "leagues", league_ref["name"], members=members)
     return league_ref["name"]  # Return the league ID
 
 def join_league(db: Database, uid: str, league_id: str, id_token: str | None = None):
@@ -430,7 +758,95 @@ def join_league(db: Database, uid: str, league_id: str, id_token: str | None = N
     if not league:
         raise ValueError("League does not exist.")
     db.child("leagues").child(league_id).child("members").child(uid).set(True, id_token)
+    record_change(db, "leagues", league_id, members={**(league.get("members") or {}), uid: True})
+    username = db.child("users").child(uid).child("name").get().val()
+    notify_many(db, list(league.get("members") or {}), "league_join", league_id, uid, username,
+                context=league.get("name") or "your league")
 
 def delete_league(db: Database, league_id: str, id_token: str | None = None):
     """Delete a league"""
+    league = db.child("leagues").child(league_id).get(id_token).val() or {}
     db.child("leagues").child(league_id).remove(id_token)
+    record_change(db, "leagues", league_id, "delete", members=league.get("members") or {})
+
+def _league_summary(league_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    members = data.get("members") or {}
+    return {
+        "id": league_id,
+        "name": data.get("name"),
+        "creatorUid": data.get("creatorUid"),
+        "memberCount": len(members)
+    }
+
+def read_leagues_many(db: Database, league_ids: List[str], id_token: str | None = None) -> List[Dict[str, Any] | None]:
+    """Several leagues read in parallel (one handle per read)."""
+    def read(league_id):
+        return clone_db(db).child("leagues").child(league_id).get(id_token).val()
+    return list(_sync_executor.map(propagate(read), league_ids))
+
+def sync_changes(db: Database, uid: str, since: str | None, id_token: str | None = None) -> Dict[str, Any]:
+    """
+    Return what changed for uid since a /sync cursor:
+    {"cursor", "full_resync", "has_more", "changes": {kind: {"upserts": [...], "deletes": [ids]}}}.
+
+    Sessions (as summaries) and leagues are returned as current records (re-checked against
+    privacy/membership, and turned into tombstones if no longer visible);
+    friends and friend_requests are returned as uids. A missing or compacted
+    cursor gets full_resync=True and a fresh cursor. Entries are filtered on
+    the visibility they carry first; the records still needed are then read
+    in parallel, sessions straight from their owner's shard.
+    """
+    if not is_valid_cursor(since) or is_stale(db, since):
+        return {"cursor": head_cursor(), "full_resync": True, "has_more": False, "changes": {}}
+
+    entries = read_changes(db, since, SYNC_PAGE_SIZE)
+    friends = set(get_friends(db, uid))
+
+    latest = {}
+    for _, entry in entries:
+        if not entry or not entry_visible(entry, uid, friends):
+            continue
+        entity_id = entry["id"]
+        if entry["kind"] == "friends":
+            entity_id = next((other for other in entry["uids"] if other != uid), entity_id)
+        latest[(entry["kind"], entity_id)] = entry
+
+    # Sessions grouped by their owner's shard (entries carry the owner, so no /session_owners lookups)
+    by_shard = {}
+    for (kind, entity_id), entry in latest.items():
+        if kind == "sessions" and entry["op"] != "delete":
+            shard = for_uid(db, entry["owner"]) if entry.get("owner") else for_session(db, entity_id)
+            by_shard.setdefault(shard.database_url, (shard, []))[1].append(entity_id)
+    summaries = {}
+    for shard, session_ids in by_shard.values():
+        summaries.update(zip(session_ids, read_summaries_many(shard, session_ids)))
+    league_ids = [entity_id for (kind, entity_id), entry in latest.items() if kind == "leagues" and entry["op"] != "delete"]
+    leagues = dict(zip(league_ids, read_leagues_many(db, league_ids, id_token)))
+
+    changes = {kind: {"upserts": [], "deletes": []} for kind in ("sessions", "friends", "friend_requests", "leagues")}
+    for (kind, entity_id), entry in latest.items():
+        op = entry["op"]
+        record = entity_id
+        if op != "delete" and kind == "sessions":
+            data = summaries.get(entity_id)
+            visible = data and entry_visible(
+                {"kind": kind, "owner": data.get("uid"), "privacy": data.get("privacy", "friends")}, uid, friends
+            )
+            record = {"id": entity_id, **data} if visible else None
+        elif op != "delete" and kind == "leagues":
+            data = leagues.get(entity_id)
+            record = _league_summary(entity_id, data) if data and uid in (data.get("members") or {}) else None
+
+        if op == "delete" or record is None:
+            changes[kind]["deletes"].append(entity_id)
+        else:
+            changes[kind]["upserts"].append(record)
+
+    keys = [key for key, _ in entries]
+    cursor = settled_cursor(since, keys)
+    return {
+        "cursor": cursor,
+        "full_resync": False,
+        "has_more": len(keys) == SYNC_PAGE_SIZE and cursor == keys[-1],
+        "changes": changes,
+    }
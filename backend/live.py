@@ -0,0 +1,551 @@
+"""
+Live rounds: hole-by-hole scores while a round is being played.
+
+A live round is stored at /live_rounds/<round_id> on its player's shard, and
+/live_round_owners/<round_id> = uid on shard 0 records where to find it. Each
+hole is one small write, {"scores/<hole>": score, "t": <server time>}, made
+after a read of the round's stored status (a few bytes) shows it still
+"live", so holes can't be added to a round finished through another
+worker. Finishing claims the round first: it is set to
+"finishing" with a new sessionId, behind an ETag check, and then
+create_session saves it under that id. Concurrent or retried finishes all
+write that one session.
+
+Every worker keeps the live rounds, plus one LiveBoard per league, in
+memory. A worker applies its own writes straight away. A poller picks up
+rounds written through other workers while anyone on this worker is
+watching. It reads only the rounds changed since its last pass: rounds are
+ordered by "t", with one query per shard every LIVE_POLL_SECONDS. Scores
+are set per hole, so applying an update twice does no harm. Boards update
+running totals per hole and serialize their standings once per change.
+Every SSE viewer is sent that same snapshot. Only public rounds go on
+league boards. Each stream holds a worker thread, so a worker serves at most
+LIVE_MAX_STREAMS of them at once.
+
+Clean up finished and abandoned rounds:  python live.py expire --hours 12
+"""
+from pyrebase.pyrebase import Database
+from typing import Any, Callable, Dict, Iterator
+from datetime import datetime
+from functions import create_session, get_user_leagues, are_friends, clone_db
+from shards import for_uid, primary, all_shards
+from changelog import push_id
+from session_store import conflict
+
+import argparse
+import json
+import os
+import threading
+import time
+
+LIVE_POLL_SECONDS = 2.0
+LIVE_POLL_OVERLAP_MS = 5000  # Re-read this much before the last change seen, so late writes aren't missed
+LIVE_POLL_IDLE_SECONDS = 60  # The poller stops after this long without viewers
+LIVE_ROUND_TTL_HOURS = 12
+LIVE_FINISHED_LINGER_SECONDS = 600  # Finished rounds stay on boards this long
+LIVE_STREAM_MAX_SECONDS = 600  # Streams close after this long; EventSource clients reconnect
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_MAX_STREAMS = int(os.getenv("LIVE_MAX_STREAMS", "50"))  # Open SSE streams per worker
+LIVE_STREAM_RETRY_SECONDS = 30
+LIVE_WRITE_ATTEMPTS = 10  # Conditional writes retried on a concurrent change
+PAR_PER_HOLE = 4  # No per-hole pars yet; to_par assumes par 4 like the feed's par 72/36
+MAX_HOLE_SCORE = 20
+
+SERVER_TIMESTAMP = {".sv": "timestamp"}
+
+
+class RoundNotFound(ValueError):
+    def __init__(self):
+        super().__init__("Round not found")
+
+
+class RoundBusy(ValueError):
+    def __init__(self):
+        super().__init__("Round is being updated elsewhere, try again")
+
+
+class LiveStreamsFull(Exception):
+    def __init__(self):
+        super().__init__("Too many live viewers right now, try again shortly")
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _scores(raw) -> Dict[int, int]:
+    """RTDB returns a 1..n keyed map as a list; either way give {hole: score}."""
+    if isinstance(raw, list):
+        return {hole: score for hole, score in enumerate(raw) if score is not None}
+    return {int(hole): score for hole, score in (raw or {}).items() if score is not None}
+
+
+def _holes(record: Dict[str, Any]) -> list:
+    return record.get("selectedHoles") or list(range(1, (record.get("holes") or 18) + 1))
+
+
+class LiveRound:
+    """One round's running total, updated a hole at a time."""
+
+    def __init__(self, round_id: str, record: Dict[str, Any]):
+        self.id = round_id
+        self.scores = {}
+        self.total = 0
+        self.version = 0
+        self.update_meta(record)
+
+    def update_meta(self, record: Dict[str, Any]):
+        self.uid = record.get("uid")
+        self.username = record.get("username")
+        self.course_name = record.get("courseName")
+        self.holes = record.get("holes")
+        self.valid_holes = set(_holes(record))
+        self.privacy = record.get("privacy", "friends")
+        self.leagues = set(record.get("leagues") or {})
+        self.status = record.get("status", "live")
+        self.session_id = record.get("sessionId")
+        self.touched = time.monotonic()
+
+    def set_score(self, hole: int, score: int | None) -> bool:
+        old = self.scores.get(hole)
+        if old == score:
+            return False
+        self.total += (score or 0) - (old or 0)
+        if score is None:
+            self.scores.pop(hole, None)
+        else:
+            self.scores[hole] = score
+        self.touched = time.monotonic()
+        return True
+
+    def standing(self) -> Dict[str, Any]:
+        thru = len(self.scores)
+        standing = {
+            "roundId": self.id,
+            "uid": self.uid,
+            "username": self.username,
+            "courseName": self.course_name,
+            "holes": self.holes,
+            "status": self.status,
+            "total": self.total,
+            "thru": thru,
+            "to_par": self.total - PAR_PER_HOLE * thru,
+        }
+        if self.session_id:
+            standing["sessionId"] = self.session_id
+        return standing
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.standing(), "privacy": self.privacy, "scores": {str(hole): score for hole, score in sorted(self.scores.items())}}
+
+
+class LiveBoard:
+    """A league's live leaderboard: the rounds on it and its standings, serialized once per version."""
+
+    def __init__(self, league_id: str):
+        self.league_id = league_id
+        self.round_ids = set()
+        self.version = 0
+        self._serialized = (None, None)
+
+    def serialized(self, rounds: Dict[str, LiveRound]) -> str:
+        version, data = self._serialized
+        if version != self.version:
+            entries = [rounds[rid].standing() for rid in self.round_ids if rid in rounds]
+            entries.sort(key=lambda entry: (entry["status"] != "live", entry["to_par"], -entry["thru"]))
+            data = json.dumps({"leagueId": self.league_id, "version": self.version, "standings": entries}, separators=(",", ":"))
+            self._serialized = (self.version, data)
+        return data
+
+
+class LiveState:
+    """This worker's live rounds and league boards; stream waiters block on `changed`."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.rounds: Dict[str, LiveRound] = {}
+        self.boards: Dict[str, LiveBoard] = {}
+        self.watchers = 0
+        self.last_watched = time.monotonic()
+        self.poller = None
+        self.loaded = False
+        self.last_t = {}  # Shard URL -> newest "t" seen
+
+    def board(self, league_id: str) -> LiveBoard:
+        board = self.boards.get(league_id)
+        if board is None:
+            board = self.boards[league_id] = LiveBoard(league_id)
+        return board
+
+    def _touch(self, live_round: LiveRound):
+        live_round.version += 1
+        for league_id in live_round.leagues:
+            self.board(league_id).version += 1
+
+    def apply_record(self, round_id: str, record: Dict[str, Any]) -> LiveRound:
+        """Bring a round in line with its stored record (safe to repeat)."""
+        with self.lock:
+            live_round = self.rounds.get(round_id)
+            if live_round is None:
+                live_round = self.rounds[round_id] = LiveRound(round_id, record)
+                changed = True
+            else:
+                before = (live_round.status, live_round.privacy, live_round.leagues)
+                live_round.update_meta(record)
+                changed = before != (live_round.status, live_round.privacy, live_round.leagues)
+
+            scores = _scores(record.get("scores"))
+            for hole in set(live_round.scores) | set(scores):
+                changed = live_round.set_score(hole, scores.get(hole)) or changed
+
+            # League members aren't necessarily the player's friends, so only public rounds go on boards
+            on_boards = live_round.leagues if live_round.privacy == "public" and live_round.status != "abandoned" else set()
+            for league_id, board in self.boards.items():
+                if league_id not in on_boards and round_id in board.round_ids:
+                    board.round_ids.discard(round_id)
+                    board.version += 1
+            for league_id in on_boards:
+                self.board(league_id).round_ids.add(round_id)
+            if changed:
+                self._touch(live_round)
+                self.changed.notify_all()
+            return live_round
+
+    def apply_score(self, round_id: str, hole: int, score: int | None):
+        with self.lock:
+            live_round = self.rounds.get(round_id)
+            if live_round and live_round.set_score(hole, score):
+                self._touch(live_round)
+                self.changed.notify_all()
+
+    def prune(self):
+        """Drop rounds that finished a while ago or stopped updating."""
+        now = time.monotonic()
+        with self.lock:
+            for round_id, live_round in list(self.rounds.items()):
+                age = now - live_round.touched
+                if (live_round.status != "live" and age > LIVE_FINISHED_LINGER_SECONDS) or age > LIVE_ROUND_TTL_HOURS * 3600:
+                    del self.rounds[round_id]
+                    for board in self.boards.values():
+                        if round_id in board.round_ids:
+                            board.round_ids.discard(round_id)
+                            board.version += 1
+            for league_id in [lid for lid, board in self.boards.items() if not board.round_ids]:
+                del self.boards[league_id]
+            self.changed.notify_all()
+
+
+state = LiveState()
+
+
+def _poll_once(db: Database):
+    for shard in all_shards(db):
+        url = shard.database_url
+        since = state.last_t.get(url, _now_ms() - LIVE_ROUND_TTL_HOURS * 3600 * 1000)
+        changed = shard.child("live_rounds").order_by_child("t").start_at(since - LIVE_POLL_OVERLAP_MS).get().val() or {}
+        for round_id, record in changed.items():
+            if isinstance(record, dict):
+                state.apply_record(round_id, record)
+                state.last_t[url] = max(state.last_t.get(url, 0), record.get("t") or 0)
+        state.last_t.setdefault(url, since)
+    state.loaded = True
+
+
+def _poll_loop(db: Database):
+    while True:
+        with state.lock:
+            if state.watchers == 0 and time.monotonic() - state.last_watched > LIVE_POLL_IDLE_SECONDS:
+                state.poller = None
+                return
+        try:
+            _poll_once(db)
+            state.prune()
+        except Exception as e:
+            print(f"[LIVE] Poll failed: {e}")
+        time.sleep(LIVE_POLL_SECONDS)
+
+
+def _ensure_poller(db: Database):
+    if not state.loaded:
+        _poll_once(db)  # The first viewer gets a full board, not an empty one
+    with state.lock:
+        if state.poller is None:
+            state.poller = threading.Thread(target=_poll_loop, args=(clone_db(db),), name="live-poller", daemon=True)
+            state.poller.start()
+
+
+def _round_ref(db: Database, uid: str, round_id: str) -> Database:
+    return for_uid(db, uid).child("live_rounds").child(round_id)
+
+
+def _check_owner(record, uid: str) -> Dict[str, Any]:
+    if not isinstance(record, dict) or record.get("uid") != uid:
+        raise RoundNotFound()
+    return record
+
+
+def _read_round(db: Database, uid: str, round_id: str) -> Dict[str, Any]:
+    return _check_owner(_round_ref(db, uid, round_id).get().val(), uid)
+
+
+def start_live_round(db: Database, uid: str, round_data: Dict[str, Any]) -> str:
+    """Start a live round for uid and return its id. Its league boards are the leagues uid is in now."""
+    course_name = (round_data.get("courseName") or "").strip()
+    if not course_name:
+        raise ValueError("Missing courseName")
+    holes = int(round_data.get("holes") or 18)
+    if holes not in (9, 18):
+        raise ValueError("holes must be 9 or 18")
+    selected = [int(hole) for hole in round_data.get("selectedHoles") or []] or None
+    privacy = round_data.get("privacy") if round_data.get("privacy") in ("public", "friends", "private") else "friends"
+
+    username = primary(db).child("users").child(uid).child("name").get().val() or "Unknown"
+    leagues = {league["id"]: True for league in get_user_leagues(db, uid)}
+
+    round_id = push_id()
+    record = {
+        "uid": uid,
+        "username": username,
+        "courseName": course_name,
+        "holes": holes,
+        "selectedHoles": selected,
+        "privacy": privacy,
+        "leagues": leagues,
+        "status": "live",
+        "startedAt": datetime.now().isoformat(),
+        "t": SERVER_TIMESTAMP,
+    }
+    # Register the owner first so the round is never unreachable by id
+    primary(db).child("live_round_owners").child(round_id).set(uid)
+    for_uid(db, uid).child("live_rounds").child(round_id).set(record)
+    state.prune()
+    state.apply_record(round_id, {**record, "t": _now_ms()})
+    print(f"[LIVE] {uid} started round {round_id} at {course_name}")
+    return round_id
+
+
+def update_live_hole(db: Database, uid: str, round_id: str, hole: int, score: int | None) -> Dict[str, Any]:
+    """Set (or with score=None, clear) one hole's score. Returns the round's running total."""
+    if score is not None and not 1 <= score <= MAX_HOLE_SCORE:
+        raise ValueError(f"Score must be between 1 and {MAX_HOLE_SCORE}")
+
+    with state.lock:
+        live_round = state.rounds.get(round_id)
+        known = live_round is not None and live_round.uid == uid
+    # Memory may be behind a finish made through another worker, so the stored status decides
+    if known:
+        status = _round_ref(db, uid, round_id).child("status").get().val()
+        if status is None:
+            raise RoundNotFound()
+    else:
+        record = _read_round(db, uid, round_id)
+        status = record.get("status", "live")
+        live_round = state.apply_record(round_id, record)
+    if status != "live":
+        raise ValueError("Round is already finished")
+    if hole not in live_round.valid_holes:
+        raise ValueError("Invalid hole")
+
+    for_uid(db, uid).update({
+        f"live_rounds/{round_id}/scores/{hole}": score,
+        f"live_rounds/{round_id}/t": SERVER_TIMESTAMP,
+    })
+    state.apply_score(round_id, hole, score)
+    return {"total": live_round.total, "thru": len(live_round.scores)}
+
+
+def finish_live_round(db: Database, uid: str, round_id: str, final: Dict[str, Any]) -> str:
+    """
+    Save a live round as a session and mark it finished. final may carry the
+    client's full scores (which win over the stored deltas), duration,
+    privacy, images and videos. Returns the new session id.
+    """
+    current = _round_ref(db, uid, round_id).get_etag()
+    for _ in range(LIVE_WRITE_ATTEMPTS):
+        record = _check_owner(current["value"], uid)
+        status = record.get("status", "live")
+        if status == "finished" and record.get("sessionId"):
+            return record["sessionId"]  # Finish retried after it succeeded
+        if status not in ("live", "finishing"):
+            raise ValueError("Round is already finished")
+        if record.get("sessionId"):
+            break  # Claimed by a finish that didn't complete: save the round under its id
+        claimed = {**record, "status": "finishing", "sessionId": push_id(), "t": SERVER_TIMESTAMP}
+        result = _round_ref(db, uid, round_id).conditional_set(claimed, current["ETag"])
+        if not conflict(result):
+            record = claimed
+            break
+        current = result
+    else:
+        raise RoundBusy()
+
+    scores = _scores(final.get("scores") or record.get("scores"))
+    if not scores:
+        raise ValueError("Round has no scores")
+    now = datetime.now()
+    started = record.get("startedAt")
+    try:
+        duration = int(final.get("duration") or (now - datetime.fromisoformat(started)).total_seconds())
+    except (TypeError, ValueError):
+        duration = 0
+
+    session_id = create_session(db, uid, {
+        "courseName": record.get("courseName"),
+        "holes": record.get("holes"),
+        "selectedHoles": record.get("selectedHoles"),
+        "scores": {str(hole): score for hole, score in sorted(scores.items())},
+        "totalScore": sum(scores.values()),
+        "duration": duration,
+        "startTime": started,
+        "endTime": now.isoformat(),
+        "privacy": final.get("privacy") or record.get("privacy", "friends"),
+        "images": final.get("images") or [],
+        "videos": final.get("videos") or [],
+    }, session_id=record["sessionId"])
+    _close_round(db, uid, round_id, record, "finished", session_id)
+    return session_id
+
+
+def discard_live_round(db: Database, uid: str, round_id: str):
+    record = _read_round(db, uid, round_id)
+    _close_round(db, uid, round_id, record, "abandoned")
+
+
+def _close_round(db, uid, round_id, record, status, session_id=None):
+    updates = {f"live_rounds/{round_id}/status": status, f"live_rounds/{round_id}/t": SERVER_TIMESTAMP}
+    if session_id:
+        updates[f"live_rounds/{round_id}/sessionId"] = session_id
+    for_uid(db, uid).update(updates)
+    state.apply_record(round_id, {**record, "status": status, "sessionId": session_id})
+
+
+def _round_owner(db: Database, round_id: str) -> str | None:
+    return primary(db).child("live_round_owners").child(round_id).get().val()
+
+
+def get_live_round(db: Database, viewer_uid: str, round_id: str) -> Dict[str, Any] | None:
+    """A round's current state if viewer_uid may see it (owner, friends unless private, anyone if public)."""
+    owner = _round_owner(db, round_id)
+    if not owner:
+        return None
+    record = for_uid(db, owner).child("live_rounds").child(round_id).get().val()
+    if not record:
+        return None
+    privacy = record.get("privacy", "friends")
+    if owner != viewer_uid and privacy != "public":
+        if privacy == "private" or not are_friends(db, owner, viewer_uid):
+            return None
+    return state.apply_record(round_id, record).snapshot()
+
+
+def is_league_member(db: Database, uid: str, league_id: str) -> bool:
+    return bool(db.child("leagues").child(league_id).child("members").child(uid).get().val())
+
+
+def get_live_board(db: Database, league_id: str) -> str:
+    """The league's live standings as JSON, served from memory."""
+    with state.lock:
+        state.last_watched = time.monotonic()
+    _ensure_poller(db)
+    with state.lock:
+        return state.board(league_id).serialized(state.rounds)
+
+
+class _EventStream:
+    """An SSE body holding one of the worker's LIVE_MAX_STREAMS slots until it is closed (or never started)."""
+
+    def __init__(self, events: Iterator[str]):
+        self.events = events
+        self.open = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return next(self.events)
+
+    def close(self):
+        self.events.close()
+        with state.lock:
+            if self.open:
+                self.open = False
+                state.watchers -= 1
+                state.last_watched = time.monotonic()
+
+
+def _event_stream(db: Database, event: str, version: Callable[[], int], payload: Callable[[], str | None]) -> _EventStream:
+    """Raises LiveStreamsFull when this worker already serves LIVE_MAX_STREAMS streams."""
+    with state.lock:
+        if state.watchers >= LIVE_MAX_STREAMS:
+            raise LiveStreamsFull()
+        state.watchers += 1
+    return _EventStream(_events(db, event, version, payload))
+
+
+def _events(db: Database, event: str, version: Callable[[], int], payload: Callable[[], str | None]) -> Iterator[str]:
+    _ensure_poller(db)
+    yield f"retry: {int(LIVE_POLL_SECONDS * 1000)}\n\n"
+    seen = None
+    closes_at = time.monotonic() + LIVE_STREAM_MAX_SECONDS
+    while time.monotonic() < closes_at:
+        with state.changed:
+            state.changed.wait_for(lambda: version() != seen, timeout=LIVE_HEARTBEAT_SECONDS)
+            current = version()
+            data = payload() if current != seen else None
+        if data is None:
+            yield ": keepalive\n\n"
+            continue
+        seen = current
+        yield f"event: {event}\ndata: {data}\n\n"
+
+
+def league_board_stream(db: Database, league_id: str) -> _EventStream:
+    """SSE events ("board") with the league's standings each time they change."""
+    def version():
+        board = state.boards.get(league_id)
+        return board.version if board else 0
+
+    def payload():
+        return state.board(league_id).serialized(state.rounds)
+
+    return _event_stream(db, "board", version, payload)
+
+
+def round_stream(db: Database, round_id: str) -> _EventStream:
+    """SSE events ("round") with one round's scores and running total each time they change."""
+    def version():
+        live_round = state.rounds.get(round_id)
+        return live_round.version if live_round else -1
+
+    def payload():
+        live_round = state.rounds.get(round_id)
+        return json.dumps(live_round.snapshot(), separators=(",", ":")) if live_round else None
+
+    return _event_stream(db, "round", version, payload)
+
+
+def expire_live_rounds(db: Database, max_age_hours: float = LIVE_ROUND_TTL_HOURS) -> int:
+    """Remove live rounds (finished or not) untouched for max_age_hours. Returns the number removed."""
+    cutoff = _now_ms() - int(max_age_hours * 3600 * 1000)
+    removed = 0
+    for shard in all_shards(db):
+        stale = shard.child("live_rounds").order_by_child("t").end_at(cutoff).get().val() or {}
+        if not stale:
+            continue
+        shard.update({f"live_rounds/{round_id}": None for round_id in stale})
+        primary(db).update({f"live_round_owners/{round_id}": None for round_id in stale})
+        removed += len(stale)
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live round maintenance.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    expire_parser = subparsers.add_parser("expire", help="Remove finished and abandoned live rounds")
+    expire_parser.add_argument("--hours", type=float, default=LIVE_ROUND_TTL_HOURS)
+    args = parser.parse_args()
+
+    from app import get_db
+    count = expire_live_rounds(get_db(), args.hours)
+    print(f"[LIVE] Removed {count} live rounds older than {args.hours} hours")
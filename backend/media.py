@@ -0,0 +1,251 @@
+from pyrebase.pyrebase import Database
+from typing import Dict, Any, List
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+from PIL import Image, ImageOps
+from functions import clone_db
+from changelog import record_change
+from shards import for_session
+from session_store import SUMMARIES, DETAILS, ensure_migrated
+
+import os
+import secrets
+import shutil
+import subprocess
+import requests
+
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"))
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "http://127.0.0.1:5001/media")
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+MAX_MEDIA_BYTES = 50 * 1024 * 1024
+# Originals are only fetched from the app's Storage bucket (download URLs look like
+# https://firebasestorage.googleapis.com/v0/b/<bucket>/o/<path>?alt=media&token=...)
+STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET", "")
+STORAGE_HOSTS = {"firebasestorage.googleapis.com": "/v0/b/{bucket}/o/", "storage.googleapis.com": "/{bucket}/"}
+
+THUMBNAIL_SIZE = 320  # Feed thumbnails fit inside a 320x320 box
+VARIANT_WIDTHS = (640, 1080)  # Responsive widths for full-screen viewing
+IMAGE_FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+POSTER_OFFSET_SECONDS = 1
+# /media needs no auth, so keys carry a random part: only viewers of the session's record
+# learn the URLs. They're cached privately and briefly, so deleting a file revokes it.
+MEDIA_CACHE_SECONDS = 3600
+
+_executor = None
+
+
+class MediaStorage(ABC):
+    """Where generated derivatives live. Subclasses return a public URL from save()."""
+
+    @abstractmethod
+    def save(self, key: str, data: bytes, content_type: str) -> str:
+        ...
+
+    @abstractmethod
+    def url_for(self, key: str) -> str:
+        ...
+
+
+class LocalMediaStorage(MediaStorage):
+    """Stores derivatives on the local filesystem, served by the /media route."""
+
+    def __init__(self, root: str = MEDIA_ROOT, base_url: str = MEDIA_BASE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def save(self, key: str, data: bytes, content_type: str) -> str:
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self.url_for(key)
+
+    def url_for(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+
+def get_storage() -> MediaStorage:
+    return LocalMediaStorage()
+
+
+def is_storage_url(url: str) -> bool:
+    """True if url is an https URL for an object in our Storage bucket."""
+    if not STORAGE_BUCKET or not isinstance(url, str):
+        return False
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return False
+    prefix = STORAGE_HOSTS.get(parts.hostname or "")
+    return (parts.scheme == "https" and prefix is not None and port in (None, 443)
+            and not parts.username and parts.path.startswith(prefix.format(bucket=STORAGE_BUCKET)))
+
+
+def _download(url: str) -> bytes:
+    if not is_storage_url(url):
+        raise ValueError(f"Not a Storage URL: {url}")
+    response = requests.get(url, timeout=30, stream=True, allow_redirects=False)
+    response.raise_for_status()
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        size += len(chunk)
+        if size > MAX_MEDIA_BYTES:
+            raise ValueError(f"Media too large: {url}")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    pil_format, _ = IMAGE_FORMATS[fmt]
+    out = BytesIO()
+    if pil_format == "JPEG":
+        image.convert("RGB").save(out, pil_format, quality=82, optimize=True, progressive=True)
+    else:
+        image.save(out, pil_format, quality=80, method=4)
+    return out.getvalue()
+
+
+def build_image_derivatives(data: bytes) -> Dict[str, Image.Image]:
+    """
+    Return resized copies of an image keyed by variant name:
+    "thumb" plus one "w<width>" per VARIANT_WIDTHS entry narrower than the original.
+    """
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        variants = {}
+        thumb = image.copy()
+        thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        variants["thumb"] = thumb
+
+        for width in VARIANT_WIDTHS:
+            if width >= image.width:
+                continue
+            height = round(image.height * width / image.width)
+            variants[f"w{width}"] = image.resize((width, height), Image.LANCZOS)
+        return variants
+
+
+def _store_image(storage: MediaStorage, prefix: str, data: bytes) -> Dict[str, Any]:
+    """Generate and store every derivative of one image; returns their URLs."""
+    stored = {"variants": {}}
+    for name, image in build_image_derivatives(data).items():
+        urls = {}
+        for fmt, (_, content_type) in IMAGE_FORMATS.items():
+            urls[fmt] = storage.save(f"{prefix}-{name}.{fmt}", _encode(image, fmt), content_type)
+        if name == "thumb":
+            stored["thumbnail"] = urls["jpg"]
+            stored["thumbnailWebp"] = urls["webp"]
+        else:
+            stored["variants"][name] = urls
+    return stored
+
+
+def _object_prefix(session_id: str, name: str) -> str:
+    """Unguessable key prefix for one image's or poster's derivatives."""
+    return f"sessions/{session_id}/{secrets.token_urlsafe(16)}/{name}"
+
+
+def extract_poster_frame(url: str) -> bytes | None:
+    """Grab a single frame from a video with ffmpeg; None if ffmpeg is unavailable or fails."""
+    if not is_storage_url(url):
+        print(f"[MEDIA] Skipping poster for non-Storage URL {url}")
+        return None
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    try:
+        # The whitelist keeps ffmpeg (and any playlist it opens) from reading file:, concat: and the like
+        result = subprocess.run(
+            [ffmpeg, "-loglevel", "error", "-protocol_whitelist", "https,tls,tcp",
+             "-ss", str(POSTER_OFFSET_SECONDS), "-i", url,
+             "-frames:v", "1", "-f", "image2pipe", "-vcodec", "png", "-"],
+            capture_output=True,
+            timeout=60,
+            check=True,
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"[MEDIA] Poster extraction failed for {url}: {e}")
+        return None
+    return result.stdout or None
+
+
+def generate_session_media(db: Database, session_id: str, images: List[str], videos: List[str],
+                           storage: MediaStorage | None = None) -> Dict[str, Any]:
+    """
+    Build thumbnails, width variants and video posters for a session and record
+    their URLs on the session's details, with the first thumbnail as the
+    summary's cover. Failures on one item don't stop the rest.
+    """
+    storage = storage or get_storage()
+    media = {"images": [], "videos": []}
+
+    for i, url in enumerate(images or []):
+        entry = {"original": url}
+        try:
+            entry.update(_store_image(storage, _object_prefix(session_id, f"image-{i}"), _download(url)))
+        except Exception as e:
+            print(f"[MEDIA] Failed to process image {url}: {e}")
+        media["images"].append(entry)
+
+    for i, url in enumerate(videos or []):
+        entry = {"original": url}
+        frame = extract_poster_frame(url)
+        if frame:
+            try:
+                stored = _store_image(storage, _object_prefix(session_id, f"video-{i}-poster"), frame)
+                entry["poster"] = stored["thumbnail"]
+                entry["posterWebp"] = stored["thumbnailWebp"]
+                entry["variants"] = stored["variants"]
+            except Exception as e:
+                print(f"[MEDIA] Failed to process poster for {url}: {e}")
+        media["videos"].append(entry)
+
+    thumbnails = [entry.get("thumbnail", entry["original"]) for entry in media["images"]]
+    shard = for_session(db, session_id)
+    session = ensure_migrated(shard, session_id)
+    if not session:
+        print(f"[MEDIA] Session {session_id} was deleted before its media was ready")
+        return media
+    updates = {
+        f"{DETAILS}/{session_id}/media": media,
+        f"{DETAILS}/{session_id}/thumbnails": thumbnails,
+    }
+    if thumbnails:
+        updates[f"{SUMMARIES}/{session_id}/cover"] = thumbnails[0]
+    shard.update(updates)
+    record_change(db, "sessions", session_id, owner=session.get("uid"), privacy=session.get("privacy", "friends"))
+    return media
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+    return _executor
+
+
+def _run_session_media(db: Database, session_id: str, images: List[str], videos: List[str]):
+    try:
+        generate_session_media(db, session_id, images, videos)
+    except Exception as e:
+        print(f"[MEDIA] Media pipeline failed for session {session_id}: {e}")
+
+
+def submit_session_media(db: Database, session_id: str, images: List[str], videos: List[str]):
+    """
+    Queue derivative generation for a newly created session.
+
+    Runs on the media worker pool so the request returns immediately.
+    """
+    if not images and not videos:
+        return None
+    return _get_executor().submit(_run_session_media, clone_db(db), session_id, images, videos)
@@ -0,0 +1,248 @@
+"""
+Per-user notification inbox.
+
+Events are fanned out at write time into the recipient's inbox at
+/notifications/<uid> (on the recipient's shard):
+
+  items/<kind>~<target>  one coalesced item per kind and target, e.g. all likes
+                         on a round since it was last read become a single
+                         "Sam and 12 others liked your round"
+  meta                   {unread, size, last_read}
+
+An item is unread when its "updated" is newer than meta.last_read, so marking
+the inbox read is one write. The inbox keeps at most MAX_INBOX_ITEMS items;
+the oldest are trimmed once it grows TRIM_SLACK past that, which keeps the
+whole inbox small enough to return from a single read.
+
+Events are written on a background worker, off the request path. Each item
+is merged with an ETag-conditional write that is retried on a conflict, so
+concurrent events on one item are all counted. The counters then move by
+server-side increments, one multi-path update per shard when an event has
+many recipients (a new league member).
+"""
+from pyrebase.pyrebase import Database
+from typing import Dict, Any, List, Tuple
+from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from shards import ShardRouter, for_uid, primary
+from session_store import conflict
+
+MAX_INBOX_ITEMS = 50
+TRIM_SLACK = 10
+MAX_ACTORS_SHOWN = 3  # Names kept per item; the rest only count towards actor_count
+PREVIEW_LENGTH = 80
+NOTIFY_ATTEMPTS = 10  # Conditional writes retried on a concurrent change
+
+_fan_out_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="notify")
+
+# kind: (icon, title, "<actors> ..." phrase)
+NOTIFICATION_KINDS = {
+    "like": ("heart", "New Like", "liked your round"),
+    "comment": ("chatbubble-ellipses", "New Comment", "commented on your round"),
+    "friend_request": ("people", "Friend Request", "sent you a friend request"),
+    "friend_accept": ("people", "Friend Request Accepted", "accepted your friend request"),
+    "league_join": ("trophy", "League", "joined"),
+}
+
+
+def _increment(amount: int) -> Dict[str, Any]:
+    return {".sv": {"increment": amount}}
+
+
+def _actor_name(db: Database, uid: str) -> str:
+    return primary(db).child("users").child(uid).child("name").get().val() or "Someone"
+
+
+def notify(db: Database, recipient_uid: str, kind: str, target: str, actor_uid: str,
+           actor_name: str | None = None, preview: str | None = None, context: str | None = None):
+    """
+    Add an event to recipient_uid's inbox, folding it into the existing item
+    for the same kind and target while that item is still unread. Runs on
+    a background worker.
+
+    Failures are logged and swallowed: a missing notification must never fail
+    the like, comment or request that caused it.
+    """
+    return notify_many(db, [recipient_uid], kind, target, actor_uid, actor_name, preview, context)
+
+
+def notify_many(db: Database, recipient_uids: List[str], kind: str, target: str, actor_uid: str,
+                actor_name: str | None = None, preview: str | None = None, context: str | None = None):
+    """notify() for many recipients: their counters on each shard are updated with one multi-path write."""
+    recipients = [uid for uid in dict.fromkeys(recipient_uids) if uid and uid != actor_uid]
+    if not recipients:
+        return None
+    # The worker builds paths on its own handles
+    if isinstance(db, ShardRouter):
+        db = db.clone()
+    else:
+        db = Database(db.credentials, db.api_key, db.database_url, db.requests)
+    return _fan_out_executor.submit(_notify_many, db, recipients, kind, target, actor_uid, actor_name, preview, context)
+
+
+def _notify_many(db, recipients, kind, target, actor_uid, actor_name, preview, context):
+    try:
+        actor = {"uid": actor_uid, "name": actor_name or _actor_name(db, actor_uid)}
+        by_shard = defaultdict(list)
+        for uid in recipients:
+            by_shard[for_uid(db, uid)].append(uid)
+
+        for shard, uids in by_shard.items():
+            counters, trims = defaultdict(int), []
+            for uid in uids:
+                result = _coalesce(shard, uid, kind, target, actor, preview, context)
+                if result is None:
+                    continue
+                newly_unread, created, size = result
+                counters[f"notifications/{uid}/meta/unread"] += newly_unread
+                counters[f"notifications/{uid}/meta/size"] += created
+                if created and size + 1 > MAX_INBOX_ITEMS + TRIM_SLACK:
+                    trims.append(uid)
+            updates = {path: _increment(amount) for path, amount in counters.items() if amount}
+            if updates:
+                shard.update(updates)
+            for uid in trims:
+                _trim(shard, uid)
+    except Exception as e:
+        print(f"[NOTIFY] Failed to notify {len(recipients)} users of {kind} {target}: {e}")
+
+
+def _coalesce(shard: Database, recipient_uid: str, kind: str, target: str, actor: Dict[str, str],
+              preview: str | None, context: str | None) -> Tuple[bool, bool, int] | None:
+    """
+    Write the event into its item with an ETag-conditional write, re-reading
+    and re-merging on a conflict, so concurrent events on one item are all
+    counted. Returns (item became unread, item was created, inbox size
+    before), or None if every attempt conflicted.
+    """
+    inbox = lambda: shard.child("notifications").child(recipient_uid)
+    item_key = f"{kind}~{target}"
+    meta = inbox().child("meta").get().val() or {}
+    last_read = meta.get("last_read") or ""
+
+    current = inbox().child("items").child(item_key).get_etag()
+    for _ in range(NOTIFY_ATTEMPTS):
+        item = current["value"] if isinstance(current["value"], dict) else None
+        unread = bool(item) and item.get("updated", "") > last_read
+        if unread:
+            # Same burst: move the actor to the front and count them once
+            others = [a for a in item.get("actors") or [] if a.get("uid") != actor["uid"]]
+            repeat = len(others) < len(item.get("actors") or [])
+            actors = [actor] + others
+            actor_count = (item.get("actor_count") or 1) + (0 if repeat else 1)
+        else:
+            actors = [actor]
+            actor_count = 1
+
+        entry = {
+            "kind": kind,
+            "target": target,
+            "actors": actors[:MAX_ACTORS_SHOWN],
+            "actor_count": actor_count,
+            "updated": datetime.now().isoformat(),
+        }
+        if preview:
+            entry["preview"] = preview[:PREVIEW_LENGTH]
+        if context or (item or {}).get("context"):
+            entry["context"] = context or item["context"]
+
+        result = inbox().child("items").child(item_key).conditional_set(entry, current["ETag"])
+        if not conflict(result):
+            return not unread, not item, meta.get("size") or 0
+        current = result
+    print(f"[NOTIFY] Gave up on {item_key} for {recipient_uid} after {NOTIFY_ATTEMPTS} attempts")
+    return None
+
+
+def _trim(shard: Database, uid: str):
+    """
+    Drop the oldest items so the inbox is back to MAX_INBOX_ITEMS, taking them
+    off size and unread. The items are replaced with an ETag-conditional
+    write, so of two concurrent trims only one removes (and counts) anything.
+    """
+    items_ref = lambda: shard.child("notifications").child(uid).child("items")
+    last_read = shard.child("notifications").child(uid).child("meta").child("last_read").get().val() or ""
+    current = items_ref().get_etag()
+    for _ in range(NOTIFY_ATTEMPTS):
+        items = current["value"] if isinstance(current["value"], dict) else {}
+        oldest = sorted(items, key=lambda key: items[key].get("updated", ""))[:max(0, len(items) - MAX_INBOX_ITEMS)]
+        if not oldest:
+            return
+        kept = {key: item for key, item in items.items() if key not in oldest}
+        result = items_ref().conditional_set(kept, current["ETag"])
+        if not conflict(result):
+            break
+        current = result
+    else:
+        return
+
+    updates = {f"notifications/{uid}/meta/size": _increment(-len(oldest))}
+    dropped_unread = sum(1 for key in oldest if items[key].get("updated", "") > last_read)
+    if dropped_unread:
+        updates[f"notifications/{uid}/meta/unread"] = _increment(-dropped_unread)
+    shard.update(updates)
+    print(f"[NOTIFY] Trimmed {len(oldest)} old notifications for {uid}")
+
+
+def describe(item: Dict[str, Any]) -> str:
+    """Render an item as text, e.g. "Sam and 12 others liked your round at Pebble Beach."."""
+    _, _, phrase = NOTIFICATION_KINDS.get(item.get("kind"), ("notifications", "Notification", "did something"))
+    names = [a.get("name") or "Someone" for a in item.get("actors") or []] or ["Someone"]
+    count = max(item.get("actor_count") or 1, len(names))
+    if count == 1:
+        who = names[0]
+    elif count == 2 and len(names) >= 2:
+        who = f"{names[0]} and {names[1]}"
+    else:
+        others = count - 1
+        who = f"{names[0]} and {others} other{'s' if others != 1 else ''}"
+    text = f"{who} {phrase}"
+    if item.get("context"):
+        text += f" {item['context']}"
+    return text + "."
+
+
+def get_notifications(db: Database, uid: str, limit: int = 20, before: str | None = None) -> Dict[str, Any]:
+    """
+    A page of the inbox, newest first, from one read of the (bounded) inbox.
+    Pass the last item's "updated" as before to get the next page.
+    """
+    inbox = for_uid(db, uid).child("notifications").child(uid).get().val() or {}
+    meta = inbox.get("meta") or {}
+    last_read = meta.get("last_read") or ""
+
+    items = sorted((inbox.get("items") or {}).items(), key=lambda kv: kv[1].get("updated", ""), reverse=True)
+    if before:
+        items = [(key, item) for key, item in items if item.get("updated", "") < before]
+
+    page = []
+    for key, item in items[:limit]:
+        icon, title, _ = NOTIFICATION_KINDS.get(item.get("kind"), ("notifications", "Notification", ""))
+        page.append({
+            "id": key,
+            "kind": item.get("kind"),
+            "target": item.get("target"),
+            "title": title,
+            "icon": icon,
+            "description": describe(item),
+            "preview": item.get("preview"),
+            "actors": item.get("actors") or [],
+            "actor_count": item.get("actor_count") or 1,
+            "updated": item.get("updated"),
+            "read": item.get("updated", "") <= last_read,
+        })
+
+    return {
+        "notifications": page,
+        "unread": max(0, meta.get("unread") or 0),
+        "next_before": page[-1]["updated"] if len(items) > limit and page else None,
+    }
+
+
+def mark_notifications_read(db: Database, uid: str):
+    """Mark every item read with a single write."""
+    for_uid(db, uid).child("notifications").child(uid).child("meta").update({
+        "last_read": datetime.now().isoformat(),
+        "unread": 0,
+    })
@@ -0,0 +1,277 @@
+"""
+Opt-in profiling and slow-request capture.
+
+Sampling profiler: for a time window, a background thread samples every
+thread's stack with sys._current_frames() and counts collapsed stacks
+("thread;file:function;file:function N", the input flamegraph.pl and
+speedscope take). Each worker profiles itself and writes
+PROFILE_DIR/parlor-profile-<pid>-<time>.folded. Start it with
+POST /admin/profile (ADMIN_UIDS only; fetch the result from the same worker
+with GET /admin/profile) or, for every worker at once, with
+
+    kill -USR2 <worker pids>
+
+Slow-request capture: every request records the upstream calls it makes
+(through deadlines' breakers: Firebase, auth, GolfCourseAPI, OpenAI) with
+their timing, bytes sent/received and the functions.py helper that issued
+them. Traces of requests slower than SLOW_REQUEST_MS are kept in a ring
+buffer of SLOW_TRACE_BUFFER per worker (GET /admin/slow_requests); the rest
+are dropped when the request ends. Recording a call is a frame walk and a
+list append, cheap next to the network call it describes, so capture is on
+by default (SLOW_REQUEST_CAPTURE=0 turns it off).
+"""
+from flask import Flask, request
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List
+from urllib.parse import urlsplit
+
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+ADMIN_UIDS = {uid.strip() for uid in os.getenv("ADMIN_UIDS", "").split(",") if uid.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", tempfile.gettempdir())
+PROFILE_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+PROFILE_INTERVAL_SECONDS = 0.01
+SLOW_REQUEST_CAPTURE = os.getenv("SLOW_REQUEST_CAPTURE", "1") != "0"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_TRACE_BUFFER = int(os.getenv("SLOW_TRACE_BUFFER", "100"))
+MAX_TRACE_CALLS = 200  # Calls kept per request; the rest are only counted
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Plumbing between a helper and the network; callers are looked for above these
+_PLUMBING_FILES = {"deadlines.py", "profiling.py", "scan.py", "shards.py"}
+
+
+class RequestTrace:
+    """Upstream calls made while serving one request."""
+
+    def __init__(self, method: str, path: str, endpoint: str | None):
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.started = time.monotonic()
+        self.started_at = datetime.now().isoformat()
+        self.status = None
+        self.calls = []
+        self.dropped_calls = 0
+
+    def to_dict(self, elapsed_ms: float) -> Dict[str, Any]:
+        upstream_ms = sum(call["ms"] for call in self.calls)
+        return {
+            "method": self.method,
+            "path": self.path,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "started_at": self.started_at,
+            "ms": round(elapsed_ms, 1),
+            "upstream_ms": round(upstream_ms, 1),
+            "call_count": len(self.calls) + self.dropped_calls,
+            "dropped_calls": self.dropped_calls,
+            "calls": self.calls,
+        }
+
+
+_trace: ContextVar[RequestTrace | None] = ContextVar("parlor_trace", default=None)
+_slow_traces = deque(maxlen=SLOW_TRACE_BUFFER)
+_slow_lock = threading.Lock()
+
+
+def _qualname(code) -> str:
+    return getattr(code, "co_qualname", code.co_name)  # co_qualname is 3.11+
+
+
+def _caller() -> str | None:
+    """The functions.py helper (or, failing that, other app code) that made the current upstream call."""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(_BACKEND_DIR):
+            name = os.path.basename(code.co_filename)
+            if name == "functions.py":
+                return f"functions.py:{_qualname(code)}"
+            if fallback is None and name not in _PLUMBING_FILES:
+                fallback = f"{name}:{_qualname(code)}"
+        frame = frame.f_back
+    return fallback
+
+
+def _body_size(body) -> int | None:
+    if body is None:
+        return 0
+    return len(body) if isinstance(body, (bytes, str)) else None
+
+
+def record_upstream(upstream: str, started: float, result: Any = None, error: Exception | None = None):
+    """
+    Add an upstream call to the current request's trace (no-op outside a
+    request). result is the call's return value; for requests Responses the
+    method, URL, status and sizes are read from it.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return
+    if len(trace.calls) >= MAX_TRACE_CALLS:
+        trace.dropped_calls += 1
+        return
+
+    call = {
+        "upstream": upstream,
+        "at_ms": round((started - trace.started) * 1000, 1),
+        "ms": round((time.monotonic() - started) * 1000, 1),
+        "caller": _caller(),
+    }
+    sent_request = getattr(result, "request", None)
+    if sent_request is not None and hasattr(result, "status_code"):
+        url = urlsplit(sent_request.url)
+        call["method"] = sent_request.method
+        call["url"] = f"{url.netloc}{url.path}"  # Query strings can carry tokens and keys
+        call["status"] = result.status_code
+        call["sent_bytes"] = _body_size(sent_request.body)
+        length = result.headers.get("Content-Length")
+        if length is not None:
+            call["received_bytes"] = int(length)
+        elif getattr(result, "_content_consumed", False):
+            call["received_bytes"] = len(result.content)
+        else:
+            call["received_bytes"] = None  # Streamed (scan) and not read yet
+    if error is not None:
+        call["error"] = type(error).__name__
+    trace.calls.append(call)
+
+
+def slow_requests(limit: int = 20) -> List[Dict[str, Any]]:
+    """The most recent slow-request traces in this worker, newest first."""
+    with _slow_lock:
+        traces = list(_slow_traces)
+    return traces[::-1][:limit]
+
+
+def _collapse(frame, thread_name: str, labels: Dict[Any, str]) -> str:
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        label = labels.get(code)
+        if label is None:
+            label = labels[code] = f"{os.path.basename(code.co_filename)}:{_qualname(code)}"
+        parts.append(label)
+        frame = frame.f_back
+    parts.append(thread_name)
+    return ";".join(reversed(parts))
+
+
+class SamplingProfiler:
+    """Samples every thread's stack for a window and keeps the collapsed-stack counts."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = False
+        self.last_profile = None
+        self.last_path = None
+        self.started_at = None
+        self.ends_at = None
+
+    def start(self, seconds: float = PROFILE_SECONDS, interval: float = PROFILE_INTERVAL_SECONDS) -> bool:
+        """Start a window in the background; False if one is already running."""
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        interval = max(interval, 0.001)
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.started_at = datetime.now().isoformat()
+            self.ends_at = time.monotonic() + seconds
+        threading.Thread(target=self._run, args=(seconds, interval), name="profiler", daemon=True).start()
+        print(f"[PROFILE] Worker {os.getpid()} sampling every {interval * 1000:.0f}ms for {seconds:.0f}s")
+        return True
+
+    def _run(self, seconds: float, interval: float):
+        try:
+            stacks, samples = Counter(), 0
+            labels = {}
+            me = threading.get_ident()
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != me:
+                        stacks[_collapse(frame, names.get(ident, f"thread-{ident}"), labels)] += 1
+                samples += 1
+                time.sleep(interval)
+
+            profile = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+            path = os.path.join(PROFILE_DIR, f"parlor-profile-{os.getpid()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+            with open(path, "w") as f:
+                f.write(profile)
+            self.last_profile, self.last_path = profile, path
+            print(f"[PROFILE] Worker {os.getpid()} wrote {samples} samples ({len(stacks)} stacks) to {path}")
+        except Exception as e:
+            print(f"[PROFILE] Profiling failed: {e}")
+        finally:
+            with self.lock:
+                self.running = False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "running": self.running,
+            "started_at": self.started_at,
+            "seconds_left": max(0.0, round(self.ends_at - time.monotonic(), 1)) if self.running else 0.0,
+            "output": self.last_path,
+        }
+
+
+profiler = SamplingProfiler()
+
+
+def _on_signal(signum, frame):
+    # Not from the handler itself: it may have interrupted a thread holding profiler.lock
+    threading.Thread(target=profiler.start, args=(PROFILE_SECONDS,), daemon=True).start()
+
+
+def install(app: Flask):
+    """Trace every request, keeping the slow ones, and start the profiler on SIGUSR2."""
+    try:
+        signal.signal(signal.SIGUSR2, _on_signal)
+    except (ValueError, AttributeError):  # Not the main thread, or no SIGUSR2 (Windows)
+        print("[PROFILE] SIGUSR2 profiling unavailable in this process")
+
+    if not SLOW_REQUEST_CAPTURE:
+        return
+
+    @app.before_request
+    def start_trace():
+        request.environ["parlor.trace_token"] = _trace.set(RequestTrace(request.method, request.path, request.endpoint))
+
+    @app.after_request
+    def trace_status(response):
+        trace = _trace.get()
+        if trace is not None:
+            trace.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def end_trace(exc=None):
+        token = request.environ.pop("parlor.trace_token", None)
+        if token is None:
+            return
+        trace = _trace.get()
+        try:
+            _trace.reset(token)
+        except ValueError:  # Reset from a different context than the one that set it
+            _trace.set(None)
+        if trace is None:
+            return
+        elapsed_ms = (time.monotonic() - trace.started) * 1000
+        if elapsed_ms >= SLOW_REQUEST_MS:
+            if exc is not None and trace.status is None:
+                trace.status = 500
+            with _slow_lock:
+                _slow_traces.append(trace.to_dict(elapsed_ms))
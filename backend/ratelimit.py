@@ -0,0 +1,266 @@
+from flask import request, jsonify
+from functools import wraps
+from typing import Any, Callable, Dict, Tuple
+from collections import defaultdict, OrderedDict
+
+import math
+import os
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # Redis is optional; without it limits are per worker
+    redis = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+# Total in-flight expensive requests per worker. Keep this below the worker's
+# thread count so cheap routes always find a free thread.
+EXPENSIVE_SLOTS = int(os.getenv("ADMISSION_EXPENSIVE_SLOTS", "6"))
+MAX_LOCAL_BUCKETS = 10000  # Least recently used buckets are dropped past this
+BUCKET_SWEEP_SECONDS = 60
+REDIS_TIMEOUT_SECONDS = 0.25
+REDIS_RETRY_SECONDS = 30  # After a Redis error, use this worker's buckets for this long
+
+
+class RouteLimit:
+    """Token bucket (rate tokens/sec, up to burst) per uid plus a per-worker concurrency cap."""
+
+    def __init__(self, rate: float, burst: int, concurrency: int):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+
+
+ROUTE_LIMITS = {
+    "challenge": RouteLimit(rate=1 / 20, burst=3, concurrency=2),
+    "leaderboard": RouteLimit(rate=0.5, burst=5, concurrency=3),
+    "create_session": RouteLimit(rate=0.2, burst=5, concurrency=4),
+    "import_sessions": RouteLimit(rate=1 / 60, burst=2, concurrency=1),
+}
+
+
+class LocalBucketStore:
+    """In-process buckets and counters, used when REDIS_URL is not configured."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> (tokens, last update, time the bucket is full again); least recently used first
+        self.buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+        self.counters = defaultdict(int)
+        self.swept = time.monotonic()
+
+    def _sweep(self, now: float):
+        """Drop buckets that have refilled: a missing bucket starts full, so they carry no state."""
+        for key in [key for key, (_, _, full_at) in self.buckets.items() if full_at <= now]:
+            del self.buckets[key]
+        while len(self.buckets) > MAX_LOCAL_BUCKETS:
+            self.buckets.popitem(last=False)
+        self.swept = now
+
+    def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self.lock:
+            if now - self.swept > BUCKET_SWEEP_SECONDS or len(self.buckets) > MAX_LOCAL_BUCKETS:
+                self._sweep(now)
+            tokens, ts, _ = self.buckets.pop(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - ts) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def incr(self, counter: str):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+
+class RedisBucketStore:
+    """
+    Buckets and counters in Redis so every worker shares the same limits.
+    While Redis is unreachable the limits fall back to this worker's own
+    buckets rather than failing (or waving through) the request.
+    """
+
+    TAKE_SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate)
+    local allowed = 0
+    local retry = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    else
+        retry = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+    return {allowed, tostring(retry)}
+    """
+    COUNTERS_KEY = "parlor:admission:counters"
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url, socket_timeout=REDIS_TIMEOUT_SECONDS,
+                                           socket_connect_timeout=REDIS_TIMEOUT_SECONDS)
+        self.take_script = self.client.register_script(self.TAKE_SCRIPT)
+        self.fallback = LocalBucketStore()
+        self.down_until = 0.0
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def _failed(self, e: Exception):
+        if self._available():
+            print(f"[ADMISSION] Redis unavailable ({e}), using per-worker limits for {REDIS_RETRY_SECONDS}s")
+        self.down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        if self._available():
+            try:
+                allowed, retry = self.take_script(keys=[f"parlor:bucket:{key}"], args=[rate, burst])
+                return bool(allowed), float(retry)
+            except redis.RedisError as e:
+                self._failed(e)
+        return self.fallback.take(key, rate, burst)
+
+    def incr(self, counter: str):
+        if self._available():
+            try:
+                self.client.hincrby(self.COUNTERS_KEY, counter, 1)
+                return
+            except redis.RedisError as e:
+                self._failed(e)
+        self.fallback.incr(counter)
+
+    def counts(self) -> Dict[str, int]:
+        counts = self.fallback.counts()
+        if self._available():
+            try:
+                for k, v in self.client.hgetall(self.COUNTERS_KEY).items():
+                    counts[k.decode()] = counts.get(k.decode(), 0) + int(v)
+            except redis.RedisError as e:
+                self._failed(e)
+        return counts
+
+
+store = RedisBucketStore(REDIS_URL) if REDIS_URL and redis else LocalBucketStore()
+_route_slots = {name: threading.BoundedSemaphore(limit.concurrency) for name, limit in ROUTE_LIMITS.items()}
+_expensive_slots = threading.BoundedSemaphore(EXPENSIVE_SLOTS)
+_in_flight = defaultdict(int)
+_in_flight_lock = threading.Lock()
+
+
+_verify_token: Callable[[str], Dict[str, Any]] | None = None
+
+
+def install(verify_token: Callable[[str], Dict[str, Any]]):
+    """
+    Register the app's token lookup (firebase_get_account_info). Buckets are
+    keyed by uid only once a token has been verified with it.
+    """
+    global _verify_token
+    _verify_token = verify_token
+
+
+def _verified_uid(id_token: str) -> str | None:
+    """
+    The token's uid if it verifies, else None. The lookup is kept in
+    request.environ["parlor.verified_account"], where firebase_get_account_info
+    finds it, so the route doesn't verify the token a second time.
+    """
+    if _verify_token is None:
+        return None
+    try:
+        account = _verify_token(id_token)
+        uid = account["users"][0]["localId"]
+    except Exception:  # Invalid token or auth unavailable; the route reports it
+        return None
+    request.environ["parlor.verified_account"] = (id_token, account)
+    return uid
+
+
+def _request_identity() -> str:
+    """Verified uid for signed-in requests; client IP for everything else, forged tokens included."""
+    auth_header = request.headers.get("Authorization", "")
+    if auth_header.startswith("Bearer "):
+        uid = _verified_uid(auth_header.split(" ")[1])
+        if uid:
+            return f"uid:{uid}"
+    return f"ip:{request.remote_addr}"
+
+
+def _reject(status: int, message: str, retry_after: float):
+    response = jsonify({"error": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _acquire(semaphore: threading.BoundedSemaphore, route: str) -> bool:
+    """Take a slot immediately if one is free, otherwise queue briefly for one."""
+    if semaphore.acquire(blocking=False):
+        return True
+    store.incr(f"queued.{route}")
+    return semaphore.acquire(timeout=QUEUE_TIMEOUT_SECONDS)
+
+
+def admission_control(route: str):
+    """
+    Gate an expensive route: per-user (or, unauthenticated, per-IP) token bucket first (429 when empty),
+    then the route's concurrency cap and the shared expensive-route cap
+    (503 when still saturated after a short queue). Routes without this
+    decorator are cheap and never wait on these slots.
+    """
+    limit = ROUTE_LIMITS[route]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            allowed, retry_after = store.take(f"{route}:{_request_identity()}", limit.rate, limit.burst)
+            if not allowed:
+                store.incr(f"rejected.rate_limited.{route}")
+                return _reject(429, "Too many requests", retry_after)
+
+            if not _acquire(_route_slots[route], route):
+                store.incr(f"rejected.saturated.{route}")
+                return _reject(503, "Server busy, try again shortly", QUEUE_TIMEOUT_SECONDS)
+            try:
+                if not _acquire(_expensive_slots, route):
+                    store.incr(f"rejected.saturated.{route}")
+                    return _reject(503, "Server busy, try again shortly", QUEUE_TIMEOUT_SECONDS)
+                try:
+                    with _in_flight_lock:
+                        _in_flight[route] += 1
+                    return view(*args, **kwargs)
+                finally:
+                    with _in_flight_lock:
+                        _in_flight[route] -= 1
+                    _expensive_slots.release()
+            finally:
+                _route_slots[route].release()
+        return wrapped
+    return decorator
+
+
+def admission_stats() -> Dict[str, Dict[str, int]]:
+    """Rejected/queued counters (shared when Redis is configured) plus this worker's in-flight counts."""
+    stats = {"rejected": {}, "queued": {}}
+    for counter, value in store.counts().items():
+        kind, _, name = counter.partition(".")
+        if kind in stats:
+            stats[kind][name] = value
+    with _in_flight_lock:
+        stats["in_flight"] = dict(_in_flight)
+    return stats
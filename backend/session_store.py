@@ -0,0 +1,324 @@
+"""
+Session storage layout (v2).
+
+Each round is split across two nodes on its owner's shard:
+
+  session_summaries/<id>  what lists need: owner, course, scores, times,
+                          privacy, ratings, like_count/comment_count and a
+                          cover thumbnail
+  session_details/<id>    per-hole scores as an array (holeScores, aligned
+                          with selectedHoles when the round didn't play
+                          holes 1..n), start/end times, media lists and the
+                          likes/comments maps
+
+so feeds, profiles and leaderboards read summaries only. Rounds written
+before v2 live whole at sessions/<id> until migrated. Reads accept both
+layouts (set SESSION_LEGACY_READS=0 once the migration has finished to skip
+the legacy scans), and writers move a legacy round to v2 before changing it.
+
+Migrate online:  python session_store.py migrate
+Measure list payloads:  python session_store.py measure --sample 500
+"""
+from pyrebase.pyrebase import Database
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from archive import archived_fields, merge_archived
+from shards import all_shards
+from deadlines import propagate
+from scan import scan_records
+
+import argparse
+import json
+import os
+
+SUMMARIES = "session_summaries"
+DETAILS = "session_details"
+LEGACY = "sessions"
+LEGACY_READS = os.getenv("SESSION_LEGACY_READS", "1") != "0"
+SUMMARY_FIELDS = (
+    "uid", "username", "courseName", "courseId", "holes", "totalScore", "duration", "timestamp",
+    "privacy", "course_rating", "normalized_score", "rating_status", "archived",
+)
+MIGRATION_PAGE_SIZE = 200
+MIGRATION_ATTEMPTS = 3
+DETAIL_READ_WORKERS = 8
+
+_detail_executor = ThreadPoolExecutor(max_workers=DETAIL_READ_WORKERS, thread_name_prefix="session-details")
+
+
+def increment(amount: int) -> Dict[str, Any]:
+    return {".sv": {"increment": amount}}
+
+
+def encode_scores(scores, selected_holes=None) -> Tuple[List[Any] | None, List[int] | None]:
+    """
+    {hole: score} (or the list RTDB turns a 1..n keyed map into) -> (scores in
+    hole order, holes). holes is None when the round played holes 1..n.
+    """
+    if isinstance(scores, list):
+        scores = {hole: score for hole, score in enumerate(scores) if score is not None}
+    if not isinstance(scores, dict) or not scores:
+        return None, selected_holes or None
+    by_hole = {int(hole): score for hole, score in scores.items()}
+    holes = [int(hole) for hole in selected_holes] if selected_holes else sorted(by_hole)
+    if holes == list(range(1, len(holes) + 1)) and not selected_holes:
+        holes_out = None
+    else:
+        holes_out = holes
+    return [by_hole.get(hole) for hole in holes], holes_out
+
+
+def decode_scores(hole_scores, selected_holes=None) -> Dict[str, Any] | None:
+    if not hole_scores:
+        return None
+    holes = selected_holes or range(1, len(hole_scores) + 1)
+    return {str(hole): score for hole, score in zip(holes, hole_scores) if score is not None}
+
+
+def split_session(record: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Split a full (legacy-shaped) session record into its v2 summary and details."""
+    summary = {key: record[key] for key in SUMMARY_FIELDS if record.get(key) is not None}
+    # Archived legacy stubs carry the counts instead of the maps
+    summary["like_count"] = len(record["likes"]) if record.get("likes") else record.get("like_count", 0)
+    summary["comment_count"] = len(record["comments"]) if record.get("comments") else record.get("comment_count", 0)
+    images = record.get("images") or []
+    cover = (record.get("thumbnails") or images or [None])[0]
+    if cover:
+        summary["cover"] = cover
+    summary["image_count"] = len(images)
+
+    details = {
+        key: value for key, value in record.items()
+        if key not in SUMMARY_FIELDS and key not in ("id", "scores", "selectedHoles") and value not in (None, [], {})
+    }
+    hole_scores, holes = encode_scores(record.get("scores"), record.get("selectedHoles"))
+    if hole_scores:
+        details["holeScores"] = hole_scores
+    if holes:
+        details["selectedHoles"] = holes
+    return summary, details
+
+
+def summary_of(record: Dict[str, Any]) -> Dict[str, Any]:
+    summary, _ = split_session(record)
+    return {"id": record["id"], **summary} if "id" in record else summary
+
+
+def join_session(summary: Dict[str, Any], details: Dict[str, Any] | None) -> Dict[str, Any]:
+    """Rebuild the full record (scores as {hole: score}) from a summary and its details."""
+    details = dict(details or {})
+    hole_scores = details.pop("holeScores", None)
+    record = {**details, **summary}
+    if hole_scores is not None:
+        record["scores"] = decode_scores(hole_scores, details.get("selectedHoles"))
+    record.setdefault("likes", {})
+    record.setdefault("comments", {})
+    for key in ("like_count", "comment_count", "cover", "image_count"):
+        record.pop(key, None)
+    return record
+
+
+def session_updates(session_id: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Multi-path update writing a new round in the v2 layout."""
+    summary, details = split_session(record)
+    return {f"{SUMMARIES}/{session_id}": summary, f"{DETAILS}/{session_id}": details}
+
+
+def delete_updates(session_id: str) -> Dict[str, Any]:
+    return {f"{SUMMARIES}/{session_id}": None, f"{DETAILS}/{session_id}": None, f"{LEGACY}/{session_id}": None}
+
+
+def scan_summaries(shard: Database, where=None, uid: str | None = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the summaries on a shard (only uid's, if given) as {"id", ...},
+    including rounds still stored in the legacy layout.
+    """
+    def query(root):
+        return shard.child(root).order_by_child("uid").equal_to(uid) if uid else shard.child(root)
+
+    yield from scan_records(query(SUMMARIES), where)
+    if LEGACY_READS:
+        for record in scan_records(query(LEGACY)):
+            summary = summary_of(record)
+            if where is None or where(summary):
+                yield summary
+
+
+def read_summary(shard: Database, session_id: str) -> Dict[str, Any] | None:
+    summary = shard.child(SUMMARIES).child(session_id).get().val()
+    if summary is None and LEGACY_READS:
+        legacy = shard.child(LEGACY).child(session_id).get().val()
+        summary = split_session(legacy)[0] if legacy else None
+    return summary
+
+
+def read_session(shard: Database, session_id: str) -> Dict[str, Any] | None:
+    """The full record for one round, from either layout, with archived fields restored."""
+    summary = shard.child(SUMMARIES).child(session_id).get().val()
+    if summary is not None:
+        details = shard.child(DETAILS).child(session_id).get().val() or {}
+        if summary.get("archived"):
+            details = merge_archived(archived_fields(shard, summary.get("uid"), summary["archived"], session_id), details)
+        record = join_session(summary, details)
+    elif LEGACY_READS:
+        record = shard.child(LEGACY).child(session_id).get().val()
+        if record and record.get("archived"):
+            record = merge_archived(archived_fields(shard, record.get("uid"), record["archived"], session_id), record)
+    else:
+        record = None
+    if record:
+        record.pop("archived", None)
+    return record
+
+
+def read_details_many(shard: Database, session_ids: Iterable[str]) -> List[Dict[str, Any] | None]:
+    """Details for several rounds, read in parallel (one handle per read)."""
+    def read(session_id):
+        handle = Database(shard.credentials, shard.api_key, shard.database_url, shard.requests)
+        return handle.child(DETAILS).child(session_id).get().val()
+    return list(_detail_executor.map(propagate(read), list(session_ids)))
+
+
+def read_summaries_many(shard: Database, session_ids: Iterable[str]) -> List[Dict[str, Any] | None]:
+    """Summaries for several rounds on one shard, read in parallel (one handle per read)."""
+    def read(session_id):
+        return read_summary(Database(shard.credentials, shard.api_key, shard.database_url, shard.requests), session_id)
+    return list(_detail_executor.map(propagate(read), list(session_ids)))
+
+
+def conflict(result) -> bool:
+    # pyrebase's conditional_* return {"ETag", "value"} instead of raising on 412
+    return isinstance(result, dict) and "ETag" in result and "value" in result
+
+
+def _flatten(prefix: str, details: Dict[str, Any]) -> Dict[str, Any]:
+    """Details as per-entry paths, so likes/comments added after the summary is claimed are kept."""
+    updates = {}
+    for key, value in details.items():
+        if key in ("likes", "comments") and isinstance(value, dict):
+            for entry_id, entry in value.items():
+                updates[f"{prefix}/{key}/{entry_id}"] = entry
+        else:
+            updates[f"{prefix}/{key}"] = value
+    return updates
+
+
+def migrate_session(shard: Database, session_id: str) -> bool:
+    """
+    Move one legacy round to the v2 layout; safe to run while the round is
+    being liked or commented on. The summary is claimed with a conditional
+    write (so concurrent migrations of the same round write it once), the
+    details are merged in per entry, and the legacy node is removed only if
+    it hasn't changed since it was read. Returns False if there was nothing
+    to move.
+    """
+    overwrite = False
+    for _ in range(MIGRATION_ATTEMPTS):
+        legacy = shard.child(LEGACY).child(session_id).get_etag()
+        record = legacy["value"]
+        if not isinstance(record, dict):
+            return False
+        summary, details = split_session(record)
+
+        if overwrite:
+            shard.child(SUMMARIES).child(session_id).set(summary)
+            claimed = True
+        else:
+            current = shard.child(SUMMARIES).child(session_id).get_etag()
+            claimed = current["value"] is None and not conflict(
+                shard.child(SUMMARIES).child(session_id).conditional_set(summary, current["ETag"])
+            )
+        if claimed and details:
+            shard.update(_flatten(f"{DETAILS}/{session_id}", details))
+
+        if not conflict(shard.child(LEGACY).child(session_id).conditional_remove(legacy["ETag"])):
+            return True
+        # Written by a server still on the legacy layout since we read it: copy it again
+        overwrite = True
+    print(f"[SESSIONS] Gave up migrating {session_id} after {MIGRATION_ATTEMPTS} attempts")
+    return False
+
+
+def ensure_migrated(shard: Database, session_id: str) -> Dict[str, Any] | None:
+    """The round's v2 summary, migrating it first if it is still in the legacy layout."""
+    summary = shard.child(SUMMARIES).child(session_id).get().val()
+    if summary is None and LEGACY_READS and migrate_session(shard, session_id):
+        summary = shard.child(SUMMARIES).child(session_id).get().val()
+    return summary
+
+
+def migrate_sessions(db: Database, page_size: int = MIGRATION_PAGE_SIZE) -> int:
+    """
+    Move every legacy round on every shard to the v2 layout. The legacy tree
+    is its own work queue (migrated rounds are removed from it), so the job
+    can be stopped and re-run at any time. Returns the number of rounds moved.
+    """
+    migrated = 0
+    for shard in all_shards(db):
+        last_key = None
+        while True:
+            query = shard.child(LEGACY).order_by_key()
+            if last_key:
+                query = query.start_at(last_key)
+            keys = [key for key in query.limit_to_first(page_size + 1).get().val() or {} if key != last_key]
+            if not keys:
+                break
+            migrated += sum(1 for session_id in keys if migrate_session(shard, session_id))
+            last_key = keys[-1]
+            print(f"[SESSIONS] {shard.database_url}: {migrated} rounds migrated so far")
+    return migrated
+
+
+def _json_bytes(value) -> int:
+    return len(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def measure_list_bytes(db: Database, sample: int = 500, page: int = 20) -> Dict[str, float]:
+    """
+    Compare what list requests transfer per round under both layouts, using
+    up to `sample` rounds per shard: the legacy record each would have been
+    versus its v2 summary.
+    """
+    legacy_bytes = summary_bytes = rounds = 0
+    for shard in all_shards(db):
+        summaries = shard.child(SUMMARIES).order_by_key().limit_to_first(sample).get().val() or {}
+        details = read_details_many(shard, summaries)
+        for (session_id, summary), detail in zip(summaries.items(), details):
+            legacy_bytes += _json_bytes({session_id: join_session(summary, detail)})
+            summary_bytes += _json_bytes({session_id: summary})
+            rounds += 1
+    if not rounds:
+        return {"rounds": 0}
+    return {
+        "rounds": rounds,
+        "legacy_bytes_per_round": legacy_bytes / rounds,
+        "summary_bytes_per_round": summary_bytes / rounds,
+        "legacy_bytes_per_page": legacy_bytes / rounds * page,
+        "summary_bytes_per_page": summary_bytes / rounds * page,
+        "reduction": 1 - summary_bytes / legacy_bytes,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Session layout maintenance.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Move legacy /sessions records to summaries + details")
+    migrate_parser.add_argument("--page-size", type=int, default=MIGRATION_PAGE_SIZE)
+    measure_parser = subparsers.add_parser("measure", help="Bytes per list request, legacy records vs summaries")
+    measure_parser.add_argument("--sample", type=int, default=500, help="Rounds sampled per shard")
+    measure_parser.add_argument("--page", type=int, default=20, help="Rounds per list request")
+    args = parser.parse_args()
+
+    from app import get_db
+    if args.command == "migrate":
+        count = migrate_sessions(get_db(), args.page_size)
+        print(f"[SESSIONS] Migrated {count} rounds to the v2 layout")
+    else:
+        stats = measure_list_bytes(get_db(), args.sample, args.page)
+        if not stats["rounds"]:
+            print("[SESSIONS] No v2 rounds to measure; run migrate first")
+        else:
+            print(f"[SESSIONS] {stats['rounds']} rounds sampled")
+            print(f"  legacy:  {stats['legacy_bytes_per_round']:8.0f} B/round  {stats['legacy_bytes_per_page'] / 1024:8.1f} KB per {args.page}-round list")
+            print(f"  summary: {stats['summary_bytes_per_round']:8.0f} B/round  {stats['summary_bytes_per_page'] / 1024:8.1f} KB per {args.page}-round list")
+            print(f"  {stats['reduction']:.0%} fewer bytes per list request")
@@ -0,0 +1,243 @@
+"""
+Horizontal sharding of per-user data across several RTDB instances.
+
+Sessions (summaries and details, with their likes/comments), friends, friend
+requests, notifications and session archives live on the shard owning the user; everything else (users,
+courses, leagues, the change log, the /session_owners directory) stays on
+shard 0. Configure with DATABASE_URLS=url0,url1,... (falls back to
+DATABASE_URL for a single shard).
+
+Changing the shard list takes two runs with a deploy in between:
+
+    python shards.py rebalance --to url0,url1,url2            # fence writes, copy
+    (deploy with DATABASE_URLS=url0,url1,url2)
+    python shards.py rebalance --to url0,url1,url2 --cleanup  # drop old copies, unfence
+
+From the first run until the cleanup, /rebalance_fence on shard 0 is set and
+the API answers writes with 503, so nothing lands on a source shard after its
+data was copied. Reads keep working throughout: until the deploy they are
+served from the source shards, whose copies stay in place until the cleanup.
+"""
+from flask import Flask, request, jsonify
+from pyrebase.pyrebase import Database
+from typing import List, Callable, Any
+from concurrent.futures import ThreadPoolExecutor
+from deadlines import propagate, REQUEST_BUDGET_SECONDS
+
+import argparse
+import hashlib
+import os
+import threading
+import time
+
+DATABASE_URLS = [url.strip() for url in os.getenv("DATABASE_URLS", "").split(",") if url.strip()] or [os.getenv("DATABASE_URL")]
+# Children of these roots are keyed by uid and move with their user
+USER_KEYED_ROOTS = ("friends", "friend_requests", "session_archive", "notifications")
+# Session roots keyed by session id, with the owning uid on each record (legacy
+# layout, and v2 summaries); each summary's session_details node moves with it
+SESSION_ROOTS = ("sessions", "session_summaries")
+MIGRATION_PAGE_SIZE = 200
+REBALANCE_FENCE = "rebalance_fence"
+FENCE_CHECK_SECONDS = 5.0  # How long a worker trusts its last read of the fence
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Writes that only touch shard 0 (or nothing), and /batch, whose sub-requests are checked one by one
+UNFENCED_ENDPOINTS = {"batch_route", "sign_up", "sign_in", "start_profile_route"}
+
+_fan_out_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SHARD_FAN_OUT_WORKERS", "8")), thread_name_prefix="shard")
+
+
+def shard_index(uid: str, shard_count: int) -> int:
+    """
+    Jump consistent hash of the uid, so growing from N to N+1 shards only
+    moves about 1/(N+1) of the users.
+    """
+    key = int(hashlib.sha1(str(uid).encode("utf-8")).hexdigest()[:16], 16)
+    bucket, jump = -1, 0
+    while jump < shard_count:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+class ShardRouter:
+    """
+    A set of Database handles, one per shard. Attribute access falls through
+    to shard 0, so the router works anywhere a single Database is expected
+    for global data; per-user data goes through for_uid()/for_session().
+    """
+
+    def __init__(self, shards: List[Database]):
+        self.shards = shards
+
+    def __getattr__(self, name):
+        return getattr(self.shards[0], name)
+
+    @property
+    def primary(self) -> Database:
+        return self.shards[0]
+
+    def for_uid(self, uid: str) -> Database:
+        return self.shards[shard_index(uid, len(self.shards))]
+
+    def for_session(self, session_id: str) -> Database:
+        """Shard holding a session, found through /session_owners/<id> on shard 0."""
+        if len(self.shards) == 1:
+            return self.primary
+        owner = self.primary.child("session_owners").child(session_id).get().val()
+        if owner:
+            return self.for_uid(owner)
+        # Sessions written before the directory existed: ask every shard
+        for shard in self.shards:
+            for root in ("session_summaries", "sessions"):
+                if shard.child(root).child(session_id).child("uid").get().val():
+                    return shard
+        return self.primary
+
+    def clone(self) -> "ShardRouter":
+        return ShardRouter([Database(s.credentials, s.api_key, s.database_url, s.requests) for s in self.shards])
+
+
+def for_uid(db, uid: str) -> Database:
+    return db.for_uid(uid) if isinstance(db, ShardRouter) else db
+
+
+def for_session(db, session_id: str) -> Database:
+    return db.for_session(session_id) if isinstance(db, ShardRouter) else db
+
+
+def primary(db) -> Database:
+    return db.primary if isinstance(db, ShardRouter) else db
+
+
+def all_shards(db) -> List[Database]:
+    return db.shards if isinstance(db, ShardRouter) else [db]
+
+
+def fan_out(db, fn: Callable[[Database], Any]) -> List[Any]:
+    """Run fn against every shard in parallel (each call gets its own handle) and return the results."""
+    shards = all_shards(db)
+    if len(shards) == 1:
+        return [fn(shards[0])]
+    clones = [Database(s.credentials, s.api_key, s.database_url, s.requests) for s in shards]
+    return list(_fan_out_executor.map(propagate(fn), clones))
+
+
+_fence = {"checked_at": 0.0, "fenced": False}
+_fence_lock = threading.Lock()
+
+
+def writes_fenced(db) -> bool:
+    """Whether a rebalance is in progress, read from shard 0 at most every FENCE_CHECK_SECONDS."""
+    now = time.monotonic()
+    if now - _fence["checked_at"] >= FENCE_CHECK_SECONDS:
+        with _fence_lock:
+            if now - _fence["checked_at"] >= FENCE_CHECK_SECONDS:
+                _fence["fenced"] = bool(primary(db).child(REBALANCE_FENCE).get().val())
+                _fence["checked_at"] = now
+    return _fence["fenced"]
+
+
+def install(app: Flask, get_db: Callable[[], Any]):
+    """Answer writes with 503 while a rebalance is moving data between shards."""
+
+    @app.before_request
+    def fence_writes():
+        if request.method not in WRITE_METHODS or request.endpoint in UNFENCED_ENDPOINTS:
+            return None
+        if writes_fenced(get_db()):
+            response = jsonify({"error": "Data is being moved between databases, try again shortly"})
+            response.status_code = 503
+            response.headers["Retry-After"] = "60"
+            return response
+        return None
+
+
+def _copy(source: Database, target: Database, nodes: dict, cleanup: bool) -> bool:
+    """
+    Copy phase: write the nodes to the target. Cleanup phase: delete them
+    from the source, together and only once the target has all of them.
+    Returns whether anything was written.
+    """
+    if not cleanup:
+        target.update(nodes)
+        return True
+    if any(value is not None and target.child(path).shallow().get().val() is None for path, value in nodes.items()):
+        print(f"[SHARDS] {', '.join(nodes)} not copied to {target.database_url} yet, kept")
+        return False
+    source.update({path: None for path in nodes})
+    return True
+
+
+def set_fence(db, fenced: bool):
+    primary(db).child(REBALANCE_FENCE).set({".sv": "timestamp"} if fenced else None)
+
+
+def rebalance(old: ShardRouter, new: ShardRouter, cleanup: bool = False) -> int:
+    """
+    Copy per-user data from the shard each user has under `old` to the one
+    they have under `new` (or, with cleanup, delete the source copies once
+    the target has them). Both phases can be re-run after an interruption.
+    Returns the number of nodes copied (or deleted).
+    """
+    moved = 0
+    for source in old.shards:
+        source_url = source.database_url
+
+        for root in SESSION_ROOTS:
+            last_key = None
+            while True:
+                query = source.child(root).order_by_key()
+                if last_key:
+                    query = query.start_at(last_key)
+                page = [(s.key(), s.val()) for s in query.limit_to_first(MIGRATION_PAGE_SIZE + 1).get().each() or []]
+                page = [(key, value) for key, value in page if key != last_key]
+                if not page:
+                    break
+                for session_id, session in page:
+                    target = new.for_uid((session or {}).get("uid", ""))
+                    if target.database_url != source_url:
+                        nodes = {f"{root}/{session_id}": session}
+                        if root == "session_summaries":
+                            nodes[f"session_details/{session_id}"] = source.child("session_details").child(session_id).get().val()
+                        moved += _copy(source, target, nodes, cleanup)
+                last_key = page[-1][0]
+
+        for root in USER_KEYED_ROOTS:
+            for uid in list(source.child(root).shallow().get().val() or []):
+                target = new.for_uid(uid)
+                if target.database_url != source_url:
+                    moved += _copy(source, target, {f"{root}/{uid}": source.child(root).child(uid).get().val()}, cleanup)
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shard maintenance.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebalance_parser = subparsers.add_parser("rebalance", help="Move data after changing the shard list")
+    rebalance_parser.add_argument("--to", required=True, help="Comma-separated database URLs of the new shard list")
+    rebalance_parser.add_argument("--cleanup", action="store_true", help="After the deploy: delete the old copies and lift the fence")
+    args = parser.parse_args()
+
+    import pyrebase
+    from app import config
+
+    def router_for(urls):
+        return ShardRouter([pyrebase.initialize_app({**config, "databaseURL": url}).database() for url in urls])
+
+    new_urls = [url.strip() for url in args.to.split(",") if url.strip()]
+    if not args.cleanup and new_urls[0].rstrip("/") != DATABASE_URLS[0].rstrip("/"):
+        parser.error("The first URL (shard 0, which holds global data) must stay the same")
+    new = router_for(new_urls)
+    if args.cleanup:
+        # Every shard of the new list is checked for data that now belongs elsewhere
+        count = rebalance(new, new, cleanup=True)
+        set_fence(new, False)
+        print(f"[SHARDS] Deleted {count} old copies; writes are open again")
+    else:
+        old = router_for(DATABASE_URLS)
+        set_fence(old, True)
+        # Let every worker see the fence and finish the writes it had already started
+        time.sleep(FENCE_CHECK_SECONDS + REQUEST_BUDGET_SECONDS)
+        count = rebalance(old, new)
+        print(f"[SHARDS] Copied {count} nodes; deploy with DATABASE_URLS={args.to}, then re-run with --cleanup")
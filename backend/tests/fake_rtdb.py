@@ -0,0 +1,187 @@
+"""
+A small in-memory stand-in for the Firebase RTDB REST API, enough for
+pyrebase: get/set/update/push/remove, shallow reads, orderBy with
+startAt/endAt/equalTo/limitTo*, ETags with If-Match, and the
+{".sv": "timestamp"} / {".sv": {"increment": n}} server values.
+
+    server = FakeRTDB()       # listens on a free local port
+    db = server.database()    # pyrebase Database pointed at it
+    server.data               # the tree, for assertions
+    server.close()
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from pyrebase.pyrebase import Database
+from typing import Any
+
+import hashlib
+import json
+import random
+import string
+import threading
+import time
+import requests
+
+
+def _parts(path: str):
+    return [part for part in path.strip("/").split("/") if part]
+
+
+def _sort_value(value):
+    if value is None:
+        return (0, "")
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, "")
+
+
+class FakeRTDB:
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def database(self, session: requests.Session | None = None) -> Database:
+        return Database(None, "test", self.url, session or requests.Session())
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path: str) -> Any:
+        node = self.data
+        for part in _parts(path):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return json.loads(json.dumps(node))
+
+    def etag(self, path: str) -> str:
+        return hashlib.md5(json.dumps(self.get(path), sort_keys=True).encode("utf-8")).hexdigest()
+
+    def set(self, path: str, value: Any):
+        value = self._resolve(path, value)
+        parts = _parts(path)
+        if not parts:
+            self.data = value if isinstance(value, dict) else {}
+            return
+        node = self.data
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is None or value == {}:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+        self.data = self._prune(self.data) or {}
+
+    def update(self, path: str, values: dict):
+        for key, value in values.items():
+            self.set(f"{path.rstrip('/')}/{key}", value)
+
+    def _resolve(self, path: str, value: Any) -> Any:
+        if isinstance(value, dict) and ".sv" in value:
+            if value[".sv"] == "timestamp":
+                return int(time.time() * 1000)
+            return (self.get(path) or 0) + value[".sv"]["increment"]
+        if isinstance(value, dict):
+            return {key: self._resolve(f"{path.rstrip('/')}/{key}", child) for key, child in value.items()}
+        return value
+
+    def _prune(self, node: Any) -> Any:
+        if not isinstance(node, dict):
+            return node
+        pruned = {key: self._prune(child) for key, child in node.items()}
+        return {key: child for key, child in pruned.items() if child is not None and child != {}} or None
+
+    def query(self, path: str, params: dict) -> Any:
+        data = self.get(path)
+        if "shallow" in params and isinstance(data, dict):
+            return {key: True for key in data}
+        if "orderBy" not in params or not isinstance(data, dict):
+            return data
+
+        order_by = json.loads(params["orderBy"])
+        if order_by == "$key":
+            sort_key = lambda item: item[0]
+        elif order_by == "$value":
+            sort_key = lambda item: item[1]
+        else:
+            sort_key = lambda item: item[1].get(order_by) if isinstance(item[1], dict) else None
+        items = sorted(data.items(), key=lambda item: (_sort_value(sort_key(item)), item[0]))
+        if "equalTo" in params:
+            equal_to = json.loads(params["equalTo"])
+            items = [item for item in items if sort_key(item) == equal_to]
+        if "startAt" in params:
+            start_at = _sort_value(json.loads(params["startAt"]))
+            items = [item for item in items if sort_key(item) is not None and _sort_value(sort_key(item)) >= start_at]
+        if "endAt" in params:
+            end_at = _sort_value(json.loads(params["endAt"]))
+            items = [item for item in items if sort_key(item) is not None and _sort_value(sort_key(item)) <= end_at]
+        if "limitToFirst" in params:
+            items = items[:int(params["limitToFirst"])]
+        if "limitToLast" in params:
+            items = items[-int(params["limitToLast"]):]
+        return dict(items)
+
+
+def _handler(db: FakeRTDB):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _request(self):
+            url = urlparse(self.path)
+            return url.path.removesuffix(".json"), {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        def _body(self):
+            return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+
+        def _send(self, body: Any, status: int = 200, etag: str | None = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write(self, apply):
+            path, _ = self._request()
+            body = self._body() if self.command != "DELETE" else None
+            with db.lock:
+                expected = self.headers.get("if-match")
+                if expected and expected != db.etag(path):
+                    return self._send(db.get(path), 412, db.etag(path))
+                result = apply(path, body)
+            self._send(result)
+
+        def do_GET(self):
+            path, params = self._request()
+            with db.lock:
+                body = db.query(path, params)
+                etag = db.etag(path) if self.headers.get("X-Firebase-ETag") else None
+            self._send(body, etag=etag)
+
+        def do_PUT(self):
+            self._write(lambda path, body: (db.set(path, body), db.get(path))[1])
+
+        def do_PATCH(self):
+            self._write(lambda path, body: (db.update(path, body), body)[1])
+
+        def do_DELETE(self):
+            self._write(lambda path, body: db.set(path, None))
+
+        def do_POST(self):
+            key = "-" + "%013d" % int(time.time() * 1e6) + "".join(random.choices(string.ascii_letters, k=6))
+            self._write(lambda path, body: (db.set(f"{path.rstrip('/')}/{key}", body), {"name": key})[1])
+
+    return Handler
@@ -0,0 +1,170 @@
+"""
+Sharding against several local fake RTDB servers (tests/fake_rtdb.py).
+
+    cd backend && python -m pytest tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from fake_rtdb import FakeRTDB
+from deadlines import BREAKERS, FAILURE_THRESHOLD, DeadlineSession, UpstreamUnavailable
+import functions
+import shards
+from shards import ShardRouter, shard_index, rebalance, set_fence, writes_fenced
+
+UIDS = [f"user{i}" for i in range(24)]
+
+
+class ShardTestCase(unittest.TestCase):
+    shard_count = 3
+
+    def setUp(self):
+        self.servers = [FakeRTDB() for _ in range(self.shard_count + 1)]
+        self.db = self.router(self.servers[:self.shard_count])
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+
+    def router(self, servers):
+        return ShardRouter([server.database() for server in servers])
+
+    def server_for(self, uid, servers=None):
+        servers = servers or self.servers[:self.shard_count]
+        return servers[shard_index(uid, len(servers))]
+
+    def create_sessions(self):
+        return {
+            uid: functions.create_session(self.db, uid, {"courseName": "Pebble Beach", "holes": 18, "totalScore": 72 + i, "scores": [4] * 18, "privacy": "public"})
+            for i, uid in enumerate(UIDS)
+        }
+
+
+class ShardIndexTest(unittest.TestCase):
+    def test_growing_only_moves_users_to_the_new_shard(self):
+        for count in (1, 2, 3, 7):
+            for uid in UIDS:
+                before, after = shard_index(uid, count), shard_index(uid, count + 1)
+                self.assertIn(after, (before, count))
+
+    def test_spreads_users(self):
+        self.assertEqual({shard_index(uid, 3) for uid in UIDS}, {0, 1, 2})
+
+
+class RoutingTest(ShardTestCase):
+    def test_sessions_live_on_their_owners_shard(self):
+        session_ids = self.create_sessions()
+        for uid, session_id in session_ids.items():
+            owner_server = self.server_for(uid)
+            self.assertEqual(owner_server.get(f"session_summaries/{session_id}/uid"), uid)
+            for server in self.servers[:self.shard_count]:
+                if server is not owner_server:
+                    self.assertIsNone(server.get(f"session_summaries/{session_id}"))
+            self.assertEqual(self.servers[0].get(f"session_owners/{session_id}"), uid)
+            self.assertEqual(self.db.for_session(session_id).database_url, owner_server.url)
+
+    def test_friends_are_written_to_both_users_shards(self):
+        functions.send_friend_request(self.db, UIDS[0], UIDS[1])
+        functions.accept_friend_request(self.db, UIDS[1], UIDS[0])
+        self.assertEqual(functions.get_friends(self.db, UIDS[0]), [UIDS[1]])
+        self.assertEqual(functions.get_friends(self.db, UIDS[1]), [UIDS[0]])
+        self.assertTrue(self.server_for(UIDS[0]).get(f"friends/{UIDS[0]}/{UIDS[1]}"))
+
+
+class RebalanceTest(ShardTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session_ids = self.create_sessions()
+        self.new_servers = self.servers
+        self.new_db = self.router(self.new_servers)
+        self.moving = [uid for uid in UIDS if shard_index(uid, len(self.new_servers)) == self.shard_count]
+        self.assertTrue(self.moving)
+
+    def test_copy_keeps_the_source_until_cleanup(self):
+        copied = rebalance(self.db, self.new_db)
+        self.assertEqual(copied, len(self.moving))
+        for uid in self.moving:
+            session_id = self.session_ids[uid]
+            self.assertEqual(self.server_for(uid).get(f"session_summaries/{session_id}/uid"), uid)
+            self.assertEqual(self.servers[-1].get(f"session_summaries/{session_id}/uid"), uid)
+            self.assertIsNotNone(self.servers[-1].get(f"session_details/{session_id}"))
+        # Either shard list reads every user's rounds in the window between copy and cleanup
+        for uid in UIDS:
+            self.assertEqual(len(functions.get_user_sessions(self.db, uid)), 1)
+            self.assertEqual(len(functions.get_user_sessions(self.new_db, uid)), 1)
+
+    def test_cleanup_deletes_only_copied_nodes(self):
+        rebalance(self.db, self.new_db)
+        uncopied = self.moving[0]
+        self.servers[-1].set(f"session_summaries/{self.session_ids[uncopied]}", None)
+
+        deleted = rebalance(self.new_db, self.new_db, cleanup=True)
+        self.assertEqual(deleted, len(self.moving) - 1)
+        self.assertIsNotNone(self.server_for(uncopied).get(f"session_summaries/{self.session_ids[uncopied]}"))
+        for uid in self.moving[1:]:
+            self.assertIsNone(self.server_for(uid).get(f"session_summaries/{self.session_ids[uid]}"))
+            self.assertEqual(len(functions.get_user_sessions(self.new_db, uid)), 1)
+
+    def test_runs_can_be_repeated(self):
+        rebalance(self.db, self.new_db)
+        self.assertEqual(rebalance(self.db, self.new_db), len(self.moving))
+        rebalance(self.new_db, self.new_db, cleanup=True)
+        self.assertEqual(rebalance(self.new_db, self.new_db, cleanup=True), 0)
+        for uid in UIDS:
+            self.assertEqual(len(functions.get_user_sessions(self.new_db, uid)), 1)
+
+
+class FenceTest(ShardTestCase):
+    def setUp(self):
+        super().setUp()
+        shards._fence["checked_at"] = float("-inf")
+        self.app = Flask(__name__)
+        self.app.add_url_rule("/sessions", "sessions", lambda: jsonify({}), methods=["GET", "POST"])
+        shards.install(self.app, lambda: self.db)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shards._fence["checked_at"] = float("-inf")
+        super().tearDown()
+
+    def test_writes_get_503_while_fenced(self):
+        self.assertEqual(self.client.post("/sessions").status_code, 200)
+        set_fence(self.db, True)
+        shards._fence["checked_at"] = float("-inf")
+        self.assertTrue(writes_fenced(self.db))
+        response = self.client.post("/sessions")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response.headers)
+        self.assertEqual(self.client.get("/sessions").status_code, 200)
+
+        set_fence(self.db, False)
+        shards._fence["checked_at"] = float("-inf")
+        self.assertEqual(self.client.post("/sessions").status_code, 200)
+
+
+class BreakerPerShardTest(unittest.TestCase):
+    def test_a_failing_shard_does_not_open_the_others_breaker(self):
+        healthy = FakeRTDB()
+        down = FakeRTDB()
+        down.close()
+        try:
+            db = ShardRouter([
+                healthy.database(DeadlineSession(healthy.url)),
+                down.database(DeadlineSession(down.url)),
+            ])
+            for _ in range(FAILURE_THRESHOLD):
+                with self.assertRaises(UpstreamUnavailable):
+                    db.shards[1].child("friends").get()
+            self.assertEqual(BREAKERS[db.shards[1].requests.breaker].state, "open")
+            self.assertEqual(BREAKERS[db.shards[0].requests.breaker].state, "closed")
+            db.shards[0].child("friends").get()
+        finally:
+            healthy.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Player search against a local fake RTDB server (tests/fake_rtdb.py).
+
+    cd backend && python -m pytest tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_rtdb import FakeRTDB
+from user_search import MAX_RESULTS, index_updates, search_users
+
+
+class SearchUsersTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeRTDB()
+        self.db = self.server.database()
+
+    def tearDown(self):
+        self.server.close()
+
+    def add_user(self, uid, name, email, final_score=None):
+        self.db.update(index_updates(uid, name, email, final_score))
+
+    def test_exact_match_survives_many_longer_tokens(self):
+        self.add_user("sam", "Sam", "sam@example.com")
+        for i in range(MAX_RESULTS * 4 + 20):
+            self.add_user(f"samantha{i}", f"Samantha{i}", f"samantha{i}@example.com", final_score=i)
+
+        results = search_users(self.db, "sam", set(), "viewer")
+        self.assertEqual(results[0]["uid"], "sam")
+        self.assertEqual(len(results), MAX_RESULTS)
+
+    def test_ranks_exact_then_by_score(self):
+        self.add_user("a", "Alex Stone", "alex@example.com", final_score=5.0)
+        self.add_user("b", "Alexandra Stone", "ally@example.com", final_score=1.0)
+        self.add_user("c", "Al", "al@example.com")
+
+        results = search_users(self.db, "al", {"b"}, "viewer")
+        self.assertEqual([r["uid"] for r in results], ["c", "b", "a"])
+        self.assertTrue(results[1]["is_friend"])
+
+    def test_skips_the_viewer_and_stale_names(self):
+        self.add_user("a", "Sam Old", "a@example.com")
+        self.db.update(index_updates("a", "Sam New", "a@example.com", old_name="Sam Old", old_email="a@example.com"))
+
+        self.assertEqual([r["name"] for r in search_users(self.db, "sam", set(), "viewer")], ["Sam New"])
+        self.assertEqual(search_users(self.db, "old", set(), "viewer"), [])
+        self.assertEqual(search_users(self.db, "sam", set(), "a"), [])
+
+    def test_short_queries_are_rejected(self):
+        with self.assertRaises(ValueError):
+            search_users(self.db, "s!", set(), "viewer")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Prefix index for player search.
+
+Each user gets a few entries under /user_search keyed "<token>~<uid>", where
+the tokens are the words of their name, the whole name run together and the
+local part of their email, all lowercased to [a-z0-9]. A search is a single
+key-range query for the exact token plus one for the prefix, so its cost
+depends on the number of matches (capped) rather than the number of users.
+
+Backfill existing users:  python user_search.py --reindex
+"""
+from pyrebase.pyrebase import Database
+from typing import Dict, Any, List
+from shards import primary
+
+import argparse
+import re
+import unicodedata
+
+MIN_QUERY_LENGTH = 2
+MAX_RESULTS = 20
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+def search_tokens(name: str | None, email: str | None) -> List[str]:
+    words = [_normalize(word) for word in (name or "").split()]
+    tokens = set(word for word in words if word)
+    if len(words) > 1:
+        tokens.add("".join(words))
+    local_part = _normalize((email or "").split("@")[0])
+    if local_part:
+        tokens.add(local_part)
+    return sorted(tokens)
+
+
+def index_updates(uid: str, name: str | None, email: str | None, final_score=None, old_name=None, old_email=None) -> Dict[str, Any]:
+    """Multi-path update that (re)writes a user's search entries, removing ones a rename made stale."""
+    entry = {"uid": uid, "name": name, "final_score": final_score}
+    updates = {}
+    for token in search_tokens(old_name, old_email):
+        updates[f"user_search/{token}~{uid}"] = None
+    for token in search_tokens(name, email):
+        updates[f"user_search/{token}~{uid}"] = entry
+    return updates
+
+
+def search_users(db: Database, query: str, friends: set, viewer_uid: str, limit: int = MAX_RESULTS) -> List[Dict[str, Any]]:
+    """
+    Users whose name words, full name or email prefix start with query.
+    Exact token matches rank first, then better (lower) final scores.
+    """
+    prefix = _normalize(query)
+    if len(prefix) < MIN_QUERY_LENGTH:
+        raise ValueError(f"Search needs at least {MIN_QUERY_LENGTH} letters or digits")
+    limit = max(1, min(limit, MAX_RESULTS))
+
+    # "~" sorts after [a-z0-9], so the prefix range lists a token's exact entries after
+    # every longer token; they're read first, on their own, so the limit can't cut them off
+    exact_entries = _key_range(db, f"{prefix}~", limit)
+    prefix_entries = _key_range(db, prefix, limit * 4)  # a user can match through several tokens
+
+    matches = {}
+    for s in exact_entries + prefix_entries:
+        token = s.key().rsplit("~", 1)[0]
+        entry = s.val() or {}
+        uid = entry.get("uid")
+        if not uid or uid == viewer_uid:
+            continue
+        exact = token == prefix
+        if uid not in matches or (exact and not matches[uid]["exact"]):
+            matches[uid] = {**entry, "exact": exact}
+
+    def rank(match):
+        score = match.get("final_score")
+        return (not match["exact"], score is None, score if score is not None else 0, (match.get("name") or "").lower())
+
+    results = []
+    for match in sorted(matches.values(), key=rank)[:limit]:
+        results.append({
+            "uid": match["uid"],
+            "name": match.get("name"),
+            "final_score": match.get("final_score"),
+            "is_friend": match["uid"] in friends,
+        })
+    return results
+
+
+def _key_range(db: Database, start: str, limit: int) -> list:
+    snap = (
+        primary(db).child("user_search")
+        .order_by_key()
+        .start_at(start)
+        .end_at(start + "\uf8ff")
+        .limit_to_first(limit)
+        .get()
+    )
+    return snap.each() or []
+
+
+def reindex_users(db: Database) -> int:
+    users = primary(db).child("users").get().val() or {}
+    count = 0
+    for uid, data in users.items():
+        if not isinstance(data, dict):
+            continue
+        primary(db).update(index_updates(uid, data.get("name"), data.get("email"), data.get("final_score")))
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the /user_search index.")
+    parser.add_argument("--reindex", action="store_true", help="Rebuild index entries for every user")
+    args = parser.parse_args()
+
+    if args.reindex:
+        from app import get_db
+        print(f"[USER_SEARCH] Indexed {reindex_users(get_db())} users")
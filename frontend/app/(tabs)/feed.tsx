@@ -16,7 +16,7 @@ import {
 import { LinearGradient } from 'expo-linear-gradient';
 import { Ionicons } from '@expo/vector-icons';
 import { router } from 'expo-router';
-import { getFeedSessions, GolfSession, toggleLike, addComment, SessionComment, deleteSession } from '@/services/api';
+import { getFeedSessions, GolfSession, toggleLike, addComment, deleteSession } from '@/services/api';
 import { GolfColors, Shadows, Spacing, BorderRadius, Colors, Gradients } from '@/constants/theme';
 import { FeedSkeletonLoader } from '@/components/SkeletonLoader';
 import { SpringConfigs, CustomEasing, createButtonPressAnimation } from '@/utils/animations';
@@ -39,7 +39,7 @@ export default function Feed() {
   };
   const [sessions, setSessions] = useState<GolfSession[]>([]);
   const [likeState, setLikeState] = useState<Record<string, { liked: boolean; count: number }>>({});
-  const [commentState, setCommentState] = useState<Record<string, SessionComment[]>>({});
+  const [commentCounts, setCommentCounts] = useState<Record<string, number>>({});
   const [isLoading, setIsLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
   const [currentUid, setCurrentUid] = useState<string>('');
@@ -115,18 +115,16 @@ export default function Feed() {
       console.log('[Feed] Loaded sessions:', result.data.sessions.length);
       setSessions(result.data.sessions);
       const initialLikes: Record<string, { liked: boolean; count: number }> = {};
-      const initialComments: Record<string, SessionComment[]> = {};
+      const initialComments: Record<string, number> = {};
       result.data.sessions.forEach((session) => {
-        const likes = (session as any).likes || {};
-        const comments = (session as any).comments || {};
         initialLikes[session.id || ''] = {
           liked: false,
-          count: Object.keys(likes).length,
+          count: session.like_count ?? Object.keys(session.likes || {}).length,
         };
-        initialComments[session.id || ''] = Object.values(comments) as SessionComment[];
+        initialComments[session.id || ''] = session.comment_count ?? Object.keys(session.comments || {}).length;
       });
       setLikeState(initialLikes);
-      setCommentState(initialComments);
+      setCommentCounts(initialComments);
     } else if (result.error) {
       console.error('[Feed] Error loading feed:', result.error);
       Alert.alert('Error', `Failed to load feed: ${result.error}`);
@@ -245,9 +243,9 @@ export default function Feed() {
             if (result.error) {
               Alert.alert('Error', result.error);
             } else if (result.data?.comment) {
-              setCommentState(prev => ({
+              setCommentCounts(prev => ({
                 ...prev,
-                [sessionId]: [...(prev[sessionId] || []), result.data!.comment],
+                [sessionId]: (prev[sessionId] || 0) + 1,
               }));
             }
           },
@@ -325,7 +323,9 @@ export default function Feed() {
     const par = session.holes === 18 ? 72 : 36;
     const toPar = session.totalScore - par;
     const toParText = toPar > 0 ? `+${toPar}` : toPar === 0 ? 'E' : `${toPar}`;
-    const hasPhotos = session.images && session.images.length > 0;
+    const coverImage = session.cover ?? session.images?.[0];
+    const photoCount = session.image_count ?? session.images?.length ?? 0;
+    const hasPhotos = !!coverImage;
 
     const anim = cardAnimations[index] || {
       opacity: new Animated.Value(1),
@@ -390,14 +390,14 @@ export default function Feed() {
         {hasPhotos && (
           <View style={styles.photoContainer}>
             <Image
-              source={{ uri: session.images![0] }}
+              source={{ uri: coverImage }}
               style={styles.sessionPhoto}
               resizeMode="cover"
             />
-            {session.images!.length > 1 && (
+            {photoCount > 1 && (
               <View style={styles.photoCount}>
                 <Ionicons name="images" size={12} color={GolfColors.white} />
-                <Text style={styles.photoCountText}>{session.images!.length}</Text>
+                <Text style={styles.photoCountText}>{photoCount}</Text>
               </View>
             )}
           </View>
@@ -455,7 +455,7 @@ export default function Feed() {
           </TouchableOpacity>
           <TouchableOpacity style={[styles.actionButton, { backgroundColor: dynamicColors.overlayCard }]} onPress={() => handleComment(session.id || '')}>
             <Ionicons name="chatbubble-outline" size={20} color={GolfColors.gray} />
-            <Text style={[styles.actionCount, { color: dynamicColors.textSecondary }]}>{(commentState[session.id || ''] || []).length}</Text>
+            <Text style={[styles.actionCount, { color: dynamicColors.textSecondary }]}>{commentCounts[session.id || ''] ?? 0}</Text>
           </TouchableOpacity>
           <TouchableOpacity style={[styles.actionButton, { backgroundColor: dynamicColors.overlayCard }]} onPress={() => handleShare(session)}>
             <Ionicons name="share-outline" size={22} color={GolfColors.gray} />
@@ -1,19 +1,46 @@
-import React, { useMemo } from 'react';
-import { View, Text, StyleSheet, ScrollView } from 'react-native';
+import React, { useMemo, useState, useEffect } from 'react';
+import { View, Text, StyleSheet, ScrollView, ActivityIndicator, TouchableOpacity } from 'react-native';
 import { LinearGradient } from 'expo-linear-gradient';
 import { Ionicons } from '@expo/vector-icons';
 import { GolfColors, Spacing, BorderRadius, Colors, Gradients } from '@/constants/theme';
 import { useColorScheme } from '@/hooks/use-color-scheme';
+import { getNotifications, markNotificationsRead, NotificationItem } from '@/services/api';
 
-const notifications = [
-  { id: '1', title: 'New Like', description: 'Alex liked your round at Pebble Beach.', time: '2h ago', icon: 'heart' as const },
-  { id: '2', title: 'New Comment', description: 'Jamie commented: “Great round!”', time: '5h ago', icon: 'chatbubble-ellipses' as const },
-  { id: '3', title: 'Friend Request', description: 'Taylor sent you a friend request.', time: '1d ago', icon: 'people' as const },
-];
+const timeAgo = (iso: string) => {
+  const minutes = Math.max(0, Math.floor((Date.now() - new Date(iso).getTime()) / 60000));
+  if (minutes < 60) return `${Math.max(1, minutes)}m ago`;
+  if (minutes < 60 * 24) return `${Math.floor(minutes / 60)}h ago`;
+  return `${Math.floor(minutes / (60 * 24))}d ago`;
+};
 
 export default function Notifications() {
   const colorScheme = useColorScheme();
   const isDarkMode = colorScheme === 'dark';
+  const [notifications, setNotifications] = useState<NotificationItem[]>([]);
+  const [nextBefore, setNextBefore] = useState<string | null>(null);
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState<string | null>(null);
+
+  const fetchNotifications = async (before?: string | null) => {
+    setLoading(true);
+    const response = await getNotifications(before);
+    if (response.error) {
+      setError(response.error);
+    } else if (response.data) {
+      setError(null);
+      const page = response.data.notifications;
+      setNotifications((current) => (before ? [...current, ...page] : page));
+      setNextBefore(response.data.next_before);
+      if (!before && response.data.unread > 0) {
+        markNotificationsRead();
+      }
+    }
+    setLoading(false);
+  };
+
+  useEffect(() => {
+    fetchNotifications();
+  }, []);
 
   const dynamicColors = useMemo(() => ({
     background: isDarkMode ? Colors.dark.background : GolfColors.lightGray,
@@ -32,18 +59,34 @@ export default function Notifications() {
       </LinearGradient>
 
       <ScrollView contentContainerStyle={styles.content} showsVerticalScrollIndicator={false}>
+        {error && (
+          <Text style={[styles.description, { color: dynamicColors.textSecondary }]}>{error}</Text>
+        )}
+        {!loading && !error && notifications.length === 0 && (
+          <Text style={[styles.description, { color: dynamicColors.textSecondary }]}>No notifications yet.</Text>
+        )}
         {notifications.map((item) => (
           <View key={item.id} style={[styles.card, { backgroundColor: dynamicColors.card }]}>
             <View style={[styles.iconCircle, { backgroundColor: isDarkMode ? Gradients.cardDark[0] : 'rgba(45,125,62,0.12)' }]}>
-              <Ionicons name={item.icon} size={18} color={GolfColors.primary} />
+              <Ionicons name={item.icon as keyof typeof Ionicons.glyphMap} size={18} color={GolfColors.primary} />
             </View>
             <View style={styles.textBlock}>
               <Text style={[styles.title, { color: dynamicColors.textPrimary }]}>{item.title}</Text>
               <Text style={[styles.description, { color: dynamicColors.textSecondary }]}>{item.description}</Text>
-              <Text style={[styles.time, { color: dynamicColors.textSecondary }]}>{item.time}</Text>
+              {item.preview && (
+                <Text style={[styles.description, { color: dynamicColors.textSecondary }]}>“{item.preview}”</Text>
+              )}
+              <Text style={[styles.time, { color: dynamicColors.textSecondary }]}>{timeAgo(item.updated)}</Text>
             </View>
+            {!item.read && <View style={styles.unreadDot} />}
           </View>
         ))}
+        {loading && <ActivityIndicator color={GolfColors.primary} />}
+        {!loading && nextBefore && (
+          <TouchableOpacity onPress={() => fetchNotifications(nextBefore)}>
+            <Text style={[styles.loadMore, { color: GolfColors.primary }]}>Load more</Text>
+          </TouchableOpacity>
+        )}
       </ScrollView>
     </View>
   );
@@ -95,4 +138,17 @@ const styles = StyleSheet.create({
   time: {
     fontSize: 12,
   },
+  unreadDot: {
+    width: 8,
+    height: 8,
+    borderRadius: 4,
+    backgroundColor: GolfColors.primary,
+    marginLeft: Spacing.sm,
+  },
+  loadMore: {
+    fontSize: 14,
+    fontWeight: '600',
+    textAlign: 'center',
+    padding: Spacing.sm,
+  },
 });
@@ -14,7 +14,14 @@ import {
 } from 'react-native';
 import { LinearGradient } from 'expo-linear-gradient';
 import { Ionicons } from '@expo/vector-icons';
-import { createSession, GolfSession as ApiGolfSession } from '@/services/api';
+import {
+  createSession,
+  startLiveRound,
+  updateLiveHole,
+  finishLiveRound,
+  discardLiveRound,
+  GolfSession as ApiGolfSession,
+} from '@/services/api';
 import { GolfColors, Shadows, Spacing, BorderRadius } from '@/constants/theme';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import GolfCourseMap from '@/components/GolfCourseMap';
@@ -32,6 +39,24 @@ interface GolfSession {
   startTime: Date;
   endTime?: Date;
   isActive: boolean;
+  liveRoundId?: string;
+}
+
+const FINISH_RETRY_DELAYS_MS = [1000, 2000, 4000];
+
+// Finishing is idempotent on the server, so a lost response or a busy round is retried
+// rather than saved a second time; 404 and other client errors are returned as-is.
+async function finishLiveRoundWithRetry(roundId: string, sessionData: ApiGolfSession) {
+  let result = await finishLiveRound(roundId, sessionData);
+  for (const delay of FINISH_RETRY_DELAYS_MS) {
+    const retryable = result.error && (!result.status || result.status >= 500 || result.status === 409 || result.status === 429);
+    if (!retryable) {
+      break;
+    }
+    await new Promise((resolve) => setTimeout(resolve, delay));
+    result = await finishLiveRound(roundId, sessionData);
+  }
+  return result;
 }
 
 export default function Record() {
@@ -218,6 +243,19 @@ export default function Record() {
     setActiveSession(newSession);
     setTimer(0);
     setSessionPhotos([]);
+
+    // Share the round live with friends and leagues; if this fails the round is still saved at the end
+    startLiveRound({
+      courseName: newSession.courseName,
+      holes: newSession.holes,
+      selectedHoles: newSession.selectedHoles,
+      privacy,
+    }).then(result => {
+      if (result.data) {
+        const liveRoundId = result.data.roundId;
+        setActiveSession(prev => (prev && prev.id === newSession.id ? { ...prev, liveRoundId } : prev));
+      }
+    });
   };
 
   const endSession = async () => {
@@ -260,7 +298,13 @@ export default function Record() {
         images: uploadedPhotoUrls,
       };
 
-      const result = await createSession(sessionData);
+      let result = activeSession.liveRoundId
+        ? await finishLiveRoundWithRetry(activeSession.liveRoundId, sessionData)
+        : await createSession(sessionData);
+      if (result.status === 404) {
+        // The live round is gone (e.g. it expired), so nothing was saved from it; save the round directly
+        result = await createSession(sessionData);
+      }
       setIsSaving(false);
 
       if (result.error) {
@@ -303,6 +347,9 @@ export default function Record() {
           text: 'Cancel Round',
           style: 'destructive',
           onPress: () => {
+            if (activeSession?.liveRoundId) {
+              discardLiveRound(activeSession.liveRoundId);
+            }
             setActiveSession(null);
             setTimer(0);
             setScores({});
@@ -320,6 +367,11 @@ export default function Record() {
       [hole]: score,
     }));
 
+    if (activeSession?.liveRoundId) {
+      const parsed = parseInt(score);
+      updateLiveHole(activeSession.liveRoundId, hole, parsed > 0 ? parsed : null);
+    }
+
     if (score && parseInt(score) > 0) {
       const holes = getHolesToDisplay();
       const currentIndex = holes.indexOf(hole);
@@ -44,12 +44,24 @@ export interface GolfSession {
   privacy: 'public' | 'friends' | 'private';
   images?: string[];
   videos?: string[];
+  originalImages?: string[];
+  thumbnails?: string[];
   timestamp?: string;
+  normalized_score?: number | null;
+  rating_status?: 'pending';
+  // List endpoints return summaries: counts and a cover instead of the full maps and media
+  like_count?: number;
+  comment_count?: number;
+  cover?: string;
+  image_count?: number;
+  likes?: { [uid: string]: boolean };
+  comments?: { [commentId: string]: SessionComment };
 }
 
 export interface ApiResponse<T> {
   data?: T;
   error?: string;
+  status?: number;  // HTTP status of a failed request; unset when no response arrived
 }
 
 export interface UserProfile {
@@ -83,6 +95,15 @@ export interface LeagueDetail {
   members: LeagueMember[];
 }
 
+export interface CourseSummary {
+  id: string;
+  name: string;
+  rating?: number | null;
+  lat?: number | null;
+  lon?: number | null;
+  distance_km?: number;
+}
+
 // Auth functions
 export const signUp = async (email: string, password: string, name: string) => {
   try {
@@ -188,6 +209,15 @@ export const getUserProfile = async (uid: string): Promise<ApiResponse<{ profile
   }
 };
 
+export const getSession = async (sessionId: string): Promise<ApiResponse<{ session: GolfSession }>> => {
+  try {
+    const response = await api.get(`/sessions/${sessionId}`);
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to fetch session' };
+  }
+};
+
 export const deleteSession = async (sessionId: string): Promise<ApiResponse<{ message: string }>> => {
   try {
     const response = await api.delete(`/sessions/${sessionId}`);
@@ -197,6 +227,92 @@ export const deleteSession = async (sessionId: string): Promise<ApiResponse<{ me
   }
 };
 
+// Live round functions
+export interface LiveRound {
+  roundId: string;
+  uid: string;
+  username: string;
+  courseName: string;
+  holes: number;
+  status: 'live' | 'finished' | 'abandoned';
+  total: number;
+  thru: number;
+  to_par: number;
+  sessionId?: string;
+  privacy?: string;
+  scores?: { [hole: string]: number };
+}
+
+export interface LiveBoard {
+  leagueId: string;
+  version: number;
+  standings: LiveRound[];
+}
+
+export const startLiveRound = async (round: { courseName: string; holes: number; selectedHoles?: number[]; privacy?: string }): Promise<ApiResponse<{ roundId: string }>> => {
+  try {
+    const response = await api.post('/rounds', round);
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to start round' };
+  }
+};
+
+export const updateLiveHole = async (roundId: string, hole: number, score: number | null): Promise<ApiResponse<{ total: number; thru: number }>> => {
+  try {
+    const response = await api.patch(`/rounds/${roundId}/holes/${hole}`, { score });
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to save hole' };
+  }
+};
+
+export const finishLiveRound = async (roundId: string, final: Partial<GolfSession>): Promise<ApiResponse<{ sessionId: string }>> => {
+  try {
+    const response = await api.post(`/rounds/${roundId}/finish`, final);
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to finish round', status: error.response?.status };
+  }
+};
+
+export const discardLiveRound = async (roundId: string): Promise<ApiResponse<{ message: string }>> => {
+  try {
+    const response = await api.delete(`/rounds/${roundId}`);
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to discard round' };
+  }
+};
+
+export const getLiveRound = async (roundId: string): Promise<ApiResponse<{ round: LiveRound }>> => {
+  try {
+    const response = await api.get(`/rounds/${roundId}`);
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to fetch round' };
+  }
+};
+
+export const getLiveLeagueBoard = async (league_id: string): Promise<ApiResponse<LiveBoard>> => {
+  try {
+    const response = await api.get(`/leagues/${league_id}/live`);
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to fetch live leaderboard' };
+  }
+};
+
+// URL and headers for an EventSource (e.g. react-native-sse) on a live stream:
+// /rounds/<id>/stream sends "round" events, /leagues/<id>/live/stream sends "board" events
+export const liveStreamConfig = async (path: string): Promise<{ url: string; headers: { [key: string]: string } }> => {
+  const token = await AsyncStorage.getItem('idToken');
+  return {
+    url: `${API_BASE_URL}${path}`,
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+  };
+};
+
 export const toggleLike = async (sessionId: string): Promise<ApiResponse<{ liked: boolean; like_count: number }>> => {
   try {
     const response = await api.post(`/sessions/${sessionId}/like`);
@@ -252,6 +368,141 @@ export const getFeedSessions = async (limit: number = 20): Promise<ApiResponse<{
   }
 };
 
+// Course functions
+export const searchCourses = async (q: string, limit: number = 10): Promise<ApiResponse<{ courses: CourseSummary[] }>> => {
+  try {
+    const response = await api.get('/courses/search', { params: { q, limit } });
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to search courses' };
+  }
+};
+
+export const getNearbyCourses = async (lat: number, lon: number, radius_km: number = 25): Promise<ApiResponse<{ courses: CourseSummary[] }>> => {
+  try {
+    const response = await api.get('/courses/nearby', { params: { lat, lon, radius_km } });
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to fetch nearby courses' };
+  }
+};
+
+// Batch functions
+export interface BatchRequest {
+  method: 'GET' | 'POST' | 'PATCH' | 'PUT' | 'DELETE';
+  path: string;
+  query?: Record<string, any>;
+  body?: any;
+}
+
+export interface BatchResponseItem {
+  status: number;
+  body: any;
+  headers?: Record<string, string>;
+}
+
+// Runs several calls in one round trip, e.g. the feed, friends and leagues on app start
+export const batchRequests = async (requests: BatchRequest[]): Promise<ApiResponse<{ responses: BatchResponseItem[] }>> => {
+  try {
+    const response = await api.post('/batch', { requests });
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Batch request failed' };
+  }
+};
+
+// Sync functions
+export interface SyncChanges<T> {
+  upserts: T[];
+  deletes: string[];
+}
+
+export interface SyncResponse {
+  cursor: string;
+  full_resync: boolean;
+  has_more: boolean;
+  changes: {
+    sessions?: SyncChanges<GolfSession>;
+    friends?: SyncChanges<string>;
+    friend_requests?: SyncChanges<string>;
+    leagues?: SyncChanges<LeagueSummary>;
+  };
+}
+
+export const syncChanges = async (since?: string | null): Promise<ApiResponse<SyncResponse>> => {
+  try {
+    const params = since ? { since } : {};
+    const response = await api.get('/sync', { params });
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to sync' };
+  }
+};
+
+export interface UserSearchResult {
+  uid: string;
+  name: string;
+  final_score: number | null;
+  is_friend: boolean;
+}
+
+export const searchUsers = async (q: string, limit = 20): Promise<ApiResponse<{ users: UserSearchResult[] }>> => {
+  try {
+    const response = await api.get('/users/search', { params: { q, limit } });
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to search users' };
+  }
+};
+
+export const updateName = async (name: string): Promise<ApiResponse<{ message: string; name: string }>> => {
+  try {
+    const response = await api.patch('/me', { name });
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to update name' };
+  }
+};
+
+export interface NotificationItem {
+  id: string;
+  kind: 'like' | 'comment' | 'friend_request' | 'friend_accept' | 'league_join';
+  target: string;
+  title: string;
+  icon: string;
+  description: string;
+  preview: string | null;
+  actors: { uid: string; name: string }[];
+  actor_count: number;
+  updated: string;
+  read: boolean;
+}
+
+export interface NotificationsResponse {
+  notifications: NotificationItem[];
+  unread: number;
+  next_before: string | null;
+}
+
+export const getNotifications = async (before?: string | null, limit = 20): Promise<ApiResponse<NotificationsResponse>> => {
+  try {
+    const params = before ? { before, limit } : { limit };
+    const response = await api.get('/notifications', { params });
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to fetch notifications' };
+  }
+};
+
+export const markNotificationsRead = async (): Promise<ApiResponse<{ message: string }>> => {
+  try {
+    const response = await api.post('/notifications/read');
+    return { data: response.data };
+  } catch (error: any) {
+    return { error: error.response?.data?.error || 'Failed to mark notifications read' };
+  }
+};
+
 // Friend functions
 export const sendFriendRequest = async (receiver_uid: string): Promise<ApiResponse<{ message: string }>> => {
   try {